@@ -46,6 +46,27 @@ AUTH_USER_MODEL = 'misc.LabMember'
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 UPLOADED_PATH = os.path.dirname(BASE_DIR) + "/uploaded/"
+# Memory budget of the parsed STL meshes kept by each process (buffalo.meshes)
+STL_MESH_CACHE_MAX_BYTES = config("STL_MESH_CACHE_MAX_BYTES", default=512 * 1024 * 1024, cast=int)
+
+REDIS_HOST = config('REDIS_HOST', default='localhost')
+REDIS_PORT = config('REDIS_PORT', default='6379')
+
+# The rendered buffalo figures (buffalo.figures) and their data versions are shared by the
+# web and worker processes, so they are kept in Redis unless another shared LOCATION is set
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'buffalo_figures': {
+        'BACKEND': config('BUFFALO_FIGURE_CACHE_BACKEND', default='buffalo.cache.RedisCache'),
+        'LOCATION': config(
+            'BUFFALO_FIGURE_CACHE_LOCATION', default=f'redis://{REDIS_HOST}:{REDIS_PORT}/1'
+        ),
+        'KEY_PREFIX': 'buffalo_figures',
+        'TIMEOUT': 7 * 24 * 3600,
+    },
+}
 
 DATA_UPLOAD_MAX_NUMBER_FIELDS = 10000
 
@@ -210,9 +231,6 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 250,
 }
 
-REDIS_HOST = config('REDIS_HOST', default='localhost')
-REDIS_PORT = config('REDIS_PORT', default='6379')
-
 DRAMATIQ_BROKER = {
     "BROKER": "dramatiq.brokers.redis.RedisBroker",
     "OPTIONS": {
@@ -261,6 +279,10 @@ UPLOADED_IMAGE_WIDTH = 800
 TIME_ZONE = config('TIME_ZONE', default='UTC')
 
 TESTING = config("TESTING", default=False, cast=bool)
+if TESTING:
+    CACHES['buffalo_figures'].update(
+        BACKEND='django.core.cache.backends.locmem.LocMemCache', LOCATION='buffalo_figures'
+    )
 SITE_HEADER = config('SITE_HEADER', default='Alyx')
 SITE_TITLE = config('SITE_TITLE', default='Alyx')
 SITE_URL = config('SITE_URL', default=None)
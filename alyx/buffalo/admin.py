@@ -13,6 +13,7 @@ from django.urls import reverse
 from django.utils.html import format_html
 from django.shortcuts import redirect
 from django.contrib import messages
+from django.db import transaction
 from django.db.models import Case, Count, When
 from reversion.admin import VersionAdmin
 import nested_admin
@@ -50,7 +51,10 @@ from .models import (
     Device,
     BuffaloElectrodeDevice,
     MenstruationLog,
+    ImportLedgerEntry,
     BuffaloAsyncTask,
+    ElectrodeLogSTL,
+    schedule_stl_index,
 )
 from .forms import (
     SubjectWeighingForm,
@@ -66,7 +70,7 @@ from .forms import (
     STLFileForm,
 )
 
-from .tasks import sync_electrodelogs_stl
+from .tasks import build_stl_mesh_lods, sync_electrodelogs_stl
 
 
 class BuffaloSubjectAdmin(BaseAdmin):
@@ -1335,10 +1339,17 @@ class BuffaloSTLFile(BaseAdmin):
     change_form_template = "buffalo/change_form.html"
     fields = ("name", "stl_file", "subject", "sync_electrodelogs")
     form = STLFileForm
+    list_display = ["__str__", "subject", "electrodelogs_index"]
     list_filter = [
         ("subject", RelatedDropdownFilter),
     ]
 
+    def electrodelogs_index(self, obj):
+        status = obj.index_status()
+        if status["pending"]:
+            return f"{status['pending']} electrode logs pending"
+        return f"Up to date ({status['last_indexed']})"
+
     def response_add(self, request, obj):
         messages.success(request, "File uploaded successful.")
         return redirect("/buffalo/buffalosubject")
@@ -1360,6 +1371,15 @@ class BuffaloSTLFile(BaseAdmin):
 
     def save_model(self, request, obj, form, change):
         ret = super(BuffaloSTLFile, self).save_model(request, obj, form, change)
+        if change and "stl_file" in form.changed_data:
+            # The mesh changed, every electrodelog has to be computed again
+            ElectrodeLogSTL.objects.mark_stale(
+                ElectrodeLog.objects.filter(electrode__device__subject=obj.subject),
+                STLFile.objects.filter(pk=obj.pk),
+            )
+            schedule_stl_index()
+        if not change or "stl_file" in form.changed_data:
+            transaction.on_commit(lambda: build_stl_mesh_lods.send(str(obj.id)))
         if form.cleaned_data["sync_electrodelogs"]:
             sync_electrodelogs_stl.send(str(obj.id))
         return ret
@@ -1367,11 +1387,16 @@ class BuffaloSTLFile(BaseAdmin):
 
 class BuffaloAsyncTaskAdmin(BaseAdmin):
     change_form_template = "buffalo/change_form.html"
-    fields = ("description", "status", "message")
+    fields = (
+        "description", "status", "message", "rows_parsed", "rows_written", "errors", "diff"
+    )
     list_display = [
         "description",
         "status",
         "message",
+        "rows_parsed",
+        "rows_written",
+        "errors",
         "created",
     ]
 
@@ -1385,6 +1410,14 @@ class BuffaloAsyncTaskAdmin(BaseAdmin):
             self.fields = tuple(fields)
 
 
+class ImportLedgerEntryAdmin(BaseAdmin):
+    change_form_template = "buffalo/change_form.html"
+    fields = ("loader", "subject", "device", "key", "content_hash")
+    list_display = ["loader", "subject", "device", "key", "updated"]
+    list_filter = ["loader", "subject"]
+    ordering = ("-updated",)
+
+
 class BuffaloStartingPoint(admin.ModelAdmin):
     change_form_template = "buffalo/change_form.html"
 
@@ -1523,3 +1556,4 @@ admin.site.register(FoodType, FoodTypeAdmin)
 admin.site.register(BuffaloDataset, BuffaloDatasetAdmin)
 admin.site.register(NeuralPhenomena, NeuralPhenomenaAdmin)
 admin.site.register(BuffaloAsyncTask, BuffaloAsyncTaskAdmin)
+admin.site.register(ImportLedgerEntry, ImportLedgerEntryAdmin)
@@ -0,0 +1,99 @@
+import json
+
+import redis
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+
+class RedisCache(BaseCache):
+    """
+    Cache in a Redis database, shared by the web and the worker processes of every host.
+    Django only ships a Redis backend from 4.0, this one covers the cache API the buffalo
+    figures use. Values are stored as JSON, never unpickled.
+    """
+
+    def __init__(self, server, params):
+        super().__init__(params)
+        self._client = redis.Redis.from_url(server)
+
+    def _key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _expiry(self, timeout):
+        """Seconds to live, None for no expiry, 0 when the value must not be kept"""
+        if timeout == DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return None
+        return max(int(timeout), 0)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        expiry = self._expiry(timeout)
+        if expiry == 0:
+            return False
+        return bool(
+            self._client.set(self._key(key, version), json.dumps(value), ex=expiry, nx=True)
+        )
+
+    def get(self, key, default=None, version=None):
+        value = self._client.get(self._key(key, version))
+        return default if value is None else json.loads(value)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        expiry = self._expiry(timeout)
+        if expiry == 0:
+            self.delete(key, version=version)
+        else:
+            self._client.set(self._key(key, version), json.dumps(value), ex=expiry)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        expiry = self._expiry(timeout)
+        if expiry is None:
+            return bool(self._client.persist(key) or self._client.exists(key))
+        return bool(self._client.expire(key, expiry))
+
+    def delete(self, key, version=None):
+        return bool(self._client.delete(self._key(key, version)))
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        if not keys:
+            return {}
+        values = self._client.mget(list(keys))
+        return {
+            keys[key]: json.loads(value)
+            for key, value in zip(keys, values)
+            if value is not None
+        }
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expiry = self._expiry(timeout)
+        if expiry == 0:
+            self.delete_many(data, version=version)
+            return []
+        with self._client.pipeline() as pipeline:
+            for key, value in data.items():
+                pipeline.set(self._key(key, version), json.dumps(value), ex=expiry)
+            pipeline.execute()
+        return []
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        if keys:
+            self._client.delete(*keys)
+
+    def has_key(self, key, version=None):
+        return bool(self._client.exists(self._key(key, version)))
+
+    def clear(self):
+        """Deletes the keys of this cache only, the database may be shared"""
+        keys = []
+        for key in self._client.scan_iter(match=f"{self.key_prefix}:*", count=1000):
+            keys.append(key)
+            if len(keys) == 1000:
+                self._client.delete(*keys)
+                keys = []
+        if keys:
+            self._client.delete(*keys)
@@ -137,3 +137,6 @@ VALID_VALUES = (
 )
 
 NOT_SAVE_TASKS = ["mid-day break", "done, home"]
+
+# Points per electrode drawn by the electrode logs plot, longer turn histories are downsampled
+TURN_SERIES_PLOT_MAX_POINTS = 1000
@@ -0,0 +1,94 @@
+import hashlib
+import threading
+import uuid
+from contextlib import contextmanager
+from urllib.parse import urlencode
+
+from django.core.cache import caches
+from django.db import transaction
+
+FIGURE_CACHE = "buffalo_figures"
+# Version of the data shared by the subjects, like the tasks categories
+ALL_SUBJECTS = "all"
+
+_deferred = threading.local()
+
+
+def figure_cache():
+    return caches[FIGURE_CACHE]
+
+
+def _version_key(subject_id):
+    return f"buffalo-data-version:{subject_id or ALL_SUBJECTS}"
+
+
+def data_version(subject_id):
+    """
+    Version of the data the figures of a subject are drawn from. Versions are random
+    tokens, not counters, so a version evicted from the cache never matches old figures.
+    """
+    cache = figure_cache()
+    keys = [_version_key(ALL_SUBJECTS), _version_key(subject_id)]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            token = uuid.uuid4().hex
+            cache.add(key, token, timeout=None)
+            versions[key] = cache.get(key, token)
+    return "-".join(versions[key] for key in keys)
+
+
+def _bump_data_versions(keys):
+    token = uuid.uuid4().hex
+    figure_cache().set_many({key: token for key in keys}, timeout=None)
+
+
+def bump_data_version(*subject_ids):
+    """
+    Invalidates the cached figures of the subjects, of all of them for a None subject.
+    Bumped again after the commit, a figure drawn meanwhile from the old data is not kept.
+    """
+    deferred = getattr(_deferred, "subject_ids", None)
+    if deferred is not None:
+        deferred.update(subject_ids)
+        return
+    keys = {_version_key(subject_id) for subject_id in subject_ids}
+    if not keys:
+        return
+    _bump_data_versions(keys)
+    transaction.on_commit(lambda: _bump_data_versions(keys))
+
+
+@contextmanager
+def deferred_data_versions():
+    """
+    The versions bumped inside the block, by the signals of every saved row, are bumped
+    once when it exits. Loaders bump their subject too since bulk_create sends no signals.
+    """
+    if getattr(_deferred, "subject_ids", None) is not None:
+        yield
+        return
+    _deferred.subject_ids = set()
+    try:
+        yield
+    finally:
+        subject_ids = _deferred.subject_ids
+        _deferred.subject_ids = None
+        bump_data_version(*subject_ids)
+
+
+def cached_figure_json(name, subject_id, params, build):
+    """
+    The figure JSON of a plot view for the given params (a QueryDict), build() renders
+    it on a miss. The key carries the subject data version so changed data is redrawn.
+    """
+    params_hash = hashlib.sha256(
+        urlencode(sorted(params.lists()), doseq=True).encode()
+    ).hexdigest()
+    key = f"buffalo-figure:{name}:{subject_id}:{data_version(subject_id)}:{params_hash}"
+    cache = figure_cache()
+    content = cache.get(key)
+    if content is None:
+        content = build()
+        cache.set(key, content)
+    return content
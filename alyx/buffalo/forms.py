@@ -8,11 +8,11 @@ from django.core.exceptions import ValidationError
 from django.conf import settings
 
 
-from .utils import (
-    validate_mat_file,
-    validate_electrodelog_file,
-    validate_channel_recording_file,
-    validate_sessions_file,
+from .parsers import (
+    parse_electrodes_mat_file,
+    parse_electrodelog_file,
+    parse_channel_recording_file,
+    parse_sessions_file,
 )
 
 
@@ -290,11 +290,10 @@ class ElectrodeBulkLoadForm(forms.Form):
         file = cleaned_data.get("file")
         device_id = cleaned_data.get("device")
         structure = cleaned_data.get("structure_name")
-        if structure:
-            validate_mat_file(file, structure)
-        else:
+        if not structure:
             device = Device.objects.get(pk=device_id)
-            validate_mat_file(file, device.subject.nickname)
+            structure = device.subject.nickname
+        cleaned_data["parsed"] = parse_electrodes_mat_file(file, structure)
 
 
 class ElectrodeLogBulkLoadForm(forms.Form):
@@ -305,7 +304,7 @@ class ElectrodeLogBulkLoadForm(forms.Form):
     def clean(self):
         cleaned_data = super().clean()
         file = cleaned_data.get("file")
-        validate_electrodelog_file(file)
+        cleaned_data["parsed"] = parse_electrodelog_file(file)
         DramatiqTask.tasks.delete_old_tasks(1800)
         tasks = DramatiqTask.tasks.filter(status=DramatiqTask.STATUS_RUNNING)
         if tasks:
@@ -327,12 +326,23 @@ class ChannelRecordingBulkLoadForm(forms.Form):
     sufix = forms.CharField(
         label="Sufix (Ex. a)", required=False, max_length=250
     )
+    dry_run = forms.BooleanField(
+        required=False,
+        help_text="List the changes the file would make, as a CSV diff, without loading it",
+        label="Dry run",
+    )
+    reimport = forms.BooleanField(
+        required=False,
+        help_text="Also load the date columns unchanged since the last upload of the file",
+        label="Reload unchanged columns",
+    )
     subject = forms.CharField(widget=forms.HiddenInput())
 
     def clean(self):
         cleaned_data = super().clean()
         file = cleaned_data.get("file")
-        validate_channel_recording_file(file)
+        cleaned_data["sufix"] = (cleaned_data.get("sufix") or "").strip() or None
+        cleaned_data["parsed"] = parse_channel_recording_file(file, cleaned_data["sufix"])
         DramatiqTask.tasks.delete_old_tasks(1800)
         tasks = DramatiqTask.tasks.filter(status=DramatiqTask.STATUS_RUNNING)
         if tasks:
@@ -354,6 +364,11 @@ class PlotFilterForm(forms.Form):
     stl = forms.ModelChoiceField(queryset=StartingPointSet.objects.none())
     device = forms.ModelChoiceField(queryset=Device.objects.none())
     date = forms.DateField(initial=today, input_formats=settings.DATE_INPUT_FORMATS)
+    mesh_detail = forms.ChoiceField(
+        choices=[("low", "Low"), ("medium", "Medium"), ("full", "Full")],
+        initial="medium",
+        required=False,
+    )
     download_points = forms.BooleanField(required=False)
 
     def __init__(self, *args, **kwargs):
@@ -389,6 +404,16 @@ class SessionQueriesForm(forms.Form):
 
 class SessionsLoadForm(forms.Form):
     file = forms.FileField(validators=[FileExtensionValidator(["xlsx"])])
+    dry_run = forms.BooleanField(
+        required=False,
+        help_text="List the changes the file would make, as a CSV diff, without loading it",
+        label="Dry run",
+    )
+    reimport = forms.BooleanField(
+        required=False,
+        help_text="Also load the days unchanged since the last upload of the file",
+        label="Reload unchanged days",
+    )
     subject = forms.CharField(widget=forms.HiddenInput())
 
     def clean(self):
@@ -400,7 +425,7 @@ class SessionsLoadForm(forms.Form):
             raise forms.ValidationError(
                 "The file name is different than the subject's nickname"
             )
-        validate_sessions_file(file, subject)
+        cleaned_data["parsed"] = parse_sessions_file(file, subject)
         DramatiqTask.tasks.delete_old_tasks(1800)
         tasks = DramatiqTask.tasks.filter(status=DramatiqTask.STATUS_RUNNING)
         if tasks:
@@ -450,6 +475,11 @@ class STLFileForm(forms.ModelForm):
 
 class TasksLoadForm(forms.Form):
     file = forms.FileField(validators=[FileExtensionValidator(["csv"])])
+    dry_run = forms.BooleanField(
+        required=False,
+        help_text="List the changes the file would make, as a CSV diff, without loading it",
+        label="Dry run",
+    )
     subject = forms.CharField(widget=forms.HiddenInput())
 
     def clean(self):
@@ -483,6 +513,9 @@ class ElectrodelogsPlotFilterForm(forms.Form):
     start_date = forms.DateField(initial=today, input_formats=settings.DATE_INPUT_FORMATS)
     finish_date = forms.DateField(initial=today, input_formats=settings.DATE_INPUT_FORMATS)
     device = forms.ModelChoiceField(queryset=Device.objects.none())
+    max_points = forms.IntegerField(
+        required=False, min_value=2, help_text="Maximum number of points per electrode"
+    )
 
     def __init__(self, *args, **kwargs):
         subject_id = kwargs.pop("subject_id")
@@ -493,13 +526,28 @@ class ElectrodelogsPlotFilterForm(forms.Form):
 class TaskPlotFilterForm(forms.Form):
     cur_year = datetime.today().year
 
-    start_date = forms.CharField()
-    finish_date = forms.CharField()
-    task = forms.ModelChoiceField(queryset=Task.objects.none())
+    # Years, the calendar runs up to the end of the finish year
+    start_date = forms.IntegerField(initial=cur_year, min_value=1, max_value=9998)
+    finish_date = forms.IntegerField(initial=cur_year, min_value=1, max_value=9998)
+    tasks = forms.ModelMultipleChoiceField(queryset=Task.objects.none(), required=False)
+    categories = forms.ModelMultipleChoiceField(
+        queryset=TaskCategory.objects.none(), required=False
+    )
 
     def __init__(self, *args, **kwargs):
         super(TaskPlotFilterForm, self).__init__(*args, **kwargs)
-        self.fields["task"].queryset = Task.objects.all()
+        self.fields["tasks"].queryset = Task.objects.all()
+        self.fields["categories"].queryset = TaskCategory.objects.all()
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get("tasks") and not cleaned_data.get("categories"):
+            raise forms.ValidationError("Select at least one task or category")
+        start_year = cleaned_data.get("start_date")
+        finish_year = cleaned_data.get("finish_date")
+        if start_year and finish_year and start_year > finish_year:
+            raise forms.ValidationError("The start year must not be after the finish year")
+        return cleaned_data
 
 
 class ElectrodeStatusPlotFilterForm(forms.Form):
@@ -0,0 +1,1056 @@
+import csv
+import io
+import json
+from collections import defaultdict
+from datetime import datetime
+from itertools import islice
+from operator import attrgetter
+
+from django.contrib.auth import get_user_model
+from django.db import transaction, IntegrityError
+from django.db.models import Q
+from django.utils import timezone
+
+from actions.models import Session
+from actions.notifications import check_weighing
+from data.models import DatasetType, default_dataset_type, default_data_format
+from .constants import (
+    TASK_CELLS,
+    CATEGORIES_KEY_WORDS,
+    DEAD_VALUES,
+    NUMBER_OF_CELLS_VALUES,
+    ALIVE_VALUES,
+    MAYBE_VALUES,
+    NOT_SAVE_VALUES,
+    NOT_SAVE_TASKS,
+)
+from .figures import bump_data_version, deferred_data_versions
+from .models import (
+    Task,
+    SessionTask,
+    FoodLog,
+    TaskCategory,
+    BuffaloSession,
+    Electrode,
+    ElectrodeLog,
+    ElectrodeLogSTL,
+    ChannelRecording,
+    WeighingLog,
+    StartingPoint,
+    StartingPointSet,
+    BuffaloDataset,
+    FoodType,
+    MenstruationLog,
+    Platform,
+    ImportLedgerEntry,
+    content_hash,
+    schedule_stl_index,
+)
+from .utils import (
+    get_user_from_initial,
+    get_sessions_file_columns,
+)
+
+BULK_BATCH_SIZE = 1000
+# bulk_update builds one CASE WHEN per field and row, smaller batches keep it linear
+BULK_UPDATE_BATCH_SIZE = 100
+
+
+def update_by_values(queryset, objects, fields):
+    """
+    Writes the given fields of the objects with one UPDATE per distinct set of
+    values, much faster than bulk_update when the values are coded (few distinct).
+    """
+    groups = defaultdict(list)
+    for obj in objects:
+        groups[tuple(getattr(obj, field) for field in fields)].append(obj.pk)
+    for values, pks in groups.items():
+        for start in range(0, len(pks), BULK_BATCH_SIZE):
+            queryset.filter(pk__in=pks[start:start + BULK_BATCH_SIZE]).update(
+                **dict(zip(fields, values))
+            )
+
+
+def m2m_through_columns(model, field_name):
+    """Through model of a many to many field and its two foreign key columns"""
+    field = model._meta.get_field(field_name)
+    return (
+        field.remote_field.through,
+        f"{field.m2m_field_name()}_id",
+        f"{field.m2m_reverse_field_name()}_id",
+    )
+
+
+class ImportChangeset:
+    """
+    Changes an importer would make, listed by the dry runs without writing anything:
+    the rows to insert, the rows to update and the conflicts, rows that can't be loaded.
+    """
+
+    INSERT = "insert"
+    UPDATE = "update"
+    CONFLICT = "conflict"
+    columns = ["action", "model", "key", "changes"]
+
+    def __init__(self):
+        self.rows = []
+
+    def insert(self, model, key, **values):
+        changes = "; ".join(f"{field}: {value}" for field, value in values.items())
+        self.rows.append((self.INSERT, model.__name__, key, changes))
+
+    def update(self, model, key, changes):
+        """changes is a dict field -> (old value, new value), unchanged fields are skipped"""
+        changes = "; ".join(
+            f"{field}: {old} -> {new}" for field, (old, new) in changes.items() if old != new
+        )
+        if changes:
+            self.rows.append((self.UPDATE, model.__name__, key, changes))
+
+    def conflict(self, model, key, reason):
+        self.rows.append((self.CONFLICT, model.__name__, key, reason))
+
+    def summary(self):
+        """Number of rows by action and model"""
+        summary = {
+            action: defaultdict(int) for action in (self.INSERT, self.UPDATE, self.CONFLICT)
+        }
+        for action, model, _, _ in self.rows:
+            summary[action][model] += 1
+        return {action: dict(models) for action, models in summary.items()}
+
+    def message(self):
+        counts = {action: sum(models.values()) for action, models in self.summary().items()}
+        return "Dry run: {} to insert, {} to update, {} conflicts".format(
+            counts[self.INSERT], counts[self.UPDATE], counts[self.CONFLICT]
+        )
+
+    def csv(self):
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(self.columns)
+        writer.writerows(self.rows)
+        return output.getvalue()
+
+
+def channel_recording_fields(record_data):
+    """
+    Values of the ChannelRecording fields coded by a sheet cell,
+    None when the cell says the recording should not be saved.
+    """
+    fields = {"number_of_cells": "", "alive": "", "ripples": ""}
+    value = record_data.get("value")
+    if value in NOT_SAVE_VALUES:
+        return None
+    if value in NUMBER_OF_CELLS_VALUES:
+        fields["number_of_cells"] = value
+        fields["alive"] = "yes"
+    elif value in ALIVE_VALUES:
+        fields["number_of_cells"] = "0"
+        fields["alive"] = "yes"
+    elif value in MAYBE_VALUES:
+        fields["alive"] = "maybe"
+    elif value in DEAD_VALUES:
+        fields["alive"] = "no"
+    if "ripples" in record_data:
+        fields["ripples"] = "yes" if record_data["ripples"] is True else ""
+    return fields
+
+
+class ChannelRecordingsImporter:
+    """
+    Loads the sessions parsed by parse_channel_recording_file for a device.
+
+    stage() resolves the sessions and electrodes with one query each and builds
+    every ChannelRecording in memory, save() writes them in bulk. Recordings that
+    already exist for an (electrode, session) pair are updated with the sheet values.
+    changeset() lists what save() would write, for the dry runs.
+
+    Unless reimport, only the date columns whose content changed since the last upload
+    of the device are loaded, save() records their hashes in the import ledger.
+    """
+
+    update_fields = ["number_of_cells", "alive", "ripples", "updated"]
+
+    def __init__(self, subject, device, channel_recording_info, reimport=False):
+        self.subject = subject
+        self.device = device
+        self.hashes = {
+            date: content_hash(session_data)
+            for date, session_data in channel_recording_info.items()
+        }
+        if not reimport:
+            changed = ImportLedgerEntry.objects.changed_keys(
+                ImportLedgerEntry.CHANNEL_RECORDINGS, subject, self.hashes, device
+            )
+            channel_recording_info = {
+                date: session_data
+                for date, session_data in channel_recording_info.items()
+                if date in changed
+            }
+        self.channel_recording_info = channel_recording_info
+        self.new_sessions = []
+        self.updated_sessions = []
+        self.new_electrodes = []
+        self.new_recordings = []
+        self.updated_recordings = []
+        self.changes = {}
+
+    def session_name(self, session_date):
+        name_date = f"{session_date.date()}T{datetime.min.time()}"
+        return f"{name_date}_{self.subject.nicknamesafe()}"
+
+    def stage(self):
+        sessions_data = {
+            self.session_name(session_data["date"]): session_data
+            for session_data in self.channel_recording_info.values()
+        }
+        sessions = {
+            session.name: session
+            for session in BuffaloSession.objects.filter(
+                subject=self.subject, name__in=sessions_data.keys()
+            )
+        }
+        self.electrodes = electrodes = {
+            electrode.channel_number: electrode
+            for electrode in Electrode.objects.filter(
+                device__subject=self.subject, device=self.device
+            )
+        }
+        self.session_start_times = set(
+            BuffaloSession.objects.filter(subject=self.subject).values_list(
+                "start_time", flat=True
+            )
+        )
+        recordings = {
+            (recording.electrode_id, recording.session_id): recording
+            for recording in ChannelRecording.objects.filter(
+                electrode__device=self.device, session__in=sessions.values()
+            )
+        }
+        now = timezone.now()
+
+        for session_name, session_data in sessions_data.items():
+            session = sessions.get(session_name)
+            if session is None:
+                session = BuffaloSession(
+                    subject=self.subject,
+                    name=session_name,
+                    start_time=session_data["date"],
+                )
+                self.new_sessions.append(session)
+            else:
+                self.updated_sessions.append(session)
+
+            sharp_waves = []
+            spikes = []
+            for channel_number, record_data in session_data["records"].items():
+                if record_data.get("sharp_waves") is True:
+                    sharp_waves.append(channel_number)
+                if record_data.get("spikes") is True:
+                    spikes.append(channel_number)
+                fields = channel_recording_fields(record_data)
+                if fields is None:
+                    continue
+                electrode = electrodes.get(channel_number)
+                if electrode is None:
+                    electrode = Electrode(
+                        subject=self.subject,
+                        device=self.device,
+                        channel_number=channel_number,
+                    )
+                    electrodes[channel_number] = electrode
+                    self.new_electrodes.append(electrode)
+                recording = recordings.get((electrode.id, session.id))
+                if recording is None:
+                    self.new_recordings.append(
+                        ChannelRecording(electrode=electrode, session=session, **fields)
+                    )
+                elif any(getattr(recording, field) != value for field, value in fields.items()):
+                    self.changes[recording.pk] = {
+                        field: (getattr(recording, field), value)
+                        for field, value in fields.items()
+                    }
+                    for field, value in fields.items():
+                        setattr(recording, field, value)
+                    recording.updated = now
+                    self.updated_recordings.append(recording)
+
+            result_json = {"sharp_waves": sharp_waves, "spikes": spikes}
+            if session.json is not None:
+                try:
+                    session_json = json.loads(session.json)
+                    session_json.update(result_json)
+                    result_json = session_json
+                except (TypeError, ValueError, AttributeError):
+                    print("Error reading existing session json")
+            result_json = json.dumps(result_json, indent=4)
+            needs_review = "good behavior" not in session_data
+            self.changes[session.id] = {
+                "json": (session.json, result_json),
+                "needs_review": (session.needs_review, needs_review),
+            }
+            session.json = result_json
+            session.needs_review = needs_review
+        return self
+
+    def changeset(self):
+        changeset = ImportChangeset()
+        for session in self.new_sessions:
+            if session.start_time in self.session_start_times:
+                changeset.conflict(
+                    BuffaloSession, session.name, f"A session starts at {session.start_time}"
+                )
+            else:
+                changeset.insert(
+                    BuffaloSession, session.name, needs_review=session.needs_review
+                )
+        for session in self.updated_sessions:
+            changeset.update(BuffaloSession, session.name, self.changes[session.id])
+        for electrode in self.new_electrodes:
+            changeset.insert(Electrode, electrode.channel_number)
+        for recording in self.new_recordings:
+            changeset.insert(
+                ChannelRecording,
+                f"{recording.session.name} - {recording.electrode.channel_number}",
+                number_of_cells=recording.number_of_cells,
+                alive=recording.alive,
+                ripples=recording.ripples,
+            )
+        sessions = {session.id: session for session in self.updated_sessions}
+        electrodes = {electrode.id: electrode for electrode in self.electrodes.values()}
+        for recording in self.updated_recordings:
+            changeset.update(
+                ChannelRecording,
+                f"{sessions[recording.session_id].name} - "
+                f"{electrodes[recording.electrode_id].channel_number}",
+                self.changes[recording.pk],
+            )
+        return changeset
+
+    def save(self):
+        project = self.subject.projects.first()
+        with transaction.atomic(), deferred_data_versions():
+            for session in self.new_sessions:
+                # Same check as BuffaloSession.save, against the start times read in stage()
+                if session.start_time in self.session_start_times:
+                    raise IntegrityError("This Session already exists.")
+                session.project = project
+                session.lab = self.subject.lab
+                session.save(block_table=False)
+            Session.objects.bulk_update(
+                self.updated_sessions, ["json"], batch_size=BULK_UPDATE_BATCH_SIZE
+            )
+            BuffaloSession.objects.bulk_update(
+                self.updated_sessions, ["needs_review"], batch_size=BULK_UPDATE_BATCH_SIZE
+            )
+            Electrode.objects.bulk_create(self.new_electrodes, batch_size=BULK_BATCH_SIZE)
+            ChannelRecording.objects.bulk_create(
+                self.new_recordings, batch_size=BULK_BATCH_SIZE
+            )
+            update_by_values(
+                ChannelRecording.objects.all(), self.updated_recordings, self.update_fields
+            )
+            ImportLedgerEntry.objects.record(
+                ImportLedgerEntry.CHANNEL_RECORDINGS, self.subject, self.hashes, self.device
+            )
+            bump_data_version(self.subject.id)
+
+    def summary(self):
+        return {
+            "sessions_created": len(self.new_sessions),
+            "sessions_updated": len(self.updated_sessions),
+            "electrodes_created": len(self.new_electrodes),
+            "recordings_created": len(self.new_recordings),
+            "recordings_updated": len(self.updated_recordings),
+        }
+
+
+def load_electrodes_mat(device, starting_points):
+    """
+    Creates a new StartingPointSet with the ElectrodeStartingPoints read by
+    parse_electrodes_mat_file, creating the missing electrodes of the device.
+    The device electrodes are read in one query and everything is written in bulk,
+    the logs of the electrodes are then queued for a single STL containment pass.
+    """
+    subject = device.subject
+    electrodes = {}
+    for electrode in Electrode.objects.filter(device=device).order_by("pk"):
+        electrodes.setdefault(electrode.channel_number, electrode)
+
+    starting_point_set = StartingPointSet(
+        name="Bulk load - %s" % (datetime.now()), subject=subject
+    )
+    new_electrodes = []
+    new_starting_points = []
+    for channel, start_point, norms in zip(*starting_points):
+        channel_number = str(channel)
+        electrode = electrodes.get(channel_number)
+        if electrode is None:
+            electrode = Electrode(subject=subject, device=device, channel_number=channel_number)
+            electrodes[channel_number] = electrode
+            new_electrodes.append(electrode)
+        x, y, z = start_point.tolist()
+        x_norm, y_norm, z_norm = norms.tolist()
+        new_starting_points.append(
+            StartingPoint(
+                electrode=electrode,
+                subject=subject,
+                starting_point_set=starting_point_set,
+                x=x,
+                y=y,
+                z=z,
+                x_norm=x_norm,
+                y_norm=y_norm,
+                z_norm=z_norm,
+            )
+        )
+
+    with transaction.atomic():
+        starting_point_set.save()
+        Electrode.objects.bulk_create(new_electrodes, batch_size=BULK_BATCH_SIZE)
+        StartingPoint.objects.bulk_create(new_starting_points, batch_size=BULK_BATCH_SIZE)
+        # bulk_create skips the StartingPoint signals, the electrode logs are queued here
+        ElectrodeLogSTL.objects.mark_stale(
+            ElectrodeLog.objects.filter(
+                electrode__in=[
+                    starting_point.electrode_id for starting_point in new_starting_points
+                ]
+            )
+        )
+        schedule_stl_index()
+        bump_data_version(subject.id)
+    return len(new_starting_points)
+
+
+def load_electrode_logs(subject, device, electrodelogs_info):
+    """
+    Creates the electrode logs read by parse_electrodelog_file in bulk. Their containment in
+    the subject's STL meshes is not computed per log: the new logs are queued as stale
+    ElectrodeLogSTL rows and indexed in the background, one pass per mesh.
+    """
+    electrodes = {}
+    for electrode in Electrode.objects.filter(subject=subject, device=device).order_by(
+        "channel_number"
+    ):
+        electrodes.setdefault(electrode.channel_number, electrode)
+    users = {}
+    new_electrodes = []
+    electrode_logs = []
+    logs_users = []
+    for electrode_info in electrodelogs_info:
+        channel_number = str(electrode_info["electrode"])
+        electrode = electrodes.get(channel_number)
+        if electrode is None:
+            electrode = Electrode(device=device, subject=subject, channel_number=channel_number)
+            electrodes[channel_number] = electrode
+            new_electrodes.append(electrode)
+        for log in electrode_info["logs"]:
+            electrode_log = ElectrodeLog(
+                subject=subject,
+                date_time=log["datetime"],
+                electrode=electrode,
+                turn=log["turns"],
+            )
+            if log["impedance"] is not None:
+                electrode_log.impedance = log["impedance"]
+            if log["notes"] is not None:
+                electrode_log.notes = log["notes"]
+            electrode_logs.append(electrode_log)
+            if log["user"] and log["user"] not in users:
+                users[log["user"]] = list(
+                    get_user_from_initial(log["user"]).values_list("pk", flat=True)
+                )
+            for user_id in users.get(log["user"], []):
+                logs_users.append(
+                    ElectrodeLog.users.through(
+                        electrodelog_id=electrode_log.pk, labmember_id=user_id
+                    )
+                )
+
+    with transaction.atomic():
+        Electrode.objects.bulk_create(new_electrodes, batch_size=BULK_BATCH_SIZE)
+        ElectrodeLog.objects.bulk_create(electrode_logs, batch_size=BULK_BATCH_SIZE)
+        ElectrodeLog.users.through.objects.bulk_create(logs_users, batch_size=BULK_BATCH_SIZE)
+        ElectrodeLogSTL.objects.mark_stale(
+            ElectrodeLog.objects.filter(
+                pk__in=[electrode_log.pk for electrode_log in electrode_logs]
+            )
+        )
+        schedule_stl_index()
+        bump_data_version(subject.id)
+    return len(electrode_logs)
+
+
+class SessionsImporter:
+    """
+    Loads the daily sessions parsed by parse_sessions_file for a subject.
+
+    stage() indexes the subject sessions by date and the tasks and platforms by name,
+    so every row is resolved in memory, save() writes the logs and session tasks in bulk.
+    The session tasks already in a session are merged with the ones of the row and the
+    whole session is renumbered by start time, as the sheet lists them out of order.
+    changeset() lists what save() would write, for the dry runs.
+
+    Unless reimport, only the days whose rows changed since the last upload are loaded,
+    save() records their hashes in the import ledger.
+    """
+
+    session_update_fields = ["pump_setting", "chamber_cleaning", "unknown_user", "updated"]
+    session_changed_fields = ["narrative", "pump_setting", "chamber_cleaning", "unknown_user"]
+
+    def __init__(self, subject, sessions, reimport=False):
+        self.subject = subject
+        days = defaultdict(list)
+        for row in sessions:
+            days[str(row["0_Date (mm/dd/yyyy)"].date())].append(row)
+        self.hashes = {day: content_hash(rows) for day, rows in days.items()}
+        if not reimport:
+            changed = ImportLedgerEntry.objects.changed_keys(
+                ImportLedgerEntry.SESSIONS, subject, self.hashes
+            )
+            sessions = [
+                row for row in sessions if str(row["0_Date (mm/dd/yyyy)"].date()) in changed
+            ]
+        self.sessions = sessions
+        self.new_platforms = []
+        self.new_tasks = []
+        self.updated_tasks = {}
+        self.new_sessions = []
+        self.updated_sessions = {}
+        self.session_users = {}
+        self.weighing_logs = []
+        self.food_logs = []
+        self.menstruation_logs = []
+        self.new_session_tasks = []
+        self.renumbered_session_tasks = {}
+        self.datasets = []
+        self.dataset_defaults = None
+
+    def stage(self):
+        # Sessions are keyed by id, the pk of a BuffaloSession is only set once saved
+        columns = get_sessions_file_columns(self.subject)
+        subject_sessions = list(BuffaloSession.objects.filter(subject=self.subject))
+        sessions_by_date = {}
+        for session in subject_sessions:
+            sessions_by_date.setdefault(session.start_time.date(), session)
+        self.session_start_times = {session.start_time for session in subject_sessions}
+        # Values before the sheet is applied, compared by changeset()
+        self.original_sessions = {
+            session.id: {field: getattr(session, field) for field in self.session_changed_fields}
+            for session in subject_sessions
+        }
+        self.original_sequences = {}
+        self.tasks = tasks = {}
+        for task in Task.objects.all():
+            tasks.setdefault(task.name, task)
+        platforms = {platform.name: platform for platform in Platform.objects.all()}
+        self.food = FoodType.objects.filter(name="chow", unit="ml").first()
+        if self.food is None:
+            self.food = FoodType(name="chow", unit="ml")
+        self.session_tasks = defaultdict(list)
+        for session_task in SessionTask.objects.filter(session__in=subject_sessions):
+            self.session_tasks[session_task.session_id].append(session_task)
+            self.original_sequences[session_task.pk] = session_task.task_sequence
+        menstruation_sessions = set(
+            MenstruationLog.objects.filter(subject=self.subject).values_list(
+                "session_id", flat=True
+            )
+        )
+        users = {}
+        now = timezone.now()
+
+        for row in self.sessions:
+            session_date = row["0_Date (mm/dd/yyyy)"]
+            chamber_cleaning = row["51_Chamber Cleaning"].strip()
+            narrative = row["6_General Comments"]
+            pump_setting = row["4_Pump Setting"] or None
+            chamber_cleaning = chamber_cleaning.lower() if chamber_cleaning else None
+            session = sessions_by_date.get(session_date.date())
+            if session is None:
+                name_date = f"{session_date.date()}T{datetime.min.time()}"
+                session = BuffaloSession(
+                    subject=self.subject,
+                    name=f"{name_date}_{self.subject}",
+                    narrative=narrative,
+                    pump_setting=pump_setting,
+                    chamber_cleaning=chamber_cleaning,
+                    start_time=session_date,
+                )
+                self.new_sessions.append(session)
+            else:
+                session.narrative = narrative
+                session.pump_setting = pump_setting
+                session.chamber_cleaning = chamber_cleaning
+                session.updated = now
+                self.updated_sessions[session.pk] = session
+
+            initials = row["1_Handler Initials"].strip()
+            if initials:
+                if initials not in users:
+                    users[initials] = list(
+                        get_user_from_initial(initials).values_list("pk", flat=True)
+                    )
+                if users[initials]:
+                    self.session_users[session.id] = users[initials]
+                else:
+                    session.unknown_user = row["1_Handler Initials"]
+
+            if row["2_Weight (kg)"]:
+                self.weighing_logs.append(
+                    WeighingLog(
+                        session=session,
+                        subject=self.subject,
+                        weight=row["2_Weight (kg)"],
+                        date_time=session_date,
+                    )
+                )
+            self.food_logs.append(
+                FoodLog(
+                    subject=self.subject,
+                    food=self.food,
+                    amount=row["3_Food (mL)"] or 0,
+                    session=session,
+                    date_time=session_date,
+                )
+            )
+            try:
+                menstruation = row["5_Menstration"].strip() == "yes"
+            except (KeyError, AttributeError):
+                # Only the female sessions sheet has the menstruation column
+                menstruation = False
+            if menstruation and session.id not in menstruation_sessions:
+                menstruation_sessions.add(session.id)
+                self.menstruation_logs.append(
+                    MenstruationLog(subject=self.subject, menstruation=True, session=session)
+                )
+
+            row_tasks = []
+            for task_cell in TASK_CELLS:
+                cell = int(task_cell)
+                task_name = row[f"{cell}_{columns[cell]}"]
+                if not task_name or task_name.lower().strip() in NOT_SAVE_TASKS:
+                    continue
+                task = tasks.get(task_name)
+                if task is None:
+                    task = Task(name=task_name)
+                    tasks[task_name] = task
+                    self.new_tasks.append(task)
+                if task.name.strip().endswith(".sav") and not task.platform_id:
+                    if "cortex" not in platforms:
+                        platforms["cortex"] = Platform(name="cortex")
+                        self.new_platforms.append(platforms["cortex"])
+                    task.platform = platforms["cortex"]
+                    if not task._state.adding:
+                        self.updated_tasks[task.pk] = task
+                session_task = SessionTask(
+                    task=task,
+                    general_comments=row[f"{cell + 2}_{columns[cell + 2]}"],
+                    session=session,
+                    start_time=row[f"{cell + 1}_{columns[cell + 1]}"] or None,
+                )
+                row_tasks.append((session_task, row[f"{cell + 3}_{columns[cell + 3]}"]))
+            if row_tasks:
+                self.merge_session_tasks(session, row_tasks)
+        return self
+
+    def dataset(self, filename, session_task):
+        # The Dataset defaults run a get_or_create each, read them once for the whole sheet
+        if self.dataset_defaults is None:
+            self.dataset_defaults = {
+                "dataset_type_id": default_dataset_type(),
+                "data_format_id": default_data_format(),
+            }
+        return BuffaloDataset(
+            file_name=filename, session_task=session_task, **self.dataset_defaults
+        )
+
+    def merge_session_tasks(self, session, row_tasks):
+        """
+        Adds the tasks of a row to the session: the ones already in the session (same task
+        and start time) only get the row file as a new dataset, then the session is renumbered.
+        """
+        existing = self.session_tasks[session.id]
+        added = []
+        for session_task, filename in row_tasks:
+            matches = [
+                existing_task for existing_task in existing
+                if existing_task.task_id == session_task.task_id and
+                existing_task.start_time == session_task.start_time
+            ]
+            if not matches:
+                added.append(session_task)
+            if filename:
+                for dataset_session_task in matches or [session_task]:
+                    self.datasets.append(self.dataset(filename, dataset_session_task))
+        added_ids = {session_task.pk for session_task in added}
+        session_tasks = added + existing
+        try:
+            session_tasks.sort(key=attrgetter("start_time"))
+        except TypeError:
+            # Tasks without start time keep the sheet order
+            pass
+        for sequence, session_task in enumerate(session_tasks, 1):
+            if session_task.pk in added_ids:
+                self.new_session_tasks.append(session_task)
+            elif session_task.task_sequence != sequence and not session_task._state.adding:
+                self.renumbered_session_tasks[session_task.pk] = session_task
+            session_task.task_sequence = sequence
+        self.session_tasks[session.id] = session_tasks
+
+    def save(self):
+        project = self.subject.projects.first()
+        with transaction.atomic(), deferred_data_versions():
+            Platform.objects.bulk_create(self.new_platforms)
+            Task.objects.bulk_create(self.new_tasks, batch_size=BULK_BATCH_SIZE)
+            update_by_values(Task.objects.all(), self.updated_tasks.values(), ["platform_id"])
+            if self.food._state.adding:
+                self.food.save()
+
+            for session in self.new_sessions:
+                # Same check as BuffaloSession.save, against the start times read in stage()
+                if session.start_time in self.session_start_times:
+                    raise IntegrityError("This Session already exists.")
+                self.session_start_times.add(session.start_time)
+                session.project = project
+                session.lab = self.subject.lab
+                session.save(block_table=False)
+            updated_sessions = list(self.updated_sessions.values())
+            Session.objects.bulk_update(
+                updated_sessions, ["narrative"], batch_size=BULK_UPDATE_BATCH_SIZE
+            )
+            BuffaloSession.objects.bulk_update(
+                updated_sessions, self.session_update_fields, batch_size=BULK_UPDATE_BATCH_SIZE
+            )
+
+            SessionUsers, session_column, user_column = m2m_through_columns(Session, "users")
+            SessionUsers.objects.filter(
+                **{f"{session_column}__in": self.session_users.keys()}
+            ).delete()
+            SessionUsers.objects.bulk_create(
+                [
+                    SessionUsers(**{session_column: session_id, user_column: user_id})
+                    for session_id, user_ids in self.session_users.items()
+                    for user_id in user_ids
+                ],
+                batch_size=BULK_BATCH_SIZE,
+            )
+
+            # WeighingLog inherits from Weighing so it can't be bulk created, save_base
+            # skips the notification check Weighing.save runs on every row, done once below
+            for weighing_log in self.weighing_logs:
+                weighing_log.save_base()
+            if self.weighing_logs:
+                check_weighing(self.subject)
+            FoodLog.objects.bulk_create(self.food_logs, batch_size=BULK_BATCH_SIZE)
+            MenstruationLog.objects.bulk_create(
+                self.menstruation_logs, batch_size=BULK_BATCH_SIZE
+            )
+
+            # Clears the old positions first so the renumbering never clashes
+            # with the (session, task_sequence) unique constraint
+            renumbered = list(self.renumbered_session_tasks.values())
+            SessionTask.objects.filter(pk__in=self.renumbered_session_tasks.keys()).update(
+                task_sequence=None
+            )
+            update_by_values(SessionTask.objects.all(), renumbered, ["task_sequence"])
+            SessionTask.objects.bulk_create(self.new_session_tasks, batch_size=BULK_BATCH_SIZE)
+            # BuffaloDataset inherits from Dataset so it can't be bulk created
+            for dataset in self.datasets:
+                dataset.save()
+            ImportLedgerEntry.objects.record(ImportLedgerEntry.SESSIONS, self.subject, self.hashes)
+            bump_data_version(self.subject.id)
+
+    def changeset(self):
+        changeset = ImportChangeset()
+        sessions = {session.id: session for session in self.updated_sessions.values()}
+        sessions.update((session.id, session) for session in self.new_sessions)
+        tasks = {task.id: task for task in self.tasks.values()}
+
+        def session_task_key(session_task):
+            # The session of a new session task is unsaved, so its session_id is not set
+            session = sessions.get(session_task.session_id) or session_task.session
+            return "{} #{} {}".format(
+                session.name, session_task.task_sequence, tasks[session_task.task_id].name
+            )
+
+        for platform in self.new_platforms:
+            changeset.insert(Platform, platform.name)
+        for task in self.new_tasks:
+            changeset.insert(Task, task.name, platform=task.platform)
+        for task in self.updated_tasks.values():
+            changeset.update(Task, task.name, {"platform": (None, task.platform)})
+        if self.food._state.adding:
+            changeset.insert(FoodType, self.food.name, unit=self.food.unit)
+        for session in self.new_sessions:
+            if session.start_time in self.session_start_times:
+                changeset.conflict(
+                    BuffaloSession, session.name, f"A session starts at {session.start_time}"
+                )
+            else:
+                changeset.insert(
+                    BuffaloSession,
+                    session.name,
+                    **{field: getattr(session, field) for field in self.session_changed_fields},
+                )
+        for session in self.updated_sessions.values():
+            original = self.original_sessions[session.id]
+            changeset.update(
+                BuffaloSession,
+                session.name,
+                {field: (original[field], getattr(session, field)) for field in original},
+            )
+        SessionUsers, session_column, user_column = m2m_through_columns(Session, "users")
+        original_users = defaultdict(list)
+        for session_id, user_id in SessionUsers.objects.filter(
+            **{f"{session_column}__in": self.session_users.keys()}
+        ).values_list(session_column, user_column):
+            original_users[session_id].append(user_id)
+        usernames = dict(
+            get_user_model().objects.filter(
+                pk__in={
+                    user_id
+                    for user_ids in (*self.session_users.values(), *original_users.values())
+                    for user_id in user_ids
+                }
+            ).values_list("pk", "username")
+        )
+        for session_id, user_ids in self.session_users.items():
+            changeset.update(
+                BuffaloSession,
+                sessions[session_id].name,
+                {
+                    "users": (
+                        sorted(usernames[user_id] for user_id in original_users[session_id]),
+                        sorted(usernames[user_id] for user_id in user_ids),
+                    )
+                },
+            )
+        for weighing_log in self.weighing_logs:
+            changeset.insert(WeighingLog, weighing_log.session.name, weight=weighing_log.weight)
+        for food_log in self.food_logs:
+            changeset.insert(FoodLog, food_log.session.name, amount=food_log.amount)
+        for menstruation_log in self.menstruation_logs:
+            changeset.insert(MenstruationLog, menstruation_log.session.name)
+        for session_task in self.renumbered_session_tasks.values():
+            changeset.update(
+                SessionTask,
+                session_task_key(session_task),
+                {
+                    "task_sequence": (
+                        self.original_sequences[session_task.pk], session_task.task_sequence
+                    )
+                },
+            )
+        for session_task in self.new_session_tasks:
+            changeset.insert(
+                SessionTask, session_task_key(session_task), start_time=session_task.start_time
+            )
+        for dataset in self.datasets:
+            changeset.insert(
+                BuffaloDataset, session_task_key(dataset.session_task), file_name=dataset.file_name
+            )
+        return changeset
+
+    def summary(self):
+        return {
+            "sessions_created": len(self.new_sessions),
+            "sessions_updated": len(self.updated_sessions),
+            "tasks_created": len(self.new_tasks),
+            "session_tasks_created": len(self.new_session_tasks),
+            "session_tasks_renumbered": len(self.renumbered_session_tasks),
+            "weighing_logs_created": len(self.weighing_logs),
+            "food_logs_created": len(self.food_logs),
+        }
+
+
+def load_sessions(subject, sessions, reimport=False):
+    """
+    Creates or updates the daily sessions read by parse_sessions_file,
+    returns the number of rows loaded (the changed days unless reimport)
+    """
+    importer = SessionsImporter(subject, sessions, reimport).stage()
+    importer.save()
+    return len(importer.sessions)
+
+
+class TasksImporter:
+    """
+    Loads the task runs by day yielded by parse_tasks_file for a subject. The sessions,
+    tasks and dataset types are indexed once and the days are read and written
+    chunk_days at a time, so long listings are loaded in linear time.
+    With dry_run nothing is written, the changes are only listed in the changeset.
+    """
+
+    chunk_days = 200
+
+    def __init__(self, subject, dry_run=False):
+        self.subject = subject
+        self.dry_run = dry_run
+        self.changeset = ImportChangeset()
+        self.runs = 0
+
+    def index(self):
+        subject_sessions = list(BuffaloSession.objects.filter(subject=self.subject))
+        self.sessions = {}
+        for session in subject_sessions:
+            self.sessions.setdefault(session.start_time.date(), session)
+        self.session_start_times = {session.start_time for session in subject_sessions}
+        self.tasks = {}
+        for task in Task.objects.all():
+            self.tasks.setdefault(task.name.lower(), task)
+        self.categories = {
+            "pseudodiscrete": TaskCategory.objects.filter(name="ColorGame").first()
+        }
+        for category in CATEGORIES_KEY_WORDS:
+            category_obj = TaskCategory.objects.filter(name__icontains=category).first()
+            if category_obj:
+                self.categories[category] = category_obj
+        self.dataset_types = {}
+        self.data_format_id = None if self.dry_run else default_data_format()
+        self.new_task_ids = set()
+        self.project = self.subject.projects.first()
+
+    def load(self, task_days):
+        with transaction.atomic(), deferred_data_versions():
+            self.index()
+            task_days = iter(task_days)
+            chunk = list(islice(task_days, self.chunk_days))
+            while chunk:
+                self.load_chunk(chunk)
+                chunk = list(islice(task_days, self.chunk_days))
+            if not self.dry_run:
+                bump_data_version(self.subject.id)
+        return self.runs
+
+    def task(self, name):
+        training = "training" in name.lower()
+        if training:
+            name = "Training"
+        task = self.tasks.get(name.lower())
+        if task is None:
+            category = next(
+                (value for key, value in self.categories.items() if key in name.lower()), None
+            )
+            task = Task(name=name, category=category, training=training)
+            self.tasks[name.lower()] = task
+        return task
+
+    def dataset_type(self, name):
+        if name not in self.dataset_types:
+            if self.dry_run:
+                dataset_type = DatasetType.objects.filter(name=name).first()
+                if dataset_type is None:
+                    dataset_type = DatasetType(name=name)
+                    self.changeset.insert(DatasetType, name)
+            else:
+                dataset_type, _ = DatasetType.objects.get_or_create(name=name)
+            self.dataset_types[name] = dataset_type
+        return self.dataset_types[name]
+
+    def load_chunk(self, chunk):
+        for day, runs in chunk:
+            if day not in self.sessions:
+                start_time = datetime.combine(day, datetime.min.time())
+                session = BuffaloSession(
+                    subject=self.subject,
+                    name=f"{start_time.strftime('%Y-%m-%dT%H:%M:%S')}_{self.subject}",
+                    start_time=start_time,
+                    project=self.project,
+                    lab=self.subject.lab,
+                )
+                # Same check as BuffaloSession.save, against the start times read in index()
+                if start_time in self.session_start_times:
+                    if not self.dry_run:
+                        raise IntegrityError("This Session already exists.")
+                    self.changeset.conflict(
+                        BuffaloSession, session.name, f"A session starts at {start_time}"
+                    )
+                else:
+                    self.changeset.insert(BuffaloSession, session.name)
+                if not self.dry_run:
+                    session.save(block_table=False)
+                self.sessions[day] = session
+                self.session_start_times.add(start_time)
+        sessions = [self.sessions[day] for day, _ in chunk]
+
+        new_tasks = []
+        for _, runs in chunk:
+            for run in runs:
+                task = self.task(run[0].name)
+                if task._state.adding and task.id not in self.new_task_ids:
+                    self.new_task_ids.add(task.id)
+                    new_tasks.append(task)
+                    self.changeset.insert(Task, task.name, category=task.category)
+        if not self.dry_run:
+            Task.objects.bulk_create(new_tasks, batch_size=BULK_BATCH_SIZE)
+
+        # Sessions are filtered by id, the pk of a BuffaloSession is only set once saved
+        session_tasks = {
+            (session_task.session_id, session_task.task_sequence): session_task
+            for session_task in SessionTask.objects.filter(
+                session__in=[session.id for session in sessions]
+            )
+        }
+        new_session_tasks = []
+        runs_session_tasks = []
+        for session, (_, runs) in zip(sessions, chunk):
+            for sequence, run in enumerate(runs, 1):
+                task = self.task(run[0].name)
+                start_time = run[0].start_time
+                session_task = session_tasks.get((session.id, sequence))
+                run_key = f"{session.name} #{sequence} {task.name}"
+                if session_task is None:
+                    session_task = SessionTask(
+                        task=task, session=session, task_sequence=sequence, start_time=start_time
+                    )
+                    new_session_tasks.append(session_task)
+                    self.changeset.insert(SessionTask, run_key, start_time=start_time)
+                elif session_task.task_id != task.id or session_task.start_time != start_time:
+                    # The sequence is taken by another task, its datasets are kept without task
+                    session_task = None
+                    self.changeset.conflict(
+                        SessionTask, run_key, "The sequence is taken by another task"
+                    )
+                runs_session_tasks.append((session_task, run_key, run))
+        if not self.dry_run:
+            SessionTask.objects.bulk_create(new_session_tasks, batch_size=BULK_BATCH_SIZE)
+        self.runs += len(runs_session_tasks)
+
+        start_times = [event.start_time for _, _, run in runs_session_tasks for event in run]
+        datasets = set(
+            BuffaloDataset.objects.filter(
+                Q(session_task__session__in=[session.id for session in sessions]) |
+                Q(session_task__isnull=True, created_datetime__in=start_times)
+            ).values_list("dataset_type_id", "session_task_id", "created_datetime")
+        )
+        for session_task, run_key, run in runs_session_tasks:
+            for event in run:
+                dataset_type = self.dataset_type(event.dataset_type)
+                key = (
+                    dataset_type.id,
+                    session_task.id if session_task else None,
+                    event.start_time,
+                )
+                if key in datasets:
+                    continue
+                datasets.add(key)
+                self.changeset.insert(
+                    BuffaloDataset,
+                    run_key,
+                    dataset_type=dataset_type.name,
+                    created_datetime=event.start_time,
+                )
+                if not self.dry_run:
+                    # BuffaloDataset inherits from Dataset so it can't be bulk created
+                    BuffaloDataset.objects.create(
+                        dataset_type=dataset_type,
+                        session_task=session_task,
+                        created_datetime=event.start_time,
+                        data_format_id=self.data_format_id,
+                    )
+
+
+def load_tasks(subject, task_days):
+    """Creates the session tasks and datasets of the task runs yielded by parse_tasks_file"""
+    return TasksImporter(subject).load(task_days)
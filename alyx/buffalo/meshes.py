@@ -0,0 +1,168 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import trimesh
+from trimesh import proximity
+
+from django.conf import settings
+
+
+def mesh_nbytes(mesh):
+    """Approximate memory used by a mesh: vertices, faces and the triangles
+    array that the proximity queries build on first use."""
+    return mesh.vertices.nbytes + mesh.faces.nbytes + mesh.triangles.nbytes
+
+
+class MeshCache:
+    """
+    LRU cache of parsed STL meshes keyed by file path and modification time.
+    A mesh is re-parsed when its file changes on disk, and the least recently
+    used meshes are evicted once the cached meshes take more than max_bytes.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, path):
+        key = (path, os.path.getmtime(path))
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+        mesh = trimesh.load(path)
+        size = mesh_nbytes(mesh)
+        with self._lock:
+            # Drop the outdated versions of this file
+            for old_key in [k for k in self._entries if k[0] == path and k != key]:
+                self._pop(old_key)
+            if key not in self._entries:
+                self._entries[key] = (mesh, size)
+                self.current_bytes += size
+            self._entries.move_to_end(key)
+            # Always keep the mesh that has just been requested
+            while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+                self._pop(next(iter(self._entries)))
+            return self._entries[key][0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def _pop(self, key):
+        _, size = self._entries.pop(key)
+        self.current_bytes -= size
+
+
+mesh_cache = MeshCache(settings.STL_MESH_CACHE_MAX_BYTES)
+
+
+def load_stl(stl_file_name):
+    """Returns the (cached) mesh of a file stored in the uploaded folder"""
+    return mesh_cache.get(settings.UPLOADED_PATH + stl_file_name)
+
+
+def signed_distances(stl_file_name, points):
+    """
+    Signed distance of every point to the mesh surface in a single vectorized call.
+    Points inside the mesh have a positive distance.
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    if not len(points):
+        return np.empty(0)
+    return proximity.signed_distance(load_stl(stl_file_name), points)
+
+
+# Levels of detail of the meshes sent to the browser, by their maximum number of faces
+MESH_LODS = {"low": 5000, "medium": 50000, "full": None}
+MESH_LODS_DIR = "mesh_lods"
+
+
+def decimate(vertices, faces, max_faces):
+    """
+    Vertex clustering decimation: the vertices are merged into the mean of their
+    cell in a regular grid, the grid gets coarser until the mesh has at most
+    max_faces faces. Returns float32 vertices and uint32 faces.
+    """
+    vertices = np.asarray(vertices, dtype=float)
+    faces = np.asarray(faces)
+    if max_faces is None or len(faces) <= max_faces:
+        return vertices.astype(np.float32), faces.astype(np.uint32)
+    origin = vertices.min(axis=0)
+    extent = vertices.ptp(axis=0).max()
+    cells = max(int(np.sqrt(max_faces)), 2)
+    while True:
+        cell_size = extent / cells
+        keys = np.floor((vertices - origin) / cell_size).astype(np.int64)
+        _, clusters, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+        clusters = clusters.ravel()
+        cluster_faces = clusters[faces]
+        cluster_faces = cluster_faces[
+            (cluster_faces[:, 0] != cluster_faces[:, 1]) &
+            (cluster_faces[:, 1] != cluster_faces[:, 2]) &
+            (cluster_faces[:, 0] != cluster_faces[:, 2])
+        ]
+        # Faces merged into the same triangle are kept once, with their orientation
+        _, first = np.unique(np.sort(cluster_faces, axis=1), axis=0, return_index=True)
+        cluster_faces = cluster_faces[np.sort(first)]
+        if len(cluster_faces) <= max_faces or cells <= 2:
+            break
+        cells = max(int(cells * 0.8), 2)
+    cluster_vertices = np.zeros((len(counts), 3))
+    np.add.at(cluster_vertices, clusters, vertices)
+    cluster_vertices /= counts[:, None]
+    # Clusters left without faces are dropped
+    used, cluster_faces = np.unique(cluster_faces, return_inverse=True)
+    return (
+        cluster_vertices[used].astype(np.float32),
+        cluster_faces.reshape(-1, 3).astype(np.uint32),
+    )
+
+
+def mesh_lod_path(stl_file_name, lod):
+    return os.path.join(settings.UPLOADED_PATH, MESH_LODS_DIR, f"{stl_file_name}.{lod}.npz")
+
+
+def build_mesh_lods(stl_file_name):
+    """Stores every level of detail of a mesh in the uploaded folder, as npz files"""
+    mesh = load_stl(stl_file_name)
+    for lod, max_faces in MESH_LODS.items():
+        vertices, faces = decimate(mesh.vertices, mesh.faces, max_faces)
+        path = mesh_lod_path(stl_file_name, lod)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written aside and moved, so a request never reads a partial file
+        partial_path = f"{path}.{os.getpid()}.partial"
+        with open(partial_path, "wb") as file:
+            np.savez_compressed(file, vertices=vertices, faces=faces)
+        os.replace(partial_path, path)
+
+
+def mesh_lod_file(stl_file_name, lod):
+    """Path of a level of detail of a mesh, built when missing or older than the STL file"""
+    if lod not in MESH_LODS:
+        raise KeyError(f"Unknown mesh level of detail: {lod}")
+    path = mesh_lod_path(stl_file_name, lod)
+    stl_path = settings.UPLOADED_PATH + stl_file_name
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(stl_path):
+        build_mesh_lods(stl_file_name)
+    return path
+
+
+def mesh_lod_bytes(path):
+    """
+    A level of detail file as the browser reads it: the number of vertices and
+    faces (uint32), then the vertices (float32) and the faces (uint32), little endian.
+    """
+    with np.load(path) as lod:
+        vertices = lod["vertices"].astype("<f4")
+        faces = lod["faces"].astype("<u4")
+    header = np.array([len(vertices), len(faces)], dtype="<u4")
+    return header.tobytes() + vertices.tobytes() + faces.tobytes()
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.7 on 2026-10-18 15:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buffalo', '0018_set_foodlog_subject'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='electrodelogstl',
+            name='stale',
+            field=models.BooleanField(db_index=True, default=False, help_text='The containment has to be (re)computed'),
+        ),
+    ]
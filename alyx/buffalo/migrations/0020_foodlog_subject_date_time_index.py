@@ -0,0 +1,17 @@
+# Generated by Django 3.0.7 on 2026-10-18 15:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buffalo', '0019_electrodelogstl_stale'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='foodlog',
+            index=models.Index(fields=['subject', 'date_time'], name='buffalo_foo_subject_910add_idx'),
+        ),
+    ]
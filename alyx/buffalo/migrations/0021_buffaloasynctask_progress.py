@@ -0,0 +1,33 @@
+# Generated by Django 3.0.7 on 2026-10-18 16:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buffalo', '0020_foodlog_subject_date_time_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='buffaloasynctask',
+            name='errors',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='buffaloasynctask',
+            name='rows_parsed',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='buffaloasynctask',
+            name='rows_written',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='buffaloasynctask',
+            name='status',
+            field=models.CharField(choices=[('PEN', 'PENDING'), ('RUN', 'RUNNING'), ('COM', 'COMPLETED'), ('ERR', 'ERROR')], default='PEN', max_length=3),
+        ),
+    ]
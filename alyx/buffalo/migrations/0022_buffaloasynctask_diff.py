@@ -0,0 +1,18 @@
+# Generated by Django 3.0.7 on 2026-10-18 16:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buffalo', '0021_buffaloasynctask_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='buffaloasynctask',
+            name='diff',
+            field=models.FileField(blank=True, help_text='Changes listed by a dry run of a loader, as CSV', upload_to='buffalo_diffs'),
+        ),
+    ]
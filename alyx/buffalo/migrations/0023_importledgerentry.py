@@ -0,0 +1,35 @@
+# Generated by Django 3.0.7 on 2026-10-18 16:53
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buffalo', '0022_buffaloasynctask_diff'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportLedgerEntry',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(blank=True, help_text='Long name', max_length=255)),
+                ('json', django.contrib.postgres.fields.jsonb.JSONField(blank=True, help_text='Structured data, formatted in a user-defined way', null=True)),
+                ('loader', models.CharField(choices=[('SES', 'Sessions'), ('CHR', 'Channel recordings')], max_length=3)),
+                ('key', models.CharField(blank=True, default='', max_length=255)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('device', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='buffalo.Device')),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='buffalo.BuffaloSubject')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='importledgerentry',
+            index=models.Index(fields=['loader', 'subject', 'device', 'key'], name='buffalo_imp_loader_e8b164_idx'),
+        ),
+    ]
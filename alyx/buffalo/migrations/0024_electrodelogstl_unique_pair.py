@@ -0,0 +1,43 @@
+# Generated by Django 3.0.7 on 2026-10-18 18:11
+
+from django.db import migrations
+from django.db.models import Count
+
+
+def dedupe_electrodelogstl(apps, schema_editor):
+    """
+    Keeps the last updated row of each duplicated (electrode log, stl) pair, still stale
+    when one of the duplicates was, and deletes the others.
+    """
+    electrodelogstl_model = apps.get_model('buffalo', 'ElectrodeLogSTL')
+    duplicated = (
+        electrodelogstl_model.objects.filter(electrodelog__isnull=False, stl__isnull=False)
+        .values('electrodelog', 'stl')
+        .annotate(rows=Count('id'))
+        .filter(rows__gt=1)
+    )
+    for pair in duplicated:
+        rows = list(
+            electrodelogstl_model.objects.filter(
+                electrodelog=pair['electrodelog'], stl=pair['stl']
+            ).order_by('-updated')
+        )
+        kept = rows[0]
+        if any(row.stale for row in rows) and not kept.stale:
+            electrodelogstl_model.objects.filter(pk=kept.pk).update(stale=True)
+        electrodelogstl_model.objects.filter(pk__in=[row.pk for row in rows[1:]]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buffalo', '0023_importledgerentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_electrodelogstl, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='electrodelogstl',
+            unique_together={('electrodelog', 'stl')},
+        ),
+    ]
@@ -1,16 +1,22 @@
+import hashlib
+import json
+from collections import defaultdict, namedtuple
 from django.db import models
+from django.db.models import Max, OuterRef, Subquery
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.utils import timezone
-from django.db.models import Count
 from django.core.validators import MinValueValidator, FileExtensionValidator
 from django.db import transaction, IntegrityError
 from django.conf import settings
+import numpy as np
 
 from alyx.base import BaseModel
 from data.models import DatasetType, Dataset
 from actions.models import Session, Weighing, BaseAction
 from subjects.models import Subject
-import trimesh
-from trimesh import proximity
+from .figures import bump_data_version
+from .meshes import signed_distances
 
 
 FOOD_UNITS = [
@@ -198,6 +204,9 @@ class FoodLog(BaseModel):
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["subject", "date_time"])]
+
     def __str__(self):
         return self.food.name
 
@@ -329,21 +338,6 @@ class Electrode(BaseAction):
         location = {"x": starting_point.x, "y": starting_point.y, "z": starting_point.z}
         return location
 
-    def create_new_starting_point_from_mat(
-        self, electrode_info, subject, starting_point_set
-    ):
-        starting_point = StartingPoint()
-        starting_point.x = electrode_info["start_point"][0]
-        starting_point.y = electrode_info["start_point"][1]
-        starting_point.z = electrode_info["start_point"][2]
-        starting_point.x_norm = electrode_info["norms"][0]
-        starting_point.y_norm = electrode_info["norms"][1]
-        starting_point.z_norm = electrode_info["norms"][2]
-        starting_point.electrode = self
-        starting_point.subject = subject
-        starting_point.starting_point_set = starting_point_set
-        starting_point.save()
-
     def is_in_location(self, stl):
         return self.current_location in stl
 
@@ -359,6 +353,74 @@ class Electrode(BaseAction):
         return f"{subject_name} - {device_name} - {self.channel_number}"
 
 
+STARTING_POINT_FIELDS = ("x", "y", "z", "x_norm", "y_norm", "z_norm")
+
+ElectrodeLogPositions = namedtuple(
+    "ElectrodeLogPositions",
+    ["ids", "electrode_ids", "channel_numbers", "date_times", "points"],
+)
+
+
+def latest_starting_point(field, electrode="electrode"):
+    """Subquery with a field of the most recently updated starting point of an electrode"""
+    starting_points = StartingPoint.objects.filter(
+        electrode=OuterRef(electrode)
+    ).order_by("-updated")
+    return Subquery(starting_points.values(field)[:1])
+
+
+class ElectrodeLogQuerySet(models.QuerySet):
+    def with_latest_starting_point(self):
+        return self.annotate(**{
+            f"starting_point_{field}": latest_starting_point(field)
+            for field in STARTING_POINT_FIELDS
+        })
+
+    def with_positions(self, device=None):
+        """
+        Location of every electrode log, computed in a single query that joins the
+        latest starting point of each electrode:
+        start + turn / turns_per_mm * norm
+        Only the logs with a location are returned (they need a turn, a starting
+        point and the electrode turns per mm), points is a (n, 3) array.
+        """
+        electrode_logs = self.exclude(turn=None)
+        if device is not None:
+            electrode_logs = electrode_logs.filter(electrode__device=device)
+        rows = list(
+            electrode_logs.with_latest_starting_point().values_list(
+                "id",
+                "electrode_id",
+                "electrode__channel_number",
+                "date_time",
+                "turn",
+                "electrode__turns_per_mm",
+                *[f"starting_point_{field}" for field in STARTING_POINT_FIELDS],
+            )
+        )
+        if not rows:
+            return ElectrodeLogPositions([], [], [], [], np.empty((0, 3)))
+        ids, electrode_ids, channel_numbers, date_times = (
+            list(column) for column in zip(*[row[:4] for row in rows])
+        )
+        # Missing values (None) become NaN and drop the row from the result
+        values = np.array([row[4:] for row in rows], dtype=float)
+        turns, turns_per_mm = values[:, 0], values[:, 1]
+        starts, norms = values[:, 2:5], values[:, 5:8]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            distances = turns / turns_per_mm
+        points = starts + distances[:, np.newaxis] * norms
+        valid = np.isfinite(points).all(axis=1)
+        indexes = np.flatnonzero(valid)
+        return ElectrodeLogPositions(
+            [ids[i] for i in indexes],
+            [electrode_ids[i] for i in indexes],
+            [channel_numbers[i] for i in indexes],
+            [date_times[i] for i in indexes],
+            points[valid],
+        )
+
+
 class ElectrodeLog(BaseAction):
     electrode = models.ForeignKey(
         Electrode, on_delete=models.SET_NULL, null=True, blank=True,
@@ -373,6 +435,8 @@ class ElectrodeLog(BaseAction):
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
+    objects = ElectrodeLogQuerySet.as_manager()
+
     def get_current_location(self):
         electrode = self.electrode
         location = {}
@@ -402,8 +466,7 @@ class ElectrodeLog(BaseAction):
                     curr_location["y"],
                     curr_location["z"],
                 ]
-                mesh = trimesh.load(settings.UPLOADED_PATH + stl_file_name)
-                dist = proximity.signed_distance(mesh, [location_list])
+                dist = signed_distances(stl_file_name, [location_list])
                 if dist[0] > 0:
                     return True, dist[0]
                 else:
@@ -427,35 +490,15 @@ class ElectrodeLog(BaseAction):
             if stl.name:
                 name = stl.name
             stls[name] = f"{str(elstl.is_in)} ({elstl.distance})"
+            if elstl.stale:
+                stls[name] += " - pending"
         return stls
 
     def save(self, sync=True, *args, **kwargs):
         super(ElectrodeLog, self).save(*args, **kwargs)
         if sync:
-            ell = ElectrodeLog.objects.prefetch_related('electrode__device__subject').get(
-                pk=self.id
-            )
-            existing = ell.electrodelogstl.prefetch_related("stl").all().values("id")
-            subject = ell.electrode.device.subject
-            stls = STLFile.objects.filter(subject=subject).exclude(id__in=existing)
-            for stl in stls:
-                elstl = ElectrodeLogSTL(
-                    stl=stl,
-                    electrodelog=self
-                )
-                elstl.is_in, elstl.distance = self.is_in_stl(stl.stl_file.name)
-                elstl.save()
-
-    def sync_stl(self, stl):
-        elstl = ElectrodeLogSTL(
-            stl=stl,
-            electrodelog=self
-        )
-        is_in, distance = self.is_in_stl(stl.stl_file.name)
-        if is_in or distance is not None:
-            elstl.is_in = is_in
-            elstl.distance = distance
-            elstl.save()
+            ElectrodeLogSTL.objects.mark_stale(ElectrodeLog.objects.filter(pk=self.pk))
+            schedule_stl_index()
 
 
 class StartingPointSet(BaseModel):
@@ -534,17 +577,125 @@ class STLFile(Dataset):
             name_stl = str(self.pk)[:8]
         return "<Dataset %s - %s created on %s>" % (name_stl, name, date)
 
-    def sync_electrodelogs(self):
-        subject = self.subject
-        stls = STLFile.objects.filter(subject=subject)
-        electrode_logs = ElectrodeLog.objects.filter(
-            electrode__device__subject=subject
-        ).annotate(
-            num_stls=Count('electrodelogstl')
-        ).filter(num_stls__lt=len(stls))
-
-        for electrode_log in electrode_logs:
-            electrode_log.sync_stl(self)
+    def electrodelog_distances(self, electrode_logs=None):
+        """
+        Signed distance to this mesh of the given electrode logs (all the logs of the
+        subject by default), computed in a single vectorized call.
+        Returns a dict electrodelog id -> distance, logs without location are skipped.
+        """
+        if electrode_logs is None:
+            electrode_logs = ElectrodeLog.objects.filter(
+                electrode__device__subject=self.subject
+            )
+        positions = electrode_logs.with_positions()
+        distances = signed_distances(self.stl_file.name, positions.points)
+        return dict(zip(positions.ids, distances.tolist()))
+
+    def sync_electrodelogs(self, electrode_logs=None):
+        if electrode_logs is None:
+            electrode_logs = ElectrodeLog.objects.filter(
+                electrode__device__subject=self.subject
+            )
+        stls = STLFile.objects.filter(pk=self.pk)
+        ElectrodeLogSTL.objects.mark_stale(electrode_logs, stls, missing_only=True)
+        ElectrodeLogSTL.objects.index(stls)
+
+    def index_status(self):
+        """
+        Freshness of the electrodelog containment index of this mesh: number of
+        electrode logs of the subject not computed yet or outdated, and the last time
+        a pair was computed.
+        """
+        rows = ElectrodeLogSTL.objects.filter(stl=self)
+        missing = ElectrodeLog.objects.filter(
+            electrode__device__subject=self.subject
+        ).exclude(electrodelogstl__stl=self)
+        return {
+            "pending": rows.filter(stale=True).count() + missing.count(),
+            "last_indexed": rows.filter(stale=False).aggregate(
+                last_indexed=Max("updated")
+            )["last_indexed"],
+        }
+
+
+class ElectrodeLogSTLManager(models.Manager):
+    def mark_stale(self, electrode_logs, stls=None, missing_only=False):
+        """
+        Queues (electrode log, stl) pairs whose containment has to be computed:
+        existing rows are flagged as stale and the missing pairs are created as
+        stale rows. Each log is paired with the STL files (all of them by default)
+        of its electrode's subject. With missing_only the existing rows are kept.
+        """
+        logs = list(electrode_logs.values_list("id", "electrode__device__subject_id"))
+        subject_ids = {subject_id for _, subject_id in logs}
+        if stls is None:
+            stls = STLFile.objects.all()
+        stls_by_subject = defaultdict(list)
+        for stl_id, subject_id in stls.filter(subject__in=subject_ids).values_list(
+            "id", "subject_id"
+        ):
+            stls_by_subject[subject_id].append(stl_id)
+        pairs = {
+            (log_id, stl_id)
+            for log_id, subject_id in logs
+            for stl_id in stls_by_subject[subject_id]
+        }
+        if not pairs:
+            return 0
+        existing = self.filter(
+            electrodelog__in=electrode_logs.values("id"),
+            stl__in=[stl_id for stl_ids in stls_by_subject.values() for stl_id in stl_ids],
+        )
+        existing_pairs = set(existing.values_list("electrodelog_id", "stl_id"))
+        if not missing_only:
+            # A new updated time tells the indexer a row changed while it was computed
+            existing.update(stale=True, updated=timezone.now())
+        # A pair inserted meanwhile by a concurrent mark_stale is already queued
+        self.bulk_create(
+            [
+                ElectrodeLogSTL(electrodelog_id=log_id, stl_id=stl_id, stale=True)
+                for log_id, stl_id in pairs - existing_pairs
+            ],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+        return len(pairs)
+
+    def index(self, stls=None):
+        """
+        Computes the stale pairs, with a single vectorized signed distance call per
+        mesh, and bulk updates their rows. A row marked stale again meanwhile is left
+        stale for the next run. Returns the number of pairs computed.
+        """
+        stale = self.filter(stale=True)
+        if stls is not None:
+            stale = stale.filter(stl__in=stls)
+        computed = 0
+        for stl in STLFile.objects.filter(id__in=stale.values("stl")):
+            rows = list(stale.filter(stl=stl))
+            distances = stl.electrodelog_distances(
+                ElectrodeLog.objects.filter(
+                    electrodelogstl__stl=stl, electrodelogstl__stale=True
+                )
+            )
+            with transaction.atomic():
+                snapshot = dict(
+                    self.select_for_update()
+                    .filter(pk__in=[row.pk for row in rows])
+                    .values_list("pk", "updated")
+                )
+                rows = [row for row in rows if snapshot.get(row.pk) == row.updated]
+                now = timezone.now()
+                for row in rows:
+                    row.distance = distances.get(row.electrodelog_id)
+                    row.is_in = row.distance is not None and row.distance > 0
+                    row.stale = False
+                    row.updated = now
+                self.bulk_update(
+                    rows, ["is_in", "distance", "stale", "updated"], batch_size=1000
+                )
+            computed += len(rows)
+        return computed
 
 
 class ElectrodeLogSTL(BaseModel):
@@ -560,25 +711,159 @@ class ElectrodeLogSTL(BaseModel):
     )
     is_in = models.BooleanField(default=False)
     distance = models.FloatField(null=True, blank=True, default=None)
+    stale = models.BooleanField(
+        default=False,
+        db_index=True,
+        help_text="The containment has to be (re)computed",
+    )
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
+    objects = ElectrodeLogSTLManager()
+
+    class Meta:
+        unique_together = (
+            "electrodelog",
+            "stl",
+        )
+
+
+def schedule_stl_index():
+    """Computes the stale electrodelog/stl pairs in the background after the commit"""
+    if settings.TESTING:
+        return
+    from .tasks import index_electrodelogs_stl
+    transaction.on_commit(index_electrodelogs_stl.send)
+
+
+@receiver(post_save, sender=StartingPoint)
+@receiver(post_delete, sender=StartingPoint)
+def sync_starting_point_electrodelogs(sender, instance=None, **kwargs):
+    """The electrode logs location depends on the latest starting point"""
+    if not instance or instance.electrode_id is None:
+        return
+    ElectrodeLogSTL.objects.mark_stale(
+        ElectrodeLog.objects.filter(electrode=instance.electrode_id)
+    )
+    schedule_stl_index()
+
 
 class BuffaloAsyncTask(BaseModel):
     PENDING = "PEN"
+    RUNNING = "RUN"
     COMPLETED = "COM"
     ERROR = "ERR"
     STATUS = (
         (PENDING, "PENDING"),
+        (RUNNING, "RUNNING"),
         (COMPLETED, "COMPLETED"),
         (ERROR, "ERROR"),
     )
     description = models.CharField(max_length=255, default="", blank=True)
     status = models.CharField(max_length=3, default=PENDING, choices=STATUS)
     message = models.CharField(max_length=255, default="", blank=True)
+    rows_parsed = models.PositiveIntegerField(default=0)
+    rows_written = models.PositiveIntegerField(default=0)
+    errors = models.PositiveIntegerField(default=0)
+    diff = models.FileField(
+        upload_to="buffalo_diffs",
+        blank=True,
+        help_text="Changes listed by a dry run of a loader, as CSV",
+    )
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def set_progress(self, **fields):
+        """Saves the given progress fields (status, message, rows_parsed...) right away"""
+        for field, value in fields.items():
+            setattr(self, field, value)
+        self.save(update_fields=list(fields) + ["updated"])
+
+    def as_dict(self):
+        return {
+            "id": self.id,
+            "description": self.description,
+            "status": self.get_status_display(),
+            "message": self.message,
+            "rows_parsed": self.rows_parsed,
+            "rows_written": self.rows_written,
+            "errors": self.errors,
+            "has_diff": bool(self.diff),
+            "updated": self.updated,
+        }
+
+
+def content_hash(value):
+    """sha256 of parsed sheet values, the same for the same values in every upload"""
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ImportLedgerQuerySet(models.QuerySet):
+    def upload(self, loader, subject, device=None):
+        return self.filter(loader=loader, subject=subject, device=device)
+
+    def changed_keys(self, loader, subject, hashes, device=None):
+        """
+        Keys of the parts of an upload (key -> content hash) whose hash differs from the
+        one recorded by the last import, none when the whole upload is the same.
+        """
+        entries = self.upload(loader, subject, device)
+        upload_hash = content_hash(sorted(hashes.items()))
+        if entries.filter(key=ImportLedgerEntry.UPLOAD_KEY, content_hash=upload_hash).exists():
+            return set()
+        recorded = dict(entries.filter(key__in=hashes).values_list("key", "content_hash"))
+        return {key for key, part_hash in hashes.items() if recorded.get(key) != part_hash}
+
+    def record(self, loader, subject, hashes, device=None):
+        """Saves the hashes of the imported parts and of the whole upload"""
+        hashes = {**hashes, ImportLedgerEntry.UPLOAD_KEY: content_hash(sorted(hashes.items()))}
+        entries = self.upload(loader, subject, device)
+        recorded = dict(entries.filter(key__in=hashes).values_list("key", "content_hash"))
+        changed = {
+            key: part_hash for key, part_hash in hashes.items() if recorded.get(key) != part_hash
+        }
+        entries.filter(key__in=changed).delete()
+        self.bulk_create(
+            [
+                ImportLedgerEntry(
+                    loader=loader, subject=subject, device=device, key=key, content_hash=part_hash
+                )
+                for key, part_hash in changed.items()
+            ],
+            batch_size=1000,
+        )
+
+
+class ImportLedgerEntry(BaseModel):
+    """
+    Content hash of a part of an uploaded sheet as last imported (the rows of a day
+    of sessions, a date column of channel recordings), so a re-upload only loads
+    the parts that changed. The UPLOAD_KEY entry hashes the whole upload.
+    """
+
+    SESSIONS = "SES"
+    CHANNEL_RECORDINGS = "CHR"
+    LOADERS = (
+        (SESSIONS, "Sessions"),
+        (CHANNEL_RECORDINGS, "Channel recordings"),
+    )
+    UPLOAD_KEY = ""
+    loader = models.CharField(max_length=3, choices=LOADERS)
+    subject = models.ForeignKey(BuffaloSubject, on_delete=models.CASCADE)
+    device = models.ForeignKey(Device, null=True, blank=True, on_delete=models.CASCADE)
+    key = models.CharField(max_length=255, default="", blank=True)
+    content_hash = models.CharField(max_length=64)
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
+    objects = ImportLedgerQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=["loader", "subject", "device", "key"])]
+
+    def __str__(self):
+        return f"{self.get_loader_display()} - {self.subject} - {self.key or 'upload'}"
+
 
 class ChannelRecording(BaseModel):
     electrode = models.ForeignKey(
@@ -622,3 +907,41 @@ class ProcessedRecording(Dataset):
     notes = models.TextField(blank=True)
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
+
+
+@receiver([post_save, post_delete], sender=ElectrodeLog)
+@receiver([post_save, post_delete], sender=StartingPoint)
+@receiver([post_save, post_delete], sender=FoodLog)
+@receiver([post_save, post_delete], sender=WeighingLog)
+@receiver([post_save, post_delete], sender=BuffaloSession)
+def bump_subject_figures(sender, instance=None, **kwargs):
+    """The cached figures of the subject are drawn from this data"""
+    bump_data_version(instance.subject_id)
+
+
+@receiver([post_save, post_delete], sender=SessionTask)
+@receiver([post_save, post_delete], sender=ChannelRecording)
+def bump_session_figures(sender, instance=None, **kwargs):
+    """The cached figures of the session subject are drawn from this data"""
+    subject_id = (
+        Session.objects.filter(pk=instance.session_id).values_list("subject", flat=True).first()
+    )
+    bump_data_version(subject_id)
+
+
+@receiver([post_save, post_delete], sender=Electrode)
+def bump_electrode_figures(sender, instance=None, **kwargs):
+    """The electrode figures of the device subject are drawn from the channel numbers"""
+    subject_ids = {instance.subject_id}
+    if instance.device_id:
+        subject_ids.add(
+            Device.objects.filter(pk=instance.device_id).values_list("subject", flat=True).first()
+        )
+    bump_data_version(*(subject_id for subject_id in subject_ids if subject_id))
+
+
+@receiver([post_save, post_delete], sender=Task)
+@receiver([post_save, post_delete], sender=TaskCategory)
+def bump_all_figures(sender, instance=None, **kwargs):
+    """The task calendars of all the subjects depend on the tasks and their categories"""
+    bump_data_version(None)
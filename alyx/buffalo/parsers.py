@@ -0,0 +1,437 @@
+import csv
+import re
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta
+from io import TextIOWrapper
+from itertools import groupby
+from operator import attrgetter
+
+import numpy as np
+import xlrd
+from scipy.io import loadmat
+
+from django.core.exceptions import ValidationError
+
+from .constants import (
+    BOOLEAN_VALUES,
+    BOOLEAN_CELLS,
+    START_TIME_CELLS,
+    NUMBER_CELLS,
+    VALID_VALUES,
+)
+from .utils import (
+    get_date_session,
+    get_sessions_file_columns,
+    get_value,
+    is_date_session,
+    is_number,
+)
+
+# Day 0 of the 1900 and 1904 date systems, and the first day past the dates xlrd reads
+XL_EPOCHS = (np.datetime64("1899-12-30", "s"), np.datetime64("1904-01-01", "s"))
+XL_DAYS_TOO_LARGE = (2958466, 2957004)
+
+ELECTRODELOG_SHEET_REGEX = "^Trode \\(([0-9]|[1-8][0-9]|9[0-9]|1[0-9]{2}|200)\\)$"
+CHANNEL_NUMBER_REGEX = "^[\\d]+[a-zA-Z]*$"
+
+FILE_ERROR = "Error loading the file - Sheet: {} - Row: {} - Column: {} - File: {}"
+CHANNEL_NUMBER_ERROR = "Channel number name error - Sheet: {} - Row: {} - Column: {} - File: {}"
+VALUE_ERROR = "Invalid value error - Sheet: {} - Row: {} - Column: {} - File: {} - Value: {}"
+DATE_ERROR = "Invalid date error - Sheet: {} - Row: {} - Column: {} - File: {} - Value: {}"
+
+TaskEvent = namedtuple("TaskEvent", ["name", "dataset_type", "start_time"])
+ElectrodeStartingPoints = namedtuple(
+    "ElectrodeStartingPoints", ["channels", "start_points", "norms"]
+)
+
+
+def invalid_file(message, file):
+    return ValidationError(message, code="invalid", params={"file": file})
+
+
+def open_workbook(file):
+    file.seek(0)
+    return xlrd.open_workbook(file_contents=file.read())
+
+
+def sheet_column(sheet, col, start_row=0):
+    """Values of a column from start_row, blank when the sheet is narrower"""
+    if col >= sheet.ncols:
+        return [""] * max(sheet.nrows - start_row, 0)
+    return sheet.col_values(col, start_row)
+
+
+def xldates(values, datemode):
+    """
+    Excel date cells as datetime64[s], converted the way xlrd.xldate_as_tuple does.
+    Cells xlrd can't read as a date (text, blanks, times, negative...) are NaT.
+    """
+    serials = np.array(
+        [value if isinstance(value, (int, float)) else np.nan for value in values], dtype=float
+    )
+    days = np.floor(serials)
+    seconds = np.round((serials - days) * 86400)
+    days = days + seconds // 86400
+    seconds = seconds % 86400
+    first_day = 61 if datemode == 0 else 1
+    with np.errstate(invalid="ignore"):
+        valid = (days >= first_day) & (days < XL_DAYS_TOO_LARGE[datemode])
+    dates = np.full(len(serials), np.datetime64("NaT"), dtype="datetime64[s]")
+    dates[valid] = (
+        XL_EPOCHS[datemode] +
+        days[valid].astype("timedelta64[D]") +
+        seconds[valid].astype("timedelta64[s]")
+    )
+    return dates
+
+
+def xltime(value, datemode):
+    """Time of the day of an Excel time (or date) cell, None for a blank cell"""
+    if not str(value).strip():
+        return None
+    date_time = xlrd.xldate.xldate_as_datetime(value, datemode)
+    return timedelta(hours=date_time.hour, minutes=date_time.minute, seconds=date_time.second)
+
+
+def parse_sessions_file(file, subject):
+    """
+    Validates the daily sessions sheet of a subject and returns its rows, one dict per
+    session keyed by "<column>_<column name>", with the start times as datetimes.
+    The sheet is read once, column by column.
+    """
+    workbook = open_workbook(file)
+    sheet = workbook.sheet_by_index(0)
+    columns_names = get_sessions_file_columns(subject)
+
+    header = sheet.row_values(0) if sheet.nrows else []
+    header += [""] * (len(columns_names) - len(header))
+    for i, column_name in enumerate(columns_names):
+        if column_name != header[i]:
+            raise invalid_file(
+                f"""The column {i} should be {column_name} and
+            is {header[i]} instead.""",
+                file,
+            )
+
+    columns = [sheet_column(sheet, i, 1) for i in range(len(columns_names))]
+    dates = xldates(columns[0], workbook.datemode)
+    is_date = ~np.isnat(dates)
+    rows = {}
+    for row, (value, valid) in enumerate(zip(columns[0], is_date), 1):
+        if not valid:
+            if any(column[row - 1] for column in columns):
+                raise invalid_file(
+                    f"This value in row {row} column 1 must be a valid date", file
+                )
+        elif value in rows:
+            raise invalid_file(
+                f"The row {row + 1} and the row {rows[value] + 1} have the same date", file
+            )
+        rows[value] = row
+
+    for number_cell in NUMBER_CELLS:
+        for value in columns[int(number_cell)]:
+            if value and not isinstance(value, (int, float)):
+                raise invalid_file(f"The value {value} is not valid ", file)
+    for boolean_cell in BOOLEAN_CELLS:
+        for value in columns[int(boolean_cell)]:
+            if value and str(value).strip().lower() not in BOOLEAN_VALUES:
+                raise invalid_file(f"The value {value} is not valid", file)
+    start_times = {}
+    for start_time_cell in START_TIME_CELLS:
+        col = int(start_time_cell)
+        start_times[col] = []
+        for row, value in enumerate(columns[col], 2):
+            try:
+                start_times[col].append(xltime(value, workbook.datemode))
+            except (TypeError, ValueError):
+                raise invalid_file(
+                    f"""The value in the row {row} column {start_time_cell} '{value}'
+                        is not a valid Start Time (h:m)""",
+                    file,
+                )
+
+    sessions = []
+    for row in np.flatnonzero(is_date):
+        session_date = dates[row].item()
+        session = {f"0_{columns_names[0]}": session_date}
+        for i, column_name in enumerate(columns_names[1:], 1):
+            if i in start_times:
+                start_time = start_times[i][row]
+                session[f"{i}_{column_name}"] = (
+                    None if start_time is None else session_date + start_time
+                )
+            else:
+                session[f"{i}_{column_name}"] = columns[i][row]
+        sessions.append(session)
+    return sessions
+
+
+def parse_electrodelog_file(file):
+    """
+    Validates an electrode tracking workbook and returns the turn logs of each "Trode (n)"
+    sheet: [{"electrode": n, "logs": [{"datetime", "turns", "impedance", "notes", "user"}]}],
+    "user" being the handler initials. Every sheet is read once, column by column.
+    """
+    if not file:
+        return None
+    workbook = open_workbook(file)
+    sheets = workbook.sheets()
+    for sheet_number, sheet in enumerate(sheets, 1):
+        if sheet_number == 1:
+            if sheet.name != "Summary":
+                raise invalid_file(
+                    "Error loading the file - Summary Sheet - File: {}".format(file), file
+                )
+        elif re.search(ELECTRODELOG_SHEET_REGEX, sheet.name) is None:
+            raise invalid_file(
+                "Error loading the file - Sheet Name: {} - File: {}".format(sheet.name, file),
+                file,
+            )
+
+    electrodes = []
+    # Logs begin from row 3
+    first_row = 3
+    for sheet in sheets[1:]:
+        date_values = sheet_column(sheet, 0, first_row)
+        turns = sheet_column(sheet, 2, first_row)
+        impedances = sheet_column(sheet, 4, first_row)
+        dates = xldates(date_values, workbook.datemode)
+        logged = [str(value).strip() != "" for value in date_values]
+        for row, (has_date, date, turn, impedance) in enumerate(
+            zip(logged, dates, turns, impedances), first_row + 1
+        ):
+            if not has_date:
+                continue
+            if np.isnat(date):
+                raise invalid_file(FILE_ERROR.format(sheet.name, row, 1, file), file)
+            if not is_number(str(turn)):
+                raise invalid_file(FILE_ERROR.format(sheet.name, row, 3, file), file)
+            if str(impedance).strip() != "" and not is_number(str(impedance)):
+                raise invalid_file(FILE_ERROR.format(sheet.name, row, 5, file), file)
+
+        rows = np.flatnonzero(logged)
+        if not len(rows):
+            continue
+        try:
+            # Electrode number in each sheet
+            electrode_number = int(sheet.cell_value(0, 2))
+        except (IndexError, TypeError, ValueError):
+            raise invalid_file(FILE_ERROR.format(sheet.name, 1, 3, file), file)
+        users = sheet_column(sheet, 1, first_row)
+        notes = sheet_column(sheet, 8, first_row)
+        electrodes.append({
+            "electrode": electrode_number,
+            "logs": [
+                {
+                    "datetime": dates[row].item(),
+                    "turns": float(turns[row]),
+                    "user": str(users[row]).strip(),
+                    "impedance": float(impedances[row]) if str(impedances[row]).strip() else None,
+                    "notes": str(notes[row]).strip() or None,
+                }
+                for row in rows
+            ],
+        })
+    return electrodes
+
+
+def mat_struct_name(mat_file):
+    """First variable stored in a loaded mat file"""
+    names = [key for key in mat_file.keys() if not key.startswith("__")]
+    return names[0] if names else None
+
+
+def parse_electrodes_mat_file(file, structure_name):
+    """
+    Validates the electrodes structure of a mat file, loaded once, and returns its
+    ElectrodeStartingPoints: the channel numbers (n,) and the start points and norms
+    (n, 3) of the electrodes.
+    """
+    if not file:
+        return None
+    file.seek(0)
+    key = None
+    try:
+        mat_file = loadmat(file)
+        key = mat_struct_name(mat_file)
+        electrodes = mat_file[structure_name].ravel()
+    except Exception:
+        raise ValidationError(
+            "It cannot find an structure called: {}. It got: {}".format(
+                structure_name, key
+            ),
+            code="invalid",
+            params={"structure_name": structure_name},
+        )
+    try:
+        channels = [np.asarray(electrode[0]) for electrode in electrodes]
+        if not all(
+            channel.size == 1 and np.issubdtype(channel.dtype, np.integer)
+            for channel in channels
+        ):
+            raise ValueError("channel numbers must be integers")
+        start_points = [np.asarray(electrode[1], dtype=float).ravel() for electrode in electrodes]
+        norms = [np.asarray(electrode[2], dtype=float).ravel() for electrode in electrodes]
+        if not all(len(point) == 3 for point in start_points + norms):
+            raise ValueError("start points and norms must have 3 coordinates")
+    except Exception:
+        raise invalid_file(
+            "Error loading the file: {} - Check the structure".format(file), file
+        )
+    return ElectrodeStartingPoints(
+        np.array([channel.item() for channel in channels], dtype=int),
+        np.array(start_points).reshape(-1, 3),
+        np.array(norms).reshape(-1, 3),
+    )
+
+
+def channel_recordings_session(sessions, date):
+    date_str = str(date)
+    if date_str not in sessions:
+        sessions[date_str] = {"date": date, "records": {}}
+    return sessions[date_str]
+
+
+def parse_channel_recording_file(file, sufix=None):
+    """
+    Validates a units tracking workbook and returns its sessions by date:
+    {str(date): {"date", "records": {channel_number: {"value", "ripples", ...}},
+    "good behavior"}}. When a sufix is given only the channels named <number><sufix>
+    are read, and the events sheet is skipped. Every sheet is read once, column by column.
+    """
+    if not file:
+        return None
+    workbook = open_workbook(file)
+    sheets = workbook.sheets()
+    sessions = {}
+
+    sheet = sheets[0]
+    channel_cells = sheet_column(sheet, 0, 2)
+    channel_numbers = []
+    for row, cell in enumerate(channel_cells, 3):
+        if not str(cell).strip():
+            channel_numbers.append(None)
+            continue
+        channel_number = get_value(cell)
+        if re.search(CHANNEL_NUMBER_REGEX, channel_number) is None:
+            raise invalid_file(CHANNEL_NUMBER_ERROR.format(sheet.name, row, 1, file), file)
+        if sufix is None:
+            channel_number = channel_number if channel_number.isdigit() else None
+        else:
+            exist_sufix = channel_number.find(sufix)
+            channel_number = channel_number[0:exist_sufix] if exist_sufix > 0 else None
+        channel_numbers.append(channel_number)
+    for col in range(1, sheet.ncols):
+        column = sheet.col_values(col)
+        if len(column) > 1 and (
+            not is_date_session(column[1]) or not isinstance(column[1], float)
+        ):
+            raise invalid_file(FILE_ERROR.format(sheet.name, 2, col + 1, file), file)
+        values = [get_value(value) for value in column[2:]]
+        if col > 1:
+            for row, (cell, value) in enumerate(zip(channel_cells, values), 3):
+                if str(cell).strip() and value not in VALID_VALUES:
+                    raise invalid_file(
+                        VALUE_ERROR.format(sheet.name, row, col + 1, file, value), file
+                    )
+        if len(column) < 2:
+            continue
+        date = get_date_session(column[1])
+        records = {
+            channel_number: {"value": value}
+            for channel_number, value in zip(channel_numbers, values)
+            if channel_number is not None and value
+        }
+        if records:
+            sessions[str(date)] = {"date": date, "records": records}
+
+    if len(sheets) < 2:
+        return sessions
+    sheet = sheets[1]
+    date_values = sheet_column(sheet, 0, 1)
+    dates = xldates(date_values, workbook.datemode)
+    for row, (date, value) in enumerate(zip(dates, date_values), 2):
+        if np.isnat(date):
+            raise invalid_file(DATE_ERROR.format(sheet.name, row, 1, file, get_value(value)), file)
+    dates = dates.tolist()
+    for col in (1, 3, 5, 7):
+        for row, value in enumerate(sheet_column(sheet, col, 1), 2):
+            if str(value).strip() not in ["Y", "N", ""]:
+                raise invalid_file(
+                    VALUE_ERROR.format(sheet.name, row, col + 1, file, get_value(value)), file
+                )
+    for col, event in ((1, "ripples"), (3, "sharp_waves"), (5, "spikes")):
+        flags = [str(value).strip() for value in sheet_column(sheet, col, 1)]
+        channels = sheet_column(sheet, col + 1, 1)
+        for row, (flag, value) in enumerate(zip(flags, channels), 2):
+            try:
+                channels_numbers = value.strip().strip(",").split(",") if value.strip() else []
+                for channel_number in channels_numbers:
+                    int(channel_number.strip())
+            except (AttributeError, ValueError):
+                raise invalid_file(
+                    VALUE_ERROR.format(sheet.name, row, col + 2, file, get_value(value)), file
+                )
+            if flag != "Y" or sufix is not None:
+                continue
+            records = channel_recordings_session(sessions, dates[row - 2])["records"]
+            for channel_number in value.strip().strip(",").split(","):
+                records.setdefault(channel_number.strip(), {})[event] = True
+    if sufix is None:
+        for date, value in zip(dates, sheet_column(sheet, 7, 1)):
+            if str(value).strip() == "Y":
+                channel_recordings_session(sessions, date)["good behavior"] = "Y"
+    return sessions
+
+
+def task_event(file_name):
+    """
+    TaskEvent of a task log file name,
+    <rig>_<task name words>_<type>log_<Y>_<m>_<d>_<H>_<M>_<S>.<ext>,
+    None when the name doesn't follow it.
+    """
+    words = file_name.split("_")
+    words[-1] = words[-1].split(".")[0]
+    for log_index, word in enumerate(words):
+        if word.lower().endswith("log"):
+            break
+    else:
+        return None
+    date_words = words[log_index + 1:log_index + 7]
+    try:
+        if len(date_words) != 6:
+            return None
+        start_time = datetime(*(int(word) for word in date_words))
+    except ValueError:
+        return None
+    return TaskEvent(" ".join(words[1:log_index]).strip(), words[log_index], start_time)
+
+
+def iter_task_events(file):
+    """Task events of a task logs listing (index, file name rows), each one once, in file order"""
+    file.seek(0)
+    seen = set()
+    for index, file_name in csv.reader(TextIOWrapper(file, encoding="ascii")):
+        if not index:
+            continue
+        event = task_event(file_name)
+        if event is None or event in seen:
+            continue
+        seen.add(event)
+        yield event
+
+
+def parse_tasks_file(file):
+    """
+    Task runs of a task logs listing by session day: yields (day, runs) in day order,
+    a run being the consecutive events of the same task, in start time order.
+    Listings are not in date order, so every event is read before the first day is
+    yielded: only the runs are streamed to the loader, the events are held in memory.
+    """
+    days = defaultdict(list)
+    for event in iter_task_events(file):
+        days[event.start_time.date()].append(event)
+    for day in sorted(days):
+        events = sorted(days.pop(day), key=attrgetter("start_time"))
+        yield day, [list(run) for _, run in groupby(events, key=attrgetter("name"))]
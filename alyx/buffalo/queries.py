@@ -0,0 +1,267 @@
+from collections import namedtuple
+from datetime import date, timedelta
+from itertools import groupby
+from operator import itemgetter
+
+import numpy as np
+
+from django.db.models import Avg, Exists, OuterRef, Prefetch, Q, Sum
+from django.db.models.functions import TruncDate
+
+from actions.models import Session
+from .models import (
+    SessionTask,
+    Electrode,
+    ElectrodeLog,
+    ChannelRecording,
+    ElectrodeLogSTL,
+    FoodLog,
+    WeighingLog,
+    BuffaloDataset,
+)
+
+
+def ripple_recordings(subject, task, stl=None):
+    """
+    Alive channel recordings with ripples of the subject's sessions where the task
+    was run. When an stl is given only the recordings whose electrode was inside the
+    mesh on the session day are kept, based on the precomputed ElectrodeLogSTL rows.
+    """
+    channel_recordings = ChannelRecording.objects.filter(
+        session__subject=subject,
+        session__in=SessionTask.objects.filter(task=task).values("session"),
+        alive="yes",
+        ripples="yes",
+    )
+    if stl is not None:
+        in_stl = ElectrodeLogSTL.objects.filter(
+            stl=stl,
+            is_in=True,
+            electrodelog__electrode=OuterRef("electrode"),
+            electrodelog__date_time__date=OuterRef("session_date"),
+        )
+        channel_recordings = channel_recordings.annotate(
+            session_date=TruncDate("session__start_time"),
+            in_stl=Exists(in_stl),
+        ).filter(in_stl=True)
+    return channel_recordings
+
+
+def session_queries(subject, task, stl=None):
+    """
+    Sessions matching ripple_recordings, with the matching recordings in
+    `ripple_recordings` and the buffalo datasets in `buffalo_datasets`.
+    Three queries whatever the number of sessions.
+    """
+    channel_recordings = ripple_recordings(subject, task, stl)
+    return (
+        Session.objects.filter(id__in=channel_recordings.values("session"))
+        .select_related("subject")
+        .prefetch_related(
+            Prefetch(
+                "channelrecording_set",
+                queryset=channel_recordings.select_related(
+                    "electrode__subject"
+                ).order_by("electrode__channel_number"),
+                to_attr="ripple_recordings",
+            ),
+            Prefetch(
+                "data_dataset_session_related",
+                queryset=BuffaloDataset.objects.order_by("collection", "file_name"),
+                to_attr="buffalo_datasets",
+            ),
+        )
+        .order_by("start_time")
+    )
+
+
+# Codes of the electrode status matrix besides the number_of_cells values (1 to 4)
+STATUS_NO_DATA = 0
+STATUS_NO_ELECTRODE = 5
+
+ElectrodeStatus = namedtuple(
+    "ElectrodeStatus", ["status", "days", "channels", "day_breaks", "no_electrodes"]
+)
+
+
+def electrode_status_matrix(device, start_date, finish_date):
+    """
+    Number of cells recorded by every channel of the device, one row per channel
+    number (1 to the highest channel) and one column per day between the two dates.
+    Only the first session of each day is used, days without any recording are
+    dropped and listed in day_breaks, and channels without an electrode are
+    filled with STATUS_NO_ELECTRODE.
+    """
+    electrode_channels = {}
+    for electrode_id, channel_number in Electrode.objects.filter(device=device).values_list(
+        "id", "channel_number"
+    ):
+        try:
+            channel = int(channel_number)
+        except (TypeError, ValueError):
+            print(f"Channel {channel_number} ignored")
+            continue
+        if channel > 0:
+            electrode_channels[electrode_id] = channel
+
+    days = [start_date + timedelta(days=i) for i in range((finish_date - start_date).days + 1)]
+    channels = list(range(1, max(electrode_channels.values(), default=0) + 1))
+    status = np.full((len(channels), len(days)), STATUS_NO_DATA, dtype=np.int8)
+    has_electrode = np.zeros(len(channels), dtype=bool)
+    has_electrode[[channel - 1 for channel in electrode_channels.values()]] = True
+    status[~has_electrode] = STATUS_NO_ELECTRODE
+
+    recordings = (
+        ChannelRecording.objects.filter(
+            electrode__in=electrode_channels.keys(),
+            session__start_time__gte=start_date,
+            session__start_time__lt=finish_date + timedelta(days=1),
+        )
+        .exclude(number_of_cells="")
+        .order_by("session__start_time")
+        .values_list("electrode", "session", "session__start_time", "number_of_cells")
+    )
+    day_sessions = {}
+    rows, columns, values = [], [], []
+    for electrode_id, session_id, start_time, number_of_cells in recordings:
+        column = (start_time.date() - start_date).days
+        if day_sessions.setdefault(column, session_id) != session_id:
+            continue
+        try:
+            values.append(int(number_of_cells))
+        except ValueError:
+            continue
+        rows.append(electrode_channels[electrode_id] - 1)
+        columns.append(column)
+    status[rows, columns] = values
+
+    used_days = np.zeros(len(days), dtype=bool)
+    used_days[columns] = True
+    return ElectrodeStatus(
+        status=status[:, used_days],
+        days=[day for day, used in zip(days, used_days) if used],
+        channels=channels,
+        day_breaks=[day for day, used in zip(days, used_days) if not used],
+        no_electrodes=not has_electrode.all(),
+    )
+
+
+DailyTimeline = namedtuple("DailyTimeline", ["days", "weight", "food"])
+
+
+def _daily_values(queryset, start_date, value, days):
+    """Scatters the (day, value) rows of a queryset grouped by day into an array along days"""
+    values = np.full(len(days), np.nan)
+    rows = (
+        queryset.annotate(day=TruncDate("date_time"))
+        .values("day")
+        .annotate(value=value)
+        .values_list("day", "value")
+    )
+    for day, day_value in rows:
+        if day_value is not None:
+            values[(day - start_date).days] = day_value
+    return values
+
+
+def subject_daily_timeline(subject, start_date, finish_date, food_type=None):
+    """
+    Daily weight (mean of the weighings) and food (total amount of the food type,
+    or of all food when not given) of the subject between both dates included.
+    Arrays are aligned with days and hold NaN on the days without data.
+    """
+    days = np.arange(start_date, finish_date + timedelta(days=1), dtype="datetime64[D]")
+    date_range = {
+        "date_time__gte": start_date,
+        "date_time__lt": finish_date + timedelta(days=1),
+    }
+    weighings = WeighingLog.objects.filter(subject=subject, **date_range)
+    foods = FoodLog.objects.filter(subject=subject, **date_range)
+    if food_type is not None:
+        foods = foods.filter(food=food_type)
+    return DailyTimeline(
+        days=days,
+        weight=_daily_values(weighings, start_date, Avg("weight"), days),
+        food=_daily_values(foods, start_date, Sum("amount"), days),
+    )
+
+
+TurnSeries = namedtuple("TurnSeries", ["electrode_id", "channel_number", "date_times", "turns"])
+
+
+def downsample_steps(date_times, turns, max_points):
+    """
+    Reduces a turn history drawn as a step line to at most max_points points.
+    Repeated turns are dropped first as they don't change the line, then the
+    remaining points are picked at regular intervals, keeping the first and last.
+    """
+    if max_points is None or len(turns) <= max_points:
+        return date_times, turns
+    turns_array = np.asarray(turns)
+    keep = np.ones(len(turns_array), dtype=bool)
+    keep[1:-1] = turns_array[1:-1] != turns_array[:-2]
+    indexes = np.flatnonzero(keep)
+    if len(indexes) > max_points:
+        picked = np.linspace(0, len(indexes) - 1, max(max_points, 2)).round().astype(int)
+        indexes = indexes[np.unique(picked)]
+    return [date_times[i] for i in indexes], [turns[i] for i in indexes]
+
+
+def electrode_turn_series(device, start_date, finish_date, max_points=None):
+    """
+    Turn history of every electrode of the device between both dates included,
+    read with a single ordered query. Each series is reduced to max_points
+    points when given.
+    """
+    electrode_logs = (
+        ElectrodeLog.objects.filter(
+            electrode__device=device,
+            date_time__gte=start_date,
+            date_time__lt=finish_date + timedelta(days=1),
+            turn__isnull=False,
+        )
+        .order_by("electrode__channel_number", "electrode", "date_time")
+        .values_list("electrode", "electrode__channel_number", "date_time", "turn")
+    )
+    series = []
+    for (electrode_id, channel_number), logs in groupby(electrode_logs, key=itemgetter(0, 1)):
+        _, _, date_times, turns = zip(*logs)
+        date_times, turns = downsample_steps(list(date_times), list(turns), max_points)
+        series.append(TurnSeries(electrode_id, channel_number, date_times, turns))
+    return series
+
+
+TaskCalendar = namedtuple("TaskCalendar", ["days", "counts", "years"])
+
+
+def task_calendar(subject, start_year, finish_year, tasks=None, categories=None):
+    """
+    Number of distinct tasks, among the given tasks and the tasks of the given
+    categories, run by the subject each day from the first to the last year.
+    The calendar is empty when the first year is after the last one.
+    """
+    years = list(range(start_year, finish_year + 1))
+    days = np.arange(
+        date(start_year, 1, 1), date(finish_year + 1, 1, 1), dtype="datetime64[D]"
+    )
+    if not len(days):
+        return TaskCalendar(days=days, counts=np.zeros(0, dtype=int), years=years)
+    task_filter = Q()
+    if tasks:
+        task_filter |= Q(task__in=tasks)
+    if categories:
+        task_filter |= Q(task__category__in=categories)
+    task_days = (
+        SessionTask.objects.filter(
+            task_filter,
+            session__subject=subject,
+            start_time__gte=date(start_year, 1, 1),
+            start_time__lt=date(finish_year + 1, 1, 1),
+        )
+        .annotate(day=TruncDate("start_time"))
+        .values_list("day", "task")
+        .distinct()
+    )
+    run_days = np.array([day for day, _ in task_days], dtype="datetime64[D]")
+    counts = np.bincount((run_days - days[0]).astype(int), minlength=len(days))
+    return TaskCalendar(days=days, counts=counts, years=years)
@@ -0,0 +1,34 @@
+from rest_framework import serializers
+
+from actions.models import Session
+
+
+class SessionQuerySerializer(serializers.ModelSerializer):
+    """Sessions returned by buffalo.queries.session_queries"""
+
+    subject = serializers.SlugRelatedField(read_only=True, slug_field="nickname")
+    electrodes = serializers.SerializerMethodField()
+    datasets = serializers.SerializerMethodField()
+
+    def get_electrodes(self, obj):
+        channel_numbers = (
+            record.electrode.channel_number
+            for record in obj.ripple_recordings
+            if record.electrode
+        )
+        return list(dict.fromkeys(channel_numbers))
+
+    def get_datasets(self, obj):
+        return [
+            {"id": dataset.id, "collection": dataset.collection, "file_name": dataset.file_name}
+            for dataset in obj.buffalo_datasets
+        ]
+
+    class Meta:
+        model = Session
+        fields = ("id", "name", "subject", "start_time", "narrative", "electrodes", "datasets")
+
+
+class SessionQueriesParamsSerializer(serializers.Serializer):
+    task = serializers.UUIDField()
+    stl = serializers.UUIDField(required=False)
@@ -1,13 +1,39 @@
-from django.db.models import Count
 import dramatiq
 import datetime
+import json
+import os
+from contextlib import contextmanager
+
+import numpy as np
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
 from .models import (
     STLFile,
     BuffaloAsyncTask,
+    BuffaloSubject,
     ElectrodeLog,
     ElectrodeLogSTL,
     Device
 )
+from .loaders import (
+    ChannelRecordingsImporter,
+    SessionsImporter,
+    TasksImporter,
+    load_electrodes_mat,
+    load_electrode_logs,
+    load_sessions,
+    load_tasks,
+)
+from .parsers import ElectrodeStartingPoints, parse_tasks_file
+from .meshes import build_mesh_lods
+
+UPLOADS_DIR = "buffalo_uploads"
+# Loaders of large spreadsheets may run for a long time, and are not retried
+LOADER_ACTOR_OPTIONS = {"time_limit": 60 * 60 * 1000, "max_retries": 0}
 
 
 @dramatiq.actor
@@ -48,22 +74,9 @@ def sync_electrodelogs_device(device_id):
     """)
     task.save()
     try:
-        electrodelogs = ElectrodeLog.objects.filter(
-            electrode__device=device
-        ).annotate(
-            num_stls=Count('electrodelogstl')
-        ).filter(num_stls__lt=len(stls))
-
-        for ell in electrodelogs:
-            existing = ell.electrodelogstl.prefetch_related("stl").all().values("id")
-            stls = STLFile.objects.filter(subject=subject).exclude(id__in=existing)
-            for stl in stls:
-                elstl = ElectrodeLogSTL(
-                    stl=stl,
-                    electrodelog=ell
-                )
-                elstl.is_in, elstl.distance = ell.is_in_stl(stl.stl_file.name)
-                elstl.save()
+        electrodelogs = ElectrodeLog.objects.filter(electrode__device=device)
+        ElectrodeLogSTL.objects.mark_stale(electrodelogs, stls, missing_only=True)
+        ElectrodeLogSTL.objects.index(stls)
         print(f"""
             Completed Syncing electrodelogs of device: {device}
             - {datetime.datetime.now().strftime('%H:%M:%S')}
@@ -74,3 +87,183 @@ def sync_electrodelogs_device(device_id):
         task.message = type(err)
 
     task.save()
+
+
+@dramatiq.actor
+def build_stl_mesh_lods(stl_id):
+    """Decimated levels of detail of an uploaded mesh, served to the 3D plots"""
+    stl = STLFile.objects.get(pk=stl_id)
+    build_mesh_lods(stl.stl_file.name)
+
+
+@dramatiq.actor
+def index_electrodelogs_stl():
+    """Computes the electrodelog/stl pairs queued by the ElectrodeLog/StartingPoint changes"""
+    ElectrodeLogSTL.objects.index()
+
+
+class UploadEncoder(json.JSONEncoder):
+    """JSON of the parsed uploads, with the dates and datetimes tagged to be read back"""
+
+    def default(self, value):
+        if isinstance(value, np.ndarray):
+            return value.tolist()
+        if isinstance(value, np.generic):
+            return value.item()
+        if isinstance(value, datetime.datetime):
+            return {"__datetime__": value.isoformat()}
+        if isinstance(value, datetime.date):
+            return {"__date__": value.isoformat()}
+        return super().default(value)
+
+
+def decode_upload_value(value):
+    if len(value) == 1:
+        if "__datetime__" in value:
+            return datetime.datetime.fromisoformat(value["__datetime__"])
+        if "__date__" in value:
+            return datetime.date.fromisoformat(value["__date__"])
+    return value
+
+
+def read_upload(file):
+    """The rows stored by queue_loader"""
+    return json.load(file, object_hook=decode_upload_value)
+
+
+def queue_loader(loader, description, upload, *args):
+    """
+    Stores the upload and sends the loader job, returns its BuffaloAsyncTask. The upload is
+    either the uploaded file or the rows a form already parsed, stored as JSON so the
+    job doesn't parse the file again. The job runs right away in the request when testing.
+    """
+    task = BuffaloAsyncTask.objects.create(description=description)
+    if isinstance(upload, File):
+        file_name = os.path.join(UPLOADS_DIR, os.path.basename(upload.name))
+    else:
+        file_name = os.path.join(UPLOADS_DIR, f"{task.id}.json")
+        upload = ContentFile(json.dumps(upload, cls=UploadEncoder).encode())
+    file_name = default_storage.save(file_name, upload)
+    if settings.TESTING:
+        loader(str(task.id), file_name, *args)
+        task.refresh_from_db()
+        return task
+    try:
+        loader.send(str(task.id), file_name, *args)
+    except Exception:
+        default_storage.delete(file_name)
+        raise
+    return task
+
+
+@contextmanager
+def loader_task(task_id, file_name):
+    """Tracks a loader job in its BuffaloAsyncTask and removes the uploaded file at the end"""
+    try:
+        task = BuffaloAsyncTask.objects.get(pk=task_id)
+        task.set_progress(status=BuffaloAsyncTask.RUNNING, message="Reading file")
+        try:
+            with default_storage.open(file_name, "rb") as file:
+                yield task, file
+            # The dry runs keep the summary of their changes as message
+            task.set_progress(
+                status=BuffaloAsyncTask.COMPLETED, message=task.message if task.diff else ""
+            )
+        except Exception as err:
+            print(f"Error running {task.description}: {err}")
+            task.set_progress(
+                status=BuffaloAsyncTask.ERROR,
+                message=f"{type(err).__name__}: {err}"[:255],
+                errors=task.errors + 1,
+            )
+    finally:
+        default_storage.delete(file_name)
+
+
+def save_changeset(task, changeset):
+    """Stores the changes listed by a dry run as the diff of its task"""
+    task.diff.save(f"{task.id}.csv", ContentFile(changeset.csv().encode()), save=False)
+    task.set_progress(diff=task.diff, message=changeset.message())
+
+
+@dramatiq.actor(**LOADER_ACTOR_OPTIONS)
+def load_electrodes_file(task_id, file_name, device_id):
+    with loader_task(task_id, file_name) as (task, file):
+        device = Device.objects.get(pk=device_id)
+        channels, start_points, norms = read_upload(file)
+        starting_points = ElectrodeStartingPoints(
+            np.array(channels, dtype=int),
+            np.array(start_points, dtype=float).reshape(-1, 3),
+            np.array(norms, dtype=float).reshape(-1, 3),
+        )
+        task.set_progress(rows_parsed=len(starting_points.channels), message="Writing rows")
+        task.set_progress(rows_written=load_electrodes_mat(device, starting_points))
+
+
+@dramatiq.actor(**LOADER_ACTOR_OPTIONS)
+def load_electrode_logs_file(task_id, file_name, subject_id, device_id):
+    with loader_task(task_id, file_name) as (task, file):
+        subject = BuffaloSubject.objects.get(pk=subject_id)
+        device = Device.objects.get(pk=device_id)
+        electrodelogs_info = read_upload(file)
+        task.set_progress(
+            rows_parsed=sum(len(electrode["logs"]) for electrode in electrodelogs_info),
+            message="Writing rows",
+        )
+        task.set_progress(
+            rows_written=load_electrode_logs(subject, device, electrodelogs_info)
+        )
+
+
+@dramatiq.actor(**LOADER_ACTOR_OPTIONS)
+def load_channel_recordings_file(
+    task_id, file_name, subject_id, device_id, dry_run=False, reimport=False
+):
+    with loader_task(task_id, file_name) as (task, file):
+        subject = BuffaloSubject.objects.get(pk=subject_id)
+        device = Device.objects.get(pk=device_id)
+        channel_recording_info = read_upload(file)
+        task.set_progress(
+            rows_parsed=sum(
+                len(session["records"]) for session in channel_recording_info.values()
+            ),
+            message="Listing changes" if dry_run else "Writing rows",
+        )
+        importer = ChannelRecordingsImporter(
+            subject, device, channel_recording_info, reimport
+        ).stage()
+        if dry_run:
+            save_changeset(task, importer.changeset())
+            return
+        importer.save()
+        task.set_progress(
+            rows_written=len(importer.new_recordings) + len(importer.updated_recordings)
+        )
+
+
+@dramatiq.actor(**LOADER_ACTOR_OPTIONS)
+def load_sessions_file(task_id, file_name, subject_id, dry_run=False, reimport=False):
+    with loader_task(task_id, file_name) as (task, file):
+        subject = BuffaloSubject.objects.get(pk=subject_id)
+        sessions = read_upload(file)
+        task.set_progress(
+            rows_parsed=len(sessions), message="Listing changes" if dry_run else "Writing rows"
+        )
+        if dry_run:
+            save_changeset(task, SessionsImporter(subject, sessions, reimport).stage().changeset())
+            return
+        task.set_progress(rows_written=load_sessions(subject, sessions, reimport))
+
+
+@dramatiq.actor(**LOADER_ACTOR_OPTIONS)
+def load_tasks_file(task_id, file_name, subject_id, dry_run=False):
+    with loader_task(task_id, file_name) as (task, file):
+        subject = BuffaloSubject.objects.get(pk=subject_id)
+        task.set_progress(message="Listing changes" if dry_run else "Writing rows")
+        if dry_run:
+            importer = TasksImporter(subject, dry_run=True)
+            task.set_progress(rows_parsed=importer.load(parse_tasks_file(file)))
+            save_changeset(task, importer.changeset)
+            return
+        runs = load_tasks(subject, parse_tasks_file(file))
+        task.set_progress(rows_parsed=runs, rows_written=runs)
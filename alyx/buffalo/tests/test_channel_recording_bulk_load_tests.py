@@ -1,11 +1,20 @@
+import io
+import json
 import os
-from django.test import TestCase, Client
+import shutil
+import tempfile
+from datetime import date, datetime
+
+import numpy as np
+from django.core.files.storage import default_storage
+from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 
 from buffalo.models import (
-    BuffaloSubject, Electrode, Device, ChannelRecording, BuffaloSession
+    BuffaloSubject, Electrode, Device, ChannelRecording, BuffaloSession, BuffaloAsyncTask
 )
+from buffalo.tasks import UploadEncoder, load_sessions_file, queue_loader, read_upload
 
 TEST_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -155,3 +164,129 @@ class ChannelRecordingsBulkLoadTests(TestCase):
             session=session_180615
         )
         self.assertEquals(65, len(ch_rec_180615))
+
+    def test_upload_twice(self):
+        sam = BuffaloSubject.objects.get(nickname="Sam")
+        dsamp = Device.objects.get(name="posterior-sam", subject=sam)
+        bulk_load_url = reverse(
+            "channelrecord-bulk-load", kwargs={"subject_id": sam.id}
+        )
+        for _ in range(2):
+            self.file_sam_xlsx.seek(0)
+            resp = self.client.post(
+                bulk_load_url,
+                {
+                    "file": self.file_sam_xlsx,
+                    "device": dsamp.id,
+                    "subject": sam.id,
+                },
+                follow=True,
+                format="multipart",
+            )
+            self.assertNotContains(resp, "There has been an error in the database")
+            self.assertContains(resp, "File loaded successful")
+        session_180503 = BuffaloSession.objects.get(
+            subject=sam, name="2018-05-03T00:00:00_Sam"
+        )
+        self.assertEquals(
+            124, ChannelRecording.objects.filter(session=session_180503).count()
+        )
+        self.assertEquals(
+            9,
+            ChannelRecording.objects.filter(
+                session__name="2019-09-23T00:00:00_Sam", ripples="yes"
+            ).count(),
+        )
+
+    def test_upload_progress(self):
+        sam = BuffaloSubject.objects.get(nickname="Sam")
+        dsamp = Device.objects.get(name="posterior-sam", subject=sam)
+        self.client.post(
+            reverse("channelrecord-bulk-load", kwargs={"subject_id": sam.id}),
+            {"file": self.file_sam_xlsx, "device": dsamp.id, "subject": sam.id},
+            format="multipart",
+        )
+        task = BuffaloAsyncTask.objects.get()
+        resp = self.client.get(
+            reverse("buffalo-async-task-status", kwargs={"task_id": task.id})
+        )
+        status = resp.json()
+        self.assertEquals("COMPLETED", status["status"])
+        self.assertEquals(0, status["errors"])
+        self.assertGreater(status["rows_parsed"], 0)
+        self.assertGreater(status["rows_written"], 0)
+
+        resp = self.client.get(
+            reverse("buffalo-async-task", kwargs={"task_id": task.id})
+        )
+        self.assertContains(resp, task.description)
+
+        task_url = reverse("buffalo-async-task", kwargs={"task_id": task.id})
+        resp = self.client.get(task_url, {"next": "/buffalo/buffalosubject/"})
+        self.assertEquals("/buffalo/buffalosubject/", resp.context["next"])
+        for next_url in ("https://example.com/", "javascript:alert(1)"):
+            resp = self.client.get(task_url, {"next": next_url})
+            self.assertEquals("/buffalo/buffaloasynctask/", resp.context["next"])
+
+    def test_upload_dry_run(self):
+        sam = BuffaloSubject.objects.get(nickname="Sam")
+        dsamp = Device.objects.get(name="posterior-sam", subject=sam)
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with override_settings(MEDIA_ROOT=media_root):
+            self.client.post(
+                reverse("channelrecord-bulk-load", kwargs={"subject_id": sam.id}),
+                {
+                    "file": self.file_sam_xlsx,
+                    "device": dsamp.id,
+                    "subject": sam.id,
+                    "dry_run": True,
+                },
+                format="multipart",
+            )
+            self.assertFalse(ChannelRecording.objects.exists())
+            self.assertFalse(BuffaloSession.objects.exists())
+            task = BuffaloAsyncTask.objects.get()
+            self.assertEquals(BuffaloAsyncTask.COMPLETED, task.status)
+            self.assertTrue(task.message.startswith("Dry run: "))
+            resp = self.client.get(
+                reverse("buffalo-async-task-diff", kwargs={"task_id": task.id})
+            )
+            diff = b"".join(resp.streaming_content).decode().splitlines()
+        self.assertEquals("action,model,key,changes", diff[0])
+        self.assertTrue(any(line.startswith("insert,ChannelRecording,") for line in diff))
+        self.assertTrue(any(line.startswith("insert,BuffaloSession,") for line in diff))
+
+    def test_upload_unchanged_columns(self):
+        sam = BuffaloSubject.objects.get(nickname="Sam")
+        dsamp = Device.objects.get(name="posterior-sam", subject=sam)
+        for _ in range(2):
+            self.file_sam_xlsx.seek(0)
+            self.client.post(
+                reverse("channelrecord-bulk-load", kwargs={"subject_id": sam.id}),
+                {"file": self.file_sam_xlsx, "device": dsamp.id, "subject": sam.id},
+                format="multipart",
+            )
+        first, second = BuffaloAsyncTask.objects.order_by("created")
+        self.assertGreater(first.rows_written, 0)
+        self.assertEquals(first.rows_parsed, second.rows_parsed)
+        self.assertEquals(0, second.rows_written)
+        self.assertEquals(
+            first.rows_written, ChannelRecording.objects.filter(electrode__device=dsamp).count()
+        )
+
+    def test_upload_json(self):
+        rows = [
+            {"date": date(2021, 1, 2), "time": datetime(2021, 1, 2, 9), "weight": np.float64(4)}
+        ]
+        stored = io.BytesIO(json.dumps(rows, cls=UploadEncoder).encode())
+        self.assertEquals(rows, read_upload(stored))
+
+    def test_failed_job_removes_upload(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with override_settings(MEDIA_ROOT=media_root):
+            # The subject doesn't exist
+            task = queue_loader(load_sessions_file, "Failing job", [], 0)
+            self.assertEquals(BuffaloAsyncTask.ERROR, task.status)
+            self.assertEquals(([], []), default_storage.listdir("buffalo_uploads"))
@@ -3,7 +3,7 @@ from django.test import TestCase, Client
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 
-from buffalo.models import BuffaloSubject, Electrode, Device
+from buffalo.models import BuffaloSubject, Electrode, Device, StartingPoint
 
 TEST_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -89,3 +89,22 @@ class BulkLoadTests(TestCase):
         self.assertContains(resp, "File loaded successful")
         electrodes = Electrode.objects.filter(device=dspock.id)
         self.assertEquals(124, len(electrodes))
+
+    def test_upload_existing_electrodes(self):
+        spock = BuffaloSubject.objects.get(nickname="Spock")
+        dspock = Device.objects.get(name="posterior-spock")
+        electrode = Electrode.objects.create(device=dspock, subject=spock, channel_number="1")
+        bulk_load_url = reverse("electrode-bulk-load", kwargs={"device_id": dspock.id})
+        for _ in range(2):
+            self.file_spock_mat.seek(0)
+            self.client.post(
+                bulk_load_url,
+                {"file": self.file_spock_mat, "device": dspock.id},
+                follow=True,
+                format="multipart",
+            )
+        self.assertEquals(124, Electrode.objects.filter(device=dspock.id).count())
+        starting_points = StartingPoint.objects.filter(electrode=electrode)
+        self.assertEquals(2, starting_points.count())
+        self.assertEquals(2, starting_points.values("starting_point_set").distinct().count())
+        self.assertAlmostEqual(-11.94740292, starting_points.first().x)
@@ -0,0 +1,73 @@
+from datetime import date, datetime
+
+from django.test import TestCase, Client
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+
+from buffalo.queries import electrode_status_matrix
+from buffalo.models import (
+    BuffaloSubject,
+    BuffaloSession,
+    Device,
+    Electrode,
+    ChannelRecording,
+)
+
+
+class ElectrodeStatusTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        my_admin = User.objects.create_superuser("admin", "admin@test.com", "123456")
+        self.client = Client()
+        self.client.force_login(my_admin)
+
+        self.spock = BuffaloSubject.objects.create(nickname="Spock")
+        self.device = Device.objects.create(subject=self.spock, name="posterior")
+        el_1 = Electrode.objects.create(subject=self.spock, device=self.device, channel_number="1")
+        el_3 = Electrode.objects.create(subject=self.spock, device=self.device, channel_number="3")
+
+        first_session = BuffaloSession.objects.create(
+            subject=self.spock, name="first", start_time=datetime(2021, 1, 1, 9)
+        )
+        second_session = BuffaloSession.objects.create(
+            subject=self.spock, name="second", start_time=datetime(2021, 1, 1, 15)
+        )
+        third_session = BuffaloSession.objects.create(
+            subject=self.spock, name="third", start_time=datetime(2021, 1, 3, 9)
+        )
+        ChannelRecording.objects.create(session=first_session, electrode=el_1, number_of_cells="3")
+        # Only the first session of the day is shown
+        ChannelRecording.objects.create(
+            session=second_session, electrode=el_3, number_of_cells="4"
+        )
+        ChannelRecording.objects.create(session=third_session, electrode=el_3, number_of_cells="2")
+        ChannelRecording.objects.create(session=third_session, electrode=el_1, number_of_cells="")
+
+    def test_electrode_status_matrix(self):
+        with self.assertNumQueries(2):
+            electrode_status = electrode_status_matrix(
+                self.device, date(2021, 1, 1), date(2021, 1, 3)
+            )
+        self.assertEquals([1, 2, 3], electrode_status.channels)
+        self.assertEquals([date(2021, 1, 1), date(2021, 1, 3)], electrode_status.days)
+        self.assertEquals([date(2021, 1, 2)], electrode_status.day_breaks)
+        self.assertTrue(electrode_status.no_electrodes)
+        self.assertEquals([[3, 0], [5, 5], [0, 2]], electrode_status.status.tolist())
+
+    def test_electrode_status_json(self):
+        url = reverse("electrode-status-json", kwargs={"subject_id": self.spock.id})
+        resp = self.client.get(
+            url,
+            {"device": self.device.id, "start_date": "01/01/2021", "finish_date": "01/03/2021"},
+        )
+        self.assertEquals(200, resp.status_code)
+        self.assertEquals([[3, 0], [5, 5], [0, 2]], resp.json()["status"])
+        self.assertEquals(["2021-01-01", "2021-01-03"], resp.json()["days"])
+        self.assertEquals(400, self.client.get(url).status_code)
+
+        resp = self.client.post(
+            reverse("electrode-status-plot", kwargs={"subject_id": self.spock.id}),
+            {"device": self.device.id, "start_date": "01/01/2021", "finish_date": "01/03/2021"},
+        )
+        self.assertEquals(200, resp.status_code)
+        self.assertEquals(200, self.client.get(resp.context["figure_url"]).status_code)
@@ -0,0 +1,80 @@
+from datetime import date, datetime, timedelta
+
+from django.test import TestCase, Client
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+
+from buffalo.queries import downsample_steps, electrode_turn_series
+from buffalo.models import (
+    BuffaloSubject,
+    Device,
+    Electrode,
+    ElectrodeLog,
+)
+
+
+class ElectrodeLogSeriesTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        my_admin = User.objects.create_superuser("admin", "admin@test.com", "123456")
+        self.client = Client()
+        self.client.force_login(my_admin)
+
+        self.spock = BuffaloSubject.objects.create(nickname="Spock")
+        self.device = Device.objects.create(subject=self.spock, name="posterior")
+        el_1 = Electrode.objects.create(subject=self.spock, device=self.device, channel_number="1")
+        el_2 = Electrode.objects.create(subject=self.spock, device=self.device, channel_number="2")
+        for turn, date_time in [(2, datetime(2021, 1, 2, 9)), (1, datetime(2021, 1, 1, 9))]:
+            ElectrodeLog.objects.create(
+                subject=self.spock, electrode=el_1, turn=turn, date_time=date_time
+            )
+        ElectrodeLog.objects.create(
+            subject=self.spock, electrode=el_2, turn=5, date_time=datetime(2021, 1, 3, 9)
+        )
+        # Out of the range
+        ElectrodeLog.objects.create(
+            subject=self.spock, electrode=el_2, turn=6, date_time=datetime(2021, 1, 4, 9)
+        )
+
+    def test_electrode_turn_series(self):
+        with self.assertNumQueries(1):
+            series = electrode_turn_series(self.device, date(2021, 1, 1), date(2021, 1, 3))
+        self.assertEquals(["1", "2"], [s.channel_number for s in series])
+        self.assertEquals([1, 2], series[0].turns)
+        self.assertEquals([datetime(2021, 1, 1, 9), datetime(2021, 1, 2, 9)], series[0].date_times)
+        self.assertEquals([5], series[1].turns)
+
+    def test_downsample_steps(self):
+        date_times = [datetime(2021, 1, 1) + timedelta(days=i) for i in range(10)]
+        turns = [0, 0, 0, 1, 1, 2, 2, 2, 3, 3]
+        self.assertEquals(
+            [0, 1, 2, 3, 3], downsample_steps(date_times, turns, 5)[1]
+        )
+        sampled_date_times, sampled_turns = downsample_steps(date_times, turns, 3)
+        self.assertEquals([0, 2, 3], sampled_turns)
+        self.assertEquals(
+            [date_times[0], date_times[-1]], [sampled_date_times[0], sampled_date_times[-1]]
+        )
+        self.assertEquals(turns, downsample_steps(date_times, turns, None)[1])
+
+    def test_electrodelog_series_api(self):
+        url = reverse("electrodelog-series", kwargs={"subject_id": self.spock.id})
+        params = {
+            "device": self.device.id, "start_date": "01/01/2021", "finish_date": "01/03/2021"
+        }
+        resp = self.client.get(url, params)
+        self.assertEquals(200, resp.status_code)
+        self.assertEquals([1, 2], resp.json()["series"][0]["turns"])
+
+        resp = self.client.get(url, dict(params, format="csv"))
+        rows = resp.content.decode().splitlines()
+        self.assertEquals(["electrode,Datetime,Turn", "1,2021-01-01 09:00:00,1.0"], rows[:2])
+        self.assertEquals(4, len(rows))
+
+        resp = self.client.post(
+            reverse("electrodelog-plot", kwargs={"subject_id": self.spock.id}), params
+        )
+        self.assertContains(resp, "buffalo/js/plotly.min.js")
+        self.assertContains(self.client.get(resp.context["figure_url"]), "electrode-2")
+        figure_url = reverse("electrodelog-plot-figure", kwargs={"subject_id": self.spock.id})
+        self.assertEquals(400, self.client.get(figure_url).status_code)
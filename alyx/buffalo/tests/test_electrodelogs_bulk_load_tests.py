@@ -3,7 +3,14 @@ from django.test import TestCase, Client
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 
-from buffalo.models import BuffaloSubject, Electrode, ElectrodeLog, Device
+from buffalo.models import (
+    BuffaloSubject,
+    Electrode,
+    ElectrodeLog,
+    ElectrodeLogSTL,
+    Device,
+    STLFile,
+)
 from django.db.models import Q
 
 TEST_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -115,3 +122,25 @@ class ElectrodeLogsBulkLoadTests(TestCase):
             ~Q(impedance=None)
         )
         self.assertEquals(0, len(electrodelogs_40))
+
+    def test_upload_queues_stl_index(self):
+        sam = BuffaloSubject.objects.get(nickname="Sam")
+        dsam = Device.objects.get(name="posterior-sam")
+        stl = STLFile.objects.create(subject=sam, name="Sam_HPC", stl_file="Sam_HPC.stl")
+        bulk_load_url = reverse("electrodelog-bulk-load", kwargs={"subject_id": sam.id})
+        self.client.post(
+            bulk_load_url,
+            {
+                "file": self.file_sam_xlsm,
+                "device": dsam.id,
+                "subject": sam.id,
+            },
+            follow=True,
+            format="multipart",
+        )
+        electrodelogs = ElectrodeLog.objects.filter(subject=sam)
+        self.assertTrue(electrodelogs.exists())
+        self.assertEquals(
+            electrodelogs.count(),
+            ElectrodeLogSTL.objects.filter(stl=stl, stale=True).count(),
+        )
@@ -0,0 +1,154 @@
+from datetime import datetime
+from unittest import skipUnless
+
+import redis
+from django.conf import settings
+from django.http import QueryDict
+from django.test import SimpleTestCase, TestCase, Client
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+
+from buffalo.cache import RedisCache
+from buffalo.figures import (
+    cached_figure_json,
+    data_version,
+    deferred_data_versions,
+    figure_cache,
+)
+from buffalo.models import (
+    BuffaloSession,
+    BuffaloSubject,
+    Device,
+    Electrode,
+    FoodType,
+    FoodLog,
+    Task,
+    WeighingLog,
+)
+
+REDIS_URL = f"redis://{settings.REDIS_HOST}:{settings.REDIS_PORT}/1"
+
+
+class FigureCacheTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        my_admin = User.objects.create_superuser("admin", "admin@test.com", "123456")
+        self.client = Client()
+        self.client.force_login(my_admin)
+
+        self.spock = BuffaloSubject.objects.create(nickname="Spock")
+        self.kirk = BuffaloSubject.objects.create(nickname="Kirk")
+        self.apple = FoodType.objects.create(name="apple", unit="ml")
+        self.builds = 0
+
+    def build(self):
+        self.builds += 1
+        return f'{{"builds": {self.builds}}}'
+
+    def test_cached_figure_json(self):
+        params = QueryDict("start_date=01/01/2021&finish_date=01/03/2021")
+        self.assertEquals(
+            '{"builds": 1}', cached_figure_json("plot", self.spock.id, params, self.build)
+        )
+        reordered = QueryDict("finish_date=01/03/2021&start_date=01/01/2021")
+        self.assertEquals(
+            '{"builds": 1}', cached_figure_json("plot", self.spock.id, reordered, self.build)
+        )
+        cached_figure_json("other-plot", self.spock.id, params, self.build)
+        self.assertEquals(2, self.builds)
+
+        kirk_version = data_version(self.kirk.id)
+        FoodLog.objects.create(subject=self.spock, food=self.apple, amount=100)
+        self.assertEquals(
+            '{"builds": 3}', cached_figure_json("plot", self.spock.id, params, self.build)
+        )
+        self.assertEquals(kirk_version, data_version(self.kirk.id))
+
+        Task.objects.create(name="ymaze")
+        self.assertNotEqual(kirk_version, data_version(self.kirk.id))
+
+    def test_electrode_versions(self):
+        device = Device.objects.create(name="spock-device", subject=self.spock)
+        electrode = Electrode.objects.create(device=device, channel_number=1)
+        version = data_version(self.spock.id)
+        kirk_version = data_version(self.kirk.id)
+        electrode.channel_number = 2
+        electrode.save()
+        self.assertNotEqual(version, data_version(self.spock.id))
+        self.assertEquals(kirk_version, data_version(self.kirk.id))
+
+        version = data_version(self.spock.id)
+        electrode.delete()
+        self.assertNotEqual(version, data_version(self.spock.id))
+
+    def test_session_versions(self):
+        session = BuffaloSession.objects.create(
+            subject=self.spock, start_time=datetime(2021, 1, 1)
+        )
+        version = data_version(self.spock.id)
+        kirk_version = data_version(self.kirk.id)
+        session.start_time = datetime(2021, 1, 2)
+        session.save()
+        self.assertNotEqual(version, data_version(self.spock.id))
+        self.assertEquals(kirk_version, data_version(self.kirk.id))
+
+        version = data_version(self.spock.id)
+        session.delete()
+        self.assertNotEqual(version, data_version(self.spock.id))
+
+    def test_evicted_version(self):
+        version = data_version(self.spock.id)
+        figure_cache().clear()
+        self.assertNotEqual(version, data_version(self.spock.id))
+
+    def test_deferred_data_versions(self):
+        version = data_version(self.spock.id)
+        with deferred_data_versions():
+            WeighingLog.objects.create(
+                subject=self.spock, weight=10, date_time=datetime(2021, 1, 1)
+            )
+            WeighingLog.objects.create(
+                subject=self.spock, weight=11, date_time=datetime(2021, 1, 2)
+            )
+            self.assertEquals(version, data_version(self.spock.id))
+        self.assertNotEqual(version, data_version(self.spock.id))
+
+    def test_food_weight_figure_cache(self):
+        resp = self.client.post(
+            reverse("food-weight-plot", kwargs={"subject_id": self.spock.id}),
+            {"start_date": "01/01/2021", "finish_date": "01/03/2021", "food_type": self.apple.id},
+        )
+        figure_url = resp.context["figure_url"]
+        self.assertNotContains(self.client.get(figure_url), "2021-01-02")
+
+        FoodLog.objects.create(
+            subject=self.spock, food=self.apple, amount=100, date_time=datetime(2021, 1, 2, 9)
+        )
+        self.assertContains(self.client.get(figure_url), "2021-01-02")
+
+
+def redis_available():
+    try:
+        return redis.Redis.from_url(REDIS_URL).ping()
+    except redis.exceptions.ConnectionError:
+        return False
+
+
+@skipUnless(redis_available(), "No Redis server")
+class RedisCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = RedisCache(REDIS_URL, {"KEY_PREFIX": "buffalo_figures_tests"})
+        self.addCleanup(self.cache.clear)
+
+    def test_redis_cache(self):
+        self.assertTrue(self.cache.add("version", "a", timeout=None))
+        self.assertFalse(self.cache.add("version", "b", timeout=None))
+        self.cache.set_many({"figure": '{"data": []}', "other": "b"})
+        self.assertEquals(
+            {"version": "a", "figure": '{"data": []}'},
+            self.cache.get_many(["version", "figure", "missing"]),
+        )
+        self.cache.set("figure", "c", timeout=0)
+        self.assertIsNone(self.cache.get("figure"))
+        self.cache.clear()
+        self.assertFalse(self.cache.has_key("version"))
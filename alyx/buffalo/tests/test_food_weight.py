@@ -0,0 +1,76 @@
+from datetime import date, datetime
+
+import numpy as np
+from django.test import TestCase, Client
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+
+from buffalo.queries import subject_daily_timeline
+from buffalo.models import (
+    BuffaloSubject,
+    FoodType,
+    FoodLog,
+    WeighingLog,
+)
+
+
+class FoodWeightTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        my_admin = User.objects.create_superuser("admin", "admin@test.com", "123456")
+        self.client = Client()
+        self.client.force_login(my_admin)
+
+        self.spock = BuffaloSubject.objects.create(nickname="Spock")
+        self.apple = FoodType.objects.create(name="apple", unit="ml")
+        banana = FoodType.objects.create(name="banana", unit="ml")
+
+        WeighingLog.objects.create(
+            subject=self.spock, weight=10, date_time=datetime(2021, 1, 1, 9)
+        )
+        WeighingLog.objects.create(
+            subject=self.spock, weight=12, date_time=datetime(2021, 1, 1, 18)
+        )
+        WeighingLog.objects.create(
+            subject=self.spock, weight=11, date_time=datetime(2021, 1, 3, 9)
+        )
+        WeighingLog.objects.create(
+            subject=self.spock, weight=15, date_time=datetime(2021, 1, 4, 9)
+        )
+        FoodLog.objects.create(
+            subject=self.spock, food=self.apple, amount=100, date_time=datetime(2021, 1, 2, 9)
+        )
+        FoodLog.objects.create(
+            subject=self.spock, food=self.apple, amount=50, date_time=datetime(2021, 1, 2, 18)
+        )
+        FoodLog.objects.create(
+            subject=self.spock, food=banana, amount=20, date_time=datetime(2021, 1, 3, 9)
+        )
+
+    def test_subject_daily_timeline(self):
+        with self.assertNumQueries(2):
+            timeline = subject_daily_timeline(
+                self.spock.id, date(2021, 1, 1), date(2021, 1, 3), self.apple
+            )
+        self.assertEquals(
+            ["2021-01-01", "2021-01-02", "2021-01-03"], timeline.days.astype(str).tolist()
+        )
+        np.testing.assert_array_equal([11, np.nan, 11], timeline.weight)
+        np.testing.assert_array_equal([np.nan, 150, np.nan], timeline.food)
+
+        timeline = subject_daily_timeline(self.spock.id, date(2021, 1, 1), date(2021, 1, 3))
+        np.testing.assert_array_equal([np.nan, 150, 20], timeline.food)
+
+    def test_food_weight_plot(self):
+        resp = self.client.post(
+            reverse("food-weight-plot", kwargs={"subject_id": self.spock.id}),
+            {"start_date": "01/01/2021", "finish_date": "01/03/2021", "food_type": self.apple.id},
+        )
+        self.assertEquals(200, resp.status_code)
+        self.assertNotContains(resp, "2021-01-02")
+        figure_url = resp.context["figure_url"]
+        resp = self.client.get(figure_url)
+        self.assertEquals("application/json", resp["Content-Type"])
+        self.assertContains(resp, "2021-01-02")
+        resp = self.client.get(figure_url, HTTP_IF_NONE_MATCH=resp["ETag"])
+        self.assertEquals(304, resp.status_code)
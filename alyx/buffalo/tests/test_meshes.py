@@ -0,0 +1,128 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import trimesh
+from django.contrib.auth import get_user_model
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+
+from buffalo.meshes import (
+    MeshCache,
+    decimate,
+    mesh_cache,
+    mesh_lod_bytes,
+    mesh_lod_file,
+    signed_distances,
+)
+from buffalo.models import BuffaloSubject, STLFile
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+SPOCK_STL = os.path.join(TEST_DIR + "/files", "Spock_HPC.stl")
+
+
+class MeshCacheTests(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.stl_1 = os.path.join(self.tmp_dir, "hpc_1.stl")
+        self.stl_2 = os.path.join(self.tmp_dir, "hpc_2.stl")
+        shutil.copy(SPOCK_STL, self.stl_1)
+        shutil.copy(SPOCK_STL, self.stl_2)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_cache_hit(self):
+        cache = MeshCache(max_bytes=10 ** 9)
+        mesh = cache.get(self.stl_1)
+        self.assertIs(mesh, cache.get(self.stl_1))
+        self.assertEquals(1, len(cache))
+
+    def test_reload_when_file_changes(self):
+        cache = MeshCache(max_bytes=10 ** 9)
+        mesh = cache.get(self.stl_1)
+        stat = os.stat(self.stl_1)
+        os.utime(self.stl_1, (stat.st_atime, stat.st_mtime + 10))
+        self.assertIsNot(mesh, cache.get(self.stl_1))
+        self.assertEquals(1, len(cache))
+
+    def test_lru_eviction(self):
+        cache = MeshCache(max_bytes=10 ** 9)
+        cache.get(self.stl_1)
+        # Budget for a single mesh
+        cache.max_bytes = cache.current_bytes
+        mesh_2 = cache.get(self.stl_2)
+        self.assertEquals(1, len(cache))
+        self.assertIs(mesh_2, cache.get(self.stl_2))
+
+    @override_settings(UPLOADED_PATH=TEST_DIR + "/files/")
+    def test_signed_distances(self):
+        mesh_cache.clear()
+        distances = signed_distances(
+            "Spock_HPC.stl",
+            [
+                [-11.94740292, 48.38954010, -11.44560031],
+                [-11.27603690, 20.04604200, -15.71733967],
+            ]
+        )
+        self.assertEquals(2, len(distances))
+        self.assertEquals(False, distances[0] > 0)
+        self.assertEquals(True, distances[1] > 0)
+        self.assertEquals(0, len(signed_distances("Spock_HPC.stl", [])))
+
+
+class MeshLodTests(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        shutil.copy(SPOCK_STL, os.path.join(self.tmp_dir, "hpc.stl"))
+        self.settings = override_settings(UPLOADED_PATH=self.tmp_dir + "/")
+        self.settings.enable()
+        mesh_cache.clear()
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_decimate(self):
+        mesh = trimesh.load(SPOCK_STL)
+        vertices, faces = decimate(mesh.vertices, mesh.faces, 1000)
+        self.assertLessEqual(len(faces), 1000)
+        self.assertGreater(len(faces), 100)
+        self.assertEquals(len(vertices) - 1, faces.max())
+        np.testing.assert_allclose(mesh.bounds, [vertices.min(0), vertices.max(0)], atol=1)
+
+        vertices, faces = decimate(mesh.vertices, mesh.faces, None)
+        self.assertEquals(mesh.faces.shape, faces.shape)
+
+    def test_mesh_lod_file(self):
+        path = mesh_lod_file("hpc.stl", "low")
+        content = mesh_lod_bytes(path)
+        n_vertices, n_faces = np.frombuffer(content[:8], dtype="<u4")
+        self.assertEquals(8 + n_vertices * 12 + n_faces * 12, len(content))
+        self.assertLessEqual(n_faces, 5000)
+
+        # Rebuilt when the STL file is newer
+        mtime = os.path.getmtime(path)
+        stl_path = os.path.join(self.tmp_dir, "hpc.stl")
+        os.utime(stl_path, (mtime + 10, mtime + 10))
+        self.assertGreater(os.path.getmtime(mesh_lod_file("hpc.stl", "low")), mtime)
+        with self.assertRaises(KeyError):
+            mesh_lod_file("hpc.stl", "huge")
+
+    def test_stl_mesh_view(self):
+        user = get_user_model().objects.create_superuser("admin", "admin@test.com", "123456")
+        client = Client()
+        client.force_login(user)
+        spock = BuffaloSubject.objects.create(nickname="Spock")
+        stl = STLFile.objects.create(subject=spock, name="hpc", stl_file="hpc.stl")
+        url = reverse("stl-mesh", kwargs={"stl_id": stl.id, "lod": "full"})
+        resp = client.get(url)
+        self.assertEquals(200, resp.status_code)
+        self.assertEquals(
+            np.array([1721, 3438], dtype="<u4").tobytes(), resp.content[:8]
+        )
+        resp = client.get(url, HTTP_IF_NONE_MATCH=resp["ETag"])
+        self.assertEquals(304, resp.status_code)
+        resp = client.get(reverse("stl-mesh", kwargs={"stl_id": stl.id, "lod": "huge"}))
+        self.assertEquals(404, resp.status_code)
@@ -0,0 +1,82 @@
+import os
+from datetime import datetime
+
+import numpy as np
+import xlrd
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+
+from buffalo.parsers import (
+    parse_channel_recording_file,
+    parse_electrodes_mat_file,
+    parse_electrodelog_file,
+    xldates,
+)
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def open_test_file(name):
+    return open(os.path.join(TEST_DIR, "files", name), "rb")
+
+
+class ParsersTests(TestCase):
+    def test_xldates(self):
+        values = [43000.5, 60.0, 61.0, 0.5, -1.0, "01/01/2021", "", 2958466.0]
+        for datemode in (0, 1):
+            dates = xldates(values, datemode)
+            for value, date in zip(values, dates):
+                try:
+                    expected = datetime(*xlrd.xldate_as_tuple(value, datemode))
+                except Exception:
+                    self.assertTrue(np.isnat(date), value)
+                else:
+                    self.assertEquals(expected, date.item())
+
+    def test_parse_channel_recording_file(self):
+        with open_test_file("Sam_UnitsTrackingCurrent.xlsx") as file:
+            sessions = parse_channel_recording_file(file)
+            session = sessions[str(datetime(2019, 9, 23))]
+            self.assertEquals(
+                9, sum(bool(record.get("ripples")) for record in session["records"].values())
+            )
+            self.assertTrue(all("records" in session for session in sessions.values()))
+
+            sufix_sessions = parse_channel_recording_file(file, "a")
+            self.assertEquals(
+                96, len(sufix_sessions[str(datetime(2018, 8, 30))]["records"])
+            )
+
+        with open_test_file("Sam_UnitsTrackingCurrentWrong.xlsx") as file:
+            with self.assertRaisesMessage(ValidationError, "Row: 2 - Column: 16"):
+                parse_channel_recording_file(file)
+
+    def test_parse_electrodelog_file(self):
+        with open_test_file("SamAnteriorElectrodeTracking.xlsm") as file:
+            electrodes = parse_electrodelog_file(file)
+        log = electrodes[0]["logs"][0]
+        self.assertIsInstance(log["datetime"], datetime)
+        self.assertIsInstance(log["turns"], float)
+        self.assertIsInstance(log["user"], str)
+
+        with open_test_file("SamAnteriorElectrodeTrackingWrong.xlsm") as file:
+            with self.assertRaisesMessage(
+                ValidationError, "Sheet: Trode (66) - Row: 7 - Column: 3"
+            ):
+                parse_electrodelog_file(file)
+
+    def test_parse_electrodes_mat_file(self):
+        with open_test_file("SpockTrodeInfo.mat") as file:
+            starting_points = parse_electrodes_mat_file(file, "Spock")
+            self.assertEquals((124,), starting_points.channels.shape)
+            self.assertEquals((124, 3), starting_points.start_points.shape)
+            self.assertEquals((124, 3), starting_points.norms.shape)
+            self.assertEquals(1, starting_points.channels[0])
+            np.testing.assert_allclose(
+                [-11.94740292, 48.38954011, -11.44560031], starting_points.start_points[0]
+            )
+
+            with self.assertRaisesMessage(
+                ValidationError, "It cannot find an structure called: Horacio. It got: Spock"
+            ):
+                parse_electrodes_mat_file(file, "Horacio")
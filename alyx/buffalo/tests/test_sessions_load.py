@@ -0,0 +1,134 @@
+from datetime import datetime
+
+from django.test import TestCase
+
+from buffalo.constants import SESSIONS_FILE_COLUMNS_V2, TASK_CELLS
+from buffalo.loaders import SessionsImporter, load_sessions
+from buffalo.models import (
+    BuffaloSubject,
+    BuffaloSession,
+    BuffaloDataset,
+    FoodLog,
+    ImportLedgerEntry,
+    SessionTask,
+    Task,
+    WeighingLog,
+)
+
+
+def session_row(day, weight="", tasks=()):
+    """A row as read by parse_sessions_file, tasks are (name, start time, file name)"""
+    row = {f"{i}_{column}": "" for i, column in enumerate(SESSIONS_FILE_COLUMNS_V2)}
+    row["0_Date (mm/dd/yyyy)"] = day
+    row["2_Weight (kg)"] = weight
+    row["6_General Comments"] = f"comments {day.date()}"
+    for task_cell, (name, start_time, filename) in zip(TASK_CELLS, tasks):
+        cell = int(task_cell)
+        row[f"{cell}_{SESSIONS_FILE_COLUMNS_V2[cell]}"] = name
+        row[f"{cell + 1}_{SESSIONS_FILE_COLUMNS_V2[cell + 1]}"] = start_time
+        row[f"{cell + 3}_{SESSIONS_FILE_COLUMNS_V2[cell + 3]}"] = filename
+    return row
+
+
+class SessionsLoadTests(TestCase):
+    def setUp(self):
+        self.spock = BuffaloSubject.objects.create(nickname="Spock")
+        self.ymaze = Task.objects.create(name="ymaze")
+        self.session = BuffaloSession.objects.create(
+            subject=self.spock, name="existing", start_time=datetime(2021, 1, 1)
+        )
+        self.ymaze_session_task = SessionTask.objects.create(
+            session=self.session, task=self.ymaze, task_sequence=1,
+            start_time=datetime(2021, 1, 1, 10),
+        )
+        self.rows = [
+            session_row(
+                datetime(2021, 1, 1),
+                tasks=[
+                    ("forage.sav", datetime(2021, 1, 1, 9), ""),
+                    ("ymaze", datetime(2021, 1, 1, 10), "ymaze.mat"),
+                ],
+            ),
+            session_row(
+                datetime(2021, 1, 2),
+                weight=450,
+                tasks=[
+                    ("mid-day break", None, ""),
+                    ("ymaze", datetime(2021, 1, 2, 9), ""),
+                ],
+            ),
+        ]
+
+    def test_load_sessions(self):
+        importer = SessionsImporter(self.spock, self.rows).stage()
+        self.assertEquals(1, importer.summary()["sessions_created"])
+        self.assertEquals(1, importer.summary()["session_tasks_renumbered"])
+        importer.save()
+
+        self.assertEquals(2, BuffaloSession.objects.filter(subject=self.spock).count())
+        self.session.refresh_from_db()
+        self.assertEquals("comments 2021-01-01", self.session.narrative)
+        self.assertEquals(
+            ["forage.sav", "ymaze"],
+            list(
+                SessionTask.objects.filter(session=self.session)
+                .order_by("task_sequence")
+                .values_list("task__name", flat=True)
+            ),
+        )
+        self.assertEquals("cortex", Task.objects.get(name="forage.sav").platform.name)
+        self.assertEquals(
+            self.ymaze_session_task, BuffaloDataset.objects.get(file_name="ymaze.mat").session_task
+        )
+        new_session = BuffaloSession.objects.get(
+            subject=self.spock, start_time=datetime(2021, 1, 2)
+        )
+        self.assertEquals(["ymaze"], [st.task.name for st in new_session.sessiontask_set.all()])
+        self.assertEquals(450, WeighingLog.objects.get(session=new_session).weight)
+        self.assertEquals(2, FoodLog.objects.filter(subject=self.spock).count())
+
+    def test_load_sessions_twice(self):
+        load_sessions(self.spock, self.rows)
+        load_sessions(self.spock, self.rows)
+        self.assertEquals(2, BuffaloSession.objects.filter(subject=self.spock).count())
+        self.assertEquals(
+            3, SessionTask.objects.filter(session__subject=self.spock).count()
+        )
+        self.assertEquals(
+            [1, 2],
+            sorted(
+                SessionTask.objects.filter(session=self.session).values_list(
+                    "task_sequence", flat=True
+                )
+            ),
+        )
+
+    def test_sessions_changeset(self):
+        changeset = SessionsImporter(self.spock, self.rows).stage().changeset()
+        self.assertEquals(1, BuffaloSession.objects.filter(subject=self.spock).count())
+        self.assertFalse(FoodLog.objects.exists())
+        summary = changeset.summary()
+        self.assertEquals(1, summary["insert"]["BuffaloSession"])
+        self.assertEquals(1, summary["update"]["BuffaloSession"])
+        self.assertEquals(1, summary["update"]["SessionTask"])
+        self.assertEquals({}, summary["conflict"])
+        self.assertIn(
+            ("update", "SessionTask", "existing #2 ymaze", "task_sequence: 1 -> 2"), changeset.rows
+        )
+
+    def test_load_changed_days(self):
+        self.assertEquals(2, load_sessions(self.spock, self.rows))
+        self.assertEquals(0, load_sessions(self.spock, self.rows))
+        self.assertEquals(
+            3, ImportLedgerEntry.objects.filter(subject=self.spock).count()
+        )
+
+        self.rows[1]["2_Weight (kg)"] = 455
+        self.assertEquals(1, load_sessions(self.spock, self.rows))
+        self.assertEquals(
+            [450, 455],
+            sorted(
+                WeighingLog.objects.filter(subject=self.spock).values_list("weight", flat=True)
+            ),
+        )
+        self.assertEquals(2, load_sessions(self.spock, self.rows, reimport=True))
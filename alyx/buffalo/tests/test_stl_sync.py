@@ -1,6 +1,7 @@
 import os
 import tempfile
 import shutil
+from unittest.mock import patch
 from django.utils import timezone
 from django.test import TestCase, Client, override_settings
 from django.urls import reverse
@@ -10,14 +11,21 @@ from buffalo.tasks import (
     sync_electrodelogs_stl
 )
 
+from buffalo.queries import session_queries
 from buffalo.models import (
     BuffaloSubject,
+    BuffaloSession,
+    BuffaloDataset,
+    Task,
+    SessionTask,
+    ChannelRecording,
     STLFile,
     Device,
     Electrode,
     ElectrodeLog,
     ElectrodeLogSTL,
-    StartingPoint
+    StartingPoint,
+    StartingPointSet,
 )
 
 
@@ -168,3 +176,192 @@ class STLUploadTests(TestCase):
             electrodelog__electrode__channel_number="78"
         )
         self.assertEquals(False, elstl_78.is_in)
+
+    def test_electrodelog_positions(self):
+        dev = Device.objects.get(name="posterior")
+        with self.assertNumQueries(1):
+            positions = ElectrodeLog.objects.with_positions(dev)
+        self.assertEquals(2, len(positions.ids))
+        self.assertEquals((2, 3), positions.points.shape)
+        for electrode_log_id, point in zip(positions.ids, positions.points):
+            location = ElectrodeLog.objects.get(pk=electrode_log_id).get_current_location()
+            self.assertAlmostEqual(location["x"], point[0])
+            self.assertAlmostEqual(location["y"], point[1])
+            self.assertAlmostEqual(location["z"], point[2])
+
+    @override_settings(UPLOADED_PATH=UPLOADED_PATH)
+    def test_plots_electrodelog_positions(self):
+        spock = BuffaloSubject.objects.get(nickname="Spock")
+        stl_add_url = reverse("admin:buffalo_stlfile_add") + f"?subject={spock.id}"
+        self.client.post(
+            stl_add_url,
+            {
+                "name": "hpc",
+                "stl_file": self.file_spock_stl,
+                "subject": spock.id,
+                "sync_electrodelogs": False
+            },
+            follow=True,
+            format="multipart",
+        )
+        stl = STLFile.objects.get(subject=spock.id)
+        dev = Device.objects.get(subject=spock, name="posterior")
+        plots_url = reverse("plots", kwargs={"subject_id": spock.id})
+        data = {
+            "stl": stl.id,
+            "device": dev.id,
+            "date": timezone.now().strftime("%m/%d/%Y"),
+        }
+        resp = self.client.post(plots_url, data)
+        self.assertContains(self.client.get(resp.context["figure_url"]), "Electrode log position")
+        self.assertContains(resp, reverse("stl-mesh", kwargs={"stl_id": stl.id, "lod": "medium"}))
+
+        data["download_points"] = True
+        resp = self.client.post(plots_url, data)
+        rows = resp.content.decode().splitlines()
+        self.assertEquals(3, len(rows))
+        self.assertIn("77,", rows[1] + rows[2])
+        self.assertIn("True", [row.split(",")[2] for row in rows[1:]])
+
+    @override_settings(UPLOADED_PATH=UPLOADED_PATH)
+    def test_incremental_index(self):
+        spock = BuffaloSubject.objects.get(nickname="Spock")
+        stl_add_url = reverse("admin:buffalo_stlfile_add") + f"?subject={spock.id}"
+        self.client.post(
+            stl_add_url,
+            {
+                "name": "hpc",
+                "stl_file": self.file_spock_stl,
+                "subject": spock.id,
+                "sync_electrodelogs": False
+            },
+            follow=True,
+            format="multipart",
+        )
+        stl = STLFile.objects.get(subject=spock.id)
+        self.assertEquals(2, stl.index_status()["pending"])
+        sync_electrodelogs_stl(stl.id)
+        self.assertEquals(0, stl.index_status()["pending"])
+
+        # A new log is queued on save and computed by the indexer
+        el_77 = Electrode.objects.get(channel_number="77")
+        new_log = ElectrodeLog.objects.create(electrode=el_77, subject=spock, turn=0)
+        self.assertTrue(ElectrodeLogSTL.objects.get(electrodelog=new_log).stale)
+        self.assertEquals(1, stl.index_status()["pending"])
+        self.assertEquals(1, ElectrodeLogSTL.objects.index())
+        self.assertEquals(0, stl.index_status()["pending"])
+        self.assertFalse(ElectrodeLogSTL.objects.get(electrodelog=new_log).is_in)
+
+        # Moving the starting point queues every log of the electrode again
+        StartingPoint.objects.create(
+            electrode=el_77,
+            x=-11.27603690,
+            y=20.04604200,
+            z=-15.71733967,
+            x_norm=0,
+            y_norm=0,
+            z_norm=0,
+            subject=spock
+        )
+        self.assertEquals(2, stl.index_status()["pending"])
+        self.assertEquals(2, ElectrodeLogSTL.objects.index())
+        self.assertTrue(ElectrodeLogSTL.objects.get(electrodelog=new_log).is_in)
+        self.assertEquals(3, ElectrodeLogSTL.objects.count())
+
+    @override_settings(UPLOADED_PATH=UPLOADED_PATH)
+    def test_index_keeps_rows_marked_stale_meanwhile(self):
+        spock = BuffaloSubject.objects.get(nickname="Spock")
+        stl_add_url = reverse("admin:buffalo_stlfile_add") + f"?subject={spock.id}"
+        self.client.post(
+            stl_add_url,
+            {
+                "name": "hpc",
+                "stl_file": self.file_spock_stl,
+                "subject": spock.id,
+                "sync_electrodelogs": False
+            },
+            follow=True,
+            format="multipart",
+        )
+        stl = STLFile.objects.get(subject=spock.id)
+        sync_electrodelogs_stl(stl.id)
+        el_77 = Electrode.objects.get(channel_number="77")
+        new_log = ElectrodeLog.objects.create(electrode=el_77, subject=spock, turn=0)
+
+        electrodelog_distances = STLFile.electrodelog_distances
+
+        def distances_then_mark_stale(stl, electrode_logs):
+            distances = electrodelog_distances(stl, electrode_logs)
+            ElectrodeLogSTL.objects.mark_stale(ElectrodeLog.objects.filter(pk=new_log.pk))
+            return distances
+
+        with patch.object(STLFile, "electrodelog_distances", distances_then_mark_stale):
+            self.assertEquals(0, ElectrodeLogSTL.objects.index())
+        self.assertTrue(ElectrodeLogSTL.objects.get(electrodelog=new_log).stale)
+        self.assertEquals(1, ElectrodeLogSTL.objects.index())
+        self.assertFalse(ElectrodeLogSTL.objects.get(electrodelog=new_log).stale)
+
+    @override_settings(UPLOADED_PATH=UPLOADED_PATH)
+    def test_session_queries(self):
+        spock = BuffaloSubject.objects.get(nickname="Spock")
+        stl_add_url = reverse("admin:buffalo_stlfile_add") + f"?subject={spock.id}"
+        self.client.post(
+            stl_add_url,
+            {
+                "name": "hpc",
+                "stl_file": self.file_spock_stl,
+                "subject": spock.id,
+                "sync_electrodelogs": False
+            },
+            follow=True,
+            format="multipart",
+        )
+        stl = STLFile.objects.get(subject=spock.id)
+        sync_electrodelogs_stl(stl.id)
+
+        task = Task.objects.create(name="ripples task")
+        session = BuffaloSession.objects.create(
+            subject=spock, name="ripples session", start_time=timezone.now()
+        )
+        SessionTask.objects.create(session=session, task=task)
+        BuffaloDataset.objects.create(session=session, file_name="ripples.mat")
+        for channel_number in ["77", "78"]:
+            ChannelRecording.objects.create(
+                session=session,
+                electrode=Electrode.objects.get(channel_number=channel_number),
+                alive="yes",
+                ripples="yes",
+            )
+
+        with self.assertNumQueries(3):
+            sessions = list(session_queries(spock.id, task.id))
+        self.assertEquals(1, len(sessions))
+        self.assertEquals(2, len(sessions[0].ripple_recordings))
+        self.assertEquals(["ripples.mat"], [d.file_name for d in sessions[0].buffalo_datasets])
+
+        # Only the electrode 77 log is inside the mesh
+        with self.assertNumQueries(3):
+            sessions = list(session_queries(spock.id, task.id, stl.id))
+        self.assertEquals(
+            ["77"], [r.electrode.channel_number for r in sessions[0].ripple_recordings]
+        )
+
+        url = reverse("session-queries-list", kwargs={"subject_id": spock.id})
+        resp = self.client.get(url, {"task": task.id, "stl": stl.id})
+        self.assertEquals(200, resp.status_code)
+        self.assertEquals(1, resp.data["count"])
+        self.assertEquals(["77"], resp.data["results"][0]["electrodes"])
+        self.assertEquals("ripples.mat", resp.data["results"][0]["datasets"][0]["file_name"])
+        self.assertEquals(400, self.client.get(url).status_code)
+
+        starting_point_set = StartingPointSet.objects.create(name="set", subject=spock)
+        resp = self.client.post(
+            reverse("session-queries", kwargs={"subject_id": spock.id}),
+            {
+                "stl": stl.id,
+                "starting_point_set": starting_point_set.id,
+                "task": task.id,
+                "is_in_stl": True,
+            },
+        )
+        self.assertContains(resp, "ripples.mat")
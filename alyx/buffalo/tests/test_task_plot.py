@@ -0,0 +1,82 @@
+from datetime import datetime
+
+from django.test import TestCase, Client
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+
+from buffalo.queries import task_calendar
+from buffalo.models import (
+    BuffaloSubject,
+    BuffaloSession,
+    SessionTask,
+    Task,
+    TaskCategory,
+)
+
+
+class TaskPlotTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        my_admin = User.objects.create_superuser("admin", "admin@test.com", "123456")
+        self.client = Client()
+        self.client.force_login(my_admin)
+
+        self.spock = BuffaloSubject.objects.create(nickname="Spock")
+        self.foraging = TaskCategory.objects.create(name="foraging")
+        self.ymaze = Task.objects.create(name="ymaze")
+        self.forage = Task.objects.create(name="forage", category=self.foraging)
+
+        session = BuffaloSession.objects.create(
+            subject=self.spock, name="session", start_time=datetime(2020, 1, 2, 9)
+        )
+        for task, start_time in [
+            (self.ymaze, datetime(2020, 1, 2, 9)),
+            (self.ymaze, datetime(2020, 1, 2, 10)),
+            (self.forage, datetime(2020, 1, 2, 11)),
+            (self.ymaze, datetime(2021, 12, 31, 9)),
+            (self.ymaze, datetime(2022, 1, 1, 9)),
+        ]:
+            SessionTask.objects.create(session=session, task=task, start_time=start_time)
+
+    def test_task_calendar(self):
+        with self.assertNumQueries(1):
+            calendar = task_calendar(self.spock.id, 2020, 2021, tasks=[self.ymaze])
+        self.assertEquals([2020, 2021], calendar.years)
+        self.assertEquals(366 + 365, len(calendar.counts))
+        self.assertEquals(1, calendar.counts[1])
+        self.assertEquals(1, calendar.counts[-1])
+        self.assertEquals(2, calendar.counts.sum())
+
+        calendar = task_calendar(
+            self.spock.id, 2020, 2021, tasks=[self.ymaze], categories=[self.foraging]
+        )
+        self.assertEquals(2, calendar.counts[1])
+        self.assertEquals(3, calendar.counts.sum())
+
+    def test_task_calendar_reversed_years(self):
+        calendar = task_calendar(self.spock.id, 2021, 2020, tasks=[self.ymaze])
+        self.assertEquals([], calendar.years)
+        self.assertEquals(0, len(calendar.days))
+        self.assertEquals(0, len(calendar.counts))
+
+    def test_task_plot(self):
+        url = reverse("task-plot", kwargs={"subject_id": self.spock.id})
+        resp = self.client.post(
+            url,
+            {
+                "start_date": "2020",
+                "finish_date": "2021",
+                "tasks": [self.ymaze.id, self.forage.id],
+            },
+        )
+        resp = self.client.get(resp.context["figure_url"])
+        self.assertContains(resp, "2020-01-02: 2")
+
+        resp = self.client.post(url, {"start_date": "2020", "finish_date": "2021"})
+        self.assertContains(resp, "Select at least one task or category")
+
+        resp = self.client.post(
+            url, {"start_date": "2021", "finish_date": "2020", "tasks": [self.ymaze.id]}
+        )
+        self.assertContains(resp, "The start year must not be after the finish year")
+        self.assertNotIn("figure_url", resp.context)
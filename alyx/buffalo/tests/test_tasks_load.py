@@ -0,0 +1,82 @@
+import io
+from datetime import date, datetime
+
+from django.test import TestCase
+
+from buffalo.loaders import TasksImporter, load_tasks
+from buffalo.parsers import TaskEvent, parse_tasks_file, task_event
+from buffalo.models import BuffaloSubject, BuffaloSession, BuffaloDataset, SessionTask
+
+TASKS_LISTING = b"""\
+,0
+0,rig1_ymaze_behaviorlog_2021_01_02_10_00_00.txt
+1,rig1_ymaze_eyelog_2021_01_02_10_00_00.txt
+2,rig1_color_game_log_2021_01_02_09_00_00.txt
+3,rig1_ymaze_behaviorlog_2021_01_02_11_00_00.txt
+4,rig1_ymaze_behaviorlog_2021_01_02_10_00_00.txt
+5,rig1_ymaze_behaviorlog_2021_01_01_10_00_00.txt
+6,rig1_notes.txt
+"""
+
+
+class TasksLoadTests(TestCase):
+    def setUp(self):
+        self.spock = BuffaloSubject.objects.create(nickname="Spock")
+        self.session = BuffaloSession.objects.create(
+            subject=self.spock, name="existing", start_time=datetime(2021, 1, 2, 9)
+        )
+
+    def test_task_event(self):
+        self.assertEquals(
+            TaskEvent("color game", "log", datetime(2021, 1, 2, 9)),
+            task_event("rig1_color_game_log_2021_01_02_09_00_00.txt"),
+        )
+        self.assertIsNone(task_event("rig1_ymaze_log_2021_01_02.txt"))
+        self.assertIsNone(task_event("rig1_notes.txt"))
+
+    def test_parse_tasks_file(self):
+        days = list(parse_tasks_file(io.BytesIO(TASKS_LISTING)))
+        self.assertEquals([date(2021, 1, 1), date(2021, 1, 2)], [day for day, _ in days])
+        runs = days[1][1]
+        self.assertEquals(["color game", "ymaze"], [run[0].name for run in runs])
+        # The repeated behaviorlog is read once
+        self.assertEquals(3, len(runs[1]))
+
+    def test_load_tasks(self):
+        for _ in range(2):
+            runs = load_tasks(self.spock, parse_tasks_file(io.BytesIO(TASKS_LISTING)))
+        self.assertEquals(3, runs)
+        self.assertEquals(2, BuffaloSession.objects.filter(subject=self.spock).count())
+        self.assertEquals(
+            [("color game", 1), ("ymaze", 2)],
+            list(
+                SessionTask.objects.filter(session=self.session)
+                .order_by("task_sequence")
+                .values_list("task__name", "task_sequence")
+            ),
+        )
+        self.assertEquals(
+            5, BuffaloDataset.objects.filter(session_task__session__subject=self.spock).count()
+        )
+
+    def test_load_tasks_dry_run(self):
+        importer = TasksImporter(self.spock, dry_run=True)
+        self.assertEquals(3, importer.load(parse_tasks_file(io.BytesIO(TASKS_LISTING))))
+        self.assertEquals(1, BuffaloSession.objects.filter(subject=self.spock).count())
+        self.assertFalse(SessionTask.objects.exists())
+        summary = importer.changeset.summary()
+        self.assertEquals(
+            {
+                "BuffaloSession": 1,
+                "Task": 2,
+                "SessionTask": 3,
+                "BuffaloDataset": 5,
+                "DatasetType": 3,
+            },
+            summary["insert"],
+        )
+
+        load_tasks(self.spock, parse_tasks_file(io.BytesIO(TASKS_LISTING)))
+        importer = TasksImporter(self.spock, dry_run=True)
+        importer.load(parse_tasks_file(io.BytesIO(TASKS_LISTING)))
+        self.assertEquals([], importer.changeset.rows)
@@ -11,13 +11,21 @@ from buffalo.views import (
     ElectrodeLogBulkLoadView,
     ChannelRecordingBulkLoadView,
     PlotsView,
+    PlotFigureView,
     SessionQueriesView,
+    SessionQueriesList,
     SessionsLoadView,
     TasksLoadView,
     FoodWeightView,
     ElectrodeLogPlotView,
+    ElectrodeLogSeriesView,
     TaskPlotView,
     ElectrodeStatusPlotView,
+    ElectrodeStatusJsonView,
+    BuffaloAsyncTaskView,
+    BuffaloAsyncTaskStatusView,
+    BuffaloAsyncTaskDiffView,
+    STLMeshView,
 )
 
 urlpatterns = [
@@ -68,11 +76,21 @@ urlpatterns = [
         login_required(PlotsView.as_view(), login_url="/login/",),
         name="plots",
     ),
+    path(
+        "plots-figure/<uuid:subject_id>",
+        login_required(PlotFigureView.as_view(plot_view=PlotsView), login_url="/login/",),
+        name="plots-figure",
+    ),
     path(
         "session-queries/<uuid:subject_id>",
         SessionQueriesView.as_view(),
         name="session-queries",
     ),
+    path(
+        "session-queries-list/<uuid:subject_id>",
+        SessionQueriesList.as_view(),
+        name="session-queries-list",
+    ),
     path(
         "sessions-load/<uuid:subject_id>",
         SessionsLoadView.as_view(),
@@ -88,19 +106,73 @@ urlpatterns = [
         login_required(FoodWeightView.as_view(), login_url="/login/",),
         name="food-weight-plot",
     ),
+    path(
+        "food-weight-plot-figure/<uuid:subject_id>",
+        login_required(PlotFigureView.as_view(plot_view=FoodWeightView), login_url="/login/",),
+        name="food-weight-plot-figure",
+    ),
     path(
         "electrodelog-plot/<uuid:subject_id>",
         login_required(ElectrodeLogPlotView.as_view(), login_url="/login/",),
         name="electrodelog-plot",
     ),
+    path(
+        "electrodelog-plot-figure/<uuid:subject_id>",
+        login_required(
+            PlotFigureView.as_view(plot_view=ElectrodeLogPlotView), login_url="/login/",
+        ),
+        name="electrodelog-plot-figure",
+    ),
+    path(
+        "electrodelog-series/<uuid:subject_id>",
+        login_required(ElectrodeLogSeriesView.as_view(), login_url="/login/",),
+        name="electrodelog-series",
+    ),
     path(
         "task-plot/<uuid:subject_id>",
         login_required(TaskPlotView.as_view(), login_url="/login/",),
         name="task-plot",
     ),
+    path(
+        "task-plot-figure/<uuid:subject_id>",
+        login_required(PlotFigureView.as_view(plot_view=TaskPlotView), login_url="/login/",),
+        name="task-plot-figure",
+    ),
     path(
         "electrode-status-plot/<uuid:subject_id>",
         login_required(ElectrodeStatusPlotView.as_view(), login_url="/login/",),
         name="electrode-status-plot",
     ),
+    path(
+        "electrode-status-plot-figure/<uuid:subject_id>",
+        login_required(
+            PlotFigureView.as_view(plot_view=ElectrodeStatusPlotView), login_url="/login/",
+        ),
+        name="electrode-status-plot-figure",
+    ),
+    path(
+        "electrode-status-json/<uuid:subject_id>",
+        login_required(ElectrodeStatusJsonView.as_view(), login_url="/login/",),
+        name="electrode-status-json",
+    ),
+    path(
+        "stl-mesh/<uuid:stl_id>/<str:lod>",
+        login_required(STLMeshView.as_view(), login_url="/login/",),
+        name="stl-mesh",
+    ),
+    path(
+        "buffalo-async-task/<uuid:task_id>",
+        login_required(BuffaloAsyncTaskView.as_view(), login_url="/login/",),
+        name="buffalo-async-task",
+    ),
+    path(
+        "buffalo-async-task-status/<uuid:task_id>",
+        login_required(BuffaloAsyncTaskStatusView.as_view(), login_url="/login/",),
+        name="buffalo-async-task-status",
+    ),
+    path(
+        "buffalo-async-task-diff/<uuid:task_id>",
+        login_required(BuffaloAsyncTaskDiffView.as_view(), login_url="/login/",),
+        name="buffalo-async-task-diff",
+    ),
 ]
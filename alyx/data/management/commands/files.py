@@ -4,7 +4,7 @@ from django.db.models import Count, Q
 
 from actions.models import Session
 from data import transfers
-from data.models import Dataset, DatasetType, DataRepository, FileRecord
+from data.models import Dataset, DataRepository, FileRecord
 from misc.models import Lab
 logging.getLogger(__name__).setLevel(logging.WARNING)
 
@@ -185,11 +185,10 @@ class Command(BaseCommand):
             dr.data_url = 'http://ibl.flatironinstitute.org/cortexlab/Subjects/'
             dr.save()
 
-            qs = DatasetType.objects.filter(filename_pattern__isnull=False)
             dt = None
             for d in FileRecord.objects.all().select_related('dataset'):
                 try:
-                    dt = transfers.get_dataset_type(d.relative_path, qs=qs)
+                    dt = transfers.get_dataset_type(d.relative_path)
                 except ValueError:
                     dt = None
                     continue
@@ -1,3 +1,140 @@
-# from django.test import TestCase
+import uuid
 
-# Create your tests here.
+from django.test import TestCase
+
+from data.models import DataFormat, DataRepository, Dataset, DatasetType, FileRecord
+from data.transfers import (
+    _add_uuid_to_filename, _bulk_transfer, bulk_sync, get_data_format, get_dataset_type)
+
+
+class FilenamePatternsTests(TestCase):
+    def setUp(self):
+        DatasetType.objects.create(name='spikes.times', filename_pattern='spikes.times.*')
+        DatasetType.objects.create(name='spikes.clusters', filename_pattern='spikes.clusters*')
+        DatasetType.objects.create(name='timestamps', filename_pattern='*.timestamps.*')
+        DataFormat.objects.create(name='npy', file_extension='.npy')
+
+    def test_get_dataset_type(self):
+        self.assertEqual('spikes.times', get_dataset_type('alf/Spikes.Times.npy').name)
+        self.assertEqual('spikes.clusters', get_dataset_type('spikes.clusters.npy').name)
+        self.assertEqual('timestamps', get_dataset_type('camera.timestamps.npy').name)
+        with self.assertRaisesMessage(ValueError, 'No dataset type found'):
+            get_dataset_type('clusters.depths.npy')
+
+        DatasetType.objects.create(name='spikes', filename_pattern='spikes.*')
+        with self.assertRaisesMessage(
+                ValueError, 'Multiple matching dataset types found for filename '
+                '`spikes.times.npy`: <DatasetType spikes>, <DatasetType spikes.times>'):
+            get_dataset_type('spikes.times.npy')
+
+    def test_get_data_format(self):
+        get_dataset_type('spikes.times.npy')
+        with self.assertNumQueries(0):
+            self.assertEqual('npy', get_data_format('spikes.times.npy').name)
+            self.assertEqual('spikes.times', get_dataset_type('spikes.times.npy').name)
+        with self.assertRaises(DataFormat.DoesNotExist):
+            get_data_format('spikes.times.csv')
+
+        DataFormat.objects.create(name='csv', file_extension='.csv')
+        self.assertEqual('csv', get_data_format('spikes.times.csv').name)
+
+
+class FakeTransferClient:
+    """Globus transfer client listing the files given as {endpoint: {path: {name: size}}}"""
+
+    def __init__(self, files, disconnected=()):
+        self.files = files
+        self.disconnected = disconnected
+        self.listed = []
+        self.submitted = []
+
+    def get_endpoint(self, endpoint_id):
+        return {'display_name': str(endpoint_id),
+                'gcp_connected': False if endpoint_id in self.disconnected else None}
+
+    def get_submission_id(self):
+        return {'value': str(uuid.uuid4())}
+
+    def submit_transfer(self, data):
+        self.submitted.append(data)
+        return {'task_id': data['submission_id']}
+
+    def operation_ls(self, endpoint_id, path=None):
+        self.listed.append((endpoint_id, path))
+        return [{'name': name, 'size': size}
+                for name, size in self.files[endpoint_id].get(path, {}).items()]
+
+
+class BulkSyncTests(TestCase):
+    def setUp(self):
+        self.flatiron = DataRepository.objects.create(
+            name='flatiron', globus_path='/flatiron/', globus_endpoint_id=uuid.uuid4(),
+            globus_is_personal=False)
+        self.local = DataRepository.objects.create(
+            name='local', globus_path='/local/', globus_endpoint_id=uuid.uuid4(),
+            globus_is_personal=True)
+        self.datasets = []
+        self.file_records = {}
+        for name in ('spikes.times.npy', 'spikes.clusters.npy'):
+            dataset = Dataset.objects.create(name=name, file_size=1)
+            self.datasets.append(dataset)
+            for repo, exists in ((self.flatiron, False), (self.local, True)):
+                self.file_records[(name, repo.name)] = FileRecord.objects.create(
+                    dataset=dataset, data_repository=repo, exists=exists,
+                    relative_path='Spock/2021-01-01/001/alf/' + name)
+
+    def test_bulk_sync(self):
+        times = self.datasets[0]
+        tc = FakeTransferClient({
+            self.flatiron.globus_endpoint_id: {'/flatiron/Spock/2021-01-01/001/alf': {
+                _add_uuid_to_filename('spikes.times.npy', times.pk): 10}},
+            self.local.globus_endpoint_id: {'/local/Spock/2021-01-01/001/alf': {
+                'spikes.times.npy': 10}},
+        })
+        bulk_sync(tc=tc)
+        self.assertEqual(2, len(tc.listed))
+        exists = {key: FileRecord.objects.get(pk=fr.pk).exists
+                  for key, fr in self.file_records.items()}
+        self.assertEqual({
+            ('spikes.times.npy', 'flatiron'): True,
+            ('spikes.times.npy', 'local'): True,
+            ('spikes.clusters.npy', 'flatiron'): False,
+            ('spikes.clusters.npy', 'local'): False,
+        }, exists)
+        times.refresh_from_db()
+        self.assertEqual(10, times.file_size)
+
+    def test_bulk_sync_disconnected_endpoint(self):
+        tc = FakeTransferClient({self.flatiron.globus_endpoint_id: {}},
+                                disconnected=(self.local.globus_endpoint_id,))
+        bulk_sync(tc=tc)
+        self.assertEqual([(self.flatiron.globus_endpoint_id,
+                           '/flatiron/Spock/2021-01-01/001/alf')], tc.listed)
+        self.assertEqual(
+            2, FileRecord.objects.filter(data_repository=self.local, exists=True).count())
+
+    def test_bulk_transfer(self):
+        remote = DataRepository.objects.create(
+            name='remote', globus_path='/remote/', globus_endpoint_id=uuid.uuid4(),
+            globus_is_personal=False)
+        times = self.datasets[0]
+        FileRecord.objects.create(dataset=times, data_repository=remote, exists=False,
+                                  relative_path='Spock/2021-01-01/001/alf/spikes.times.npy')
+        self.datasets[1].file_records.update(exists=False)
+
+        plan = _bulk_transfer(dry_run=True)
+        self.assertEqual(2, len(plan))
+        self.assertEqual({(self.local, self.flatiron), (self.local, remote)}, set(plan.transfers))
+        self.assertEqual(
+            ('/local/Spock/2021-01-01/001/alf/spikes.times.npy',
+             _add_uuid_to_filename('/flatiron/Spock/2021-01-01/001/alf/spikes.times.npy',
+                                   times.pk), 1),
+            plan.transfers[(self.local, self.flatiron)][0])
+        self.assertEqual(2, len(list(plan.chunks(max_files=1))))
+        self.assertEqual(0, len(_bulk_transfer(dry_run=True, minsize=1)))
+
+        tc = FakeTransferClient({})
+        _bulk_transfer(tc=tc)
+        self.assertEqual(2, len(tc.submitted))
+        self.assertEqual(
+            {'local to flatiron', 'local to remote'}, {data['label'] for data in tc.submitted})
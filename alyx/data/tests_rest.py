@@ -3,6 +3,8 @@ import os.path as op
 import uuid
 
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from alyx.base import BaseTests
@@ -246,6 +248,40 @@ class APIDataTests(BaseTests):
         with self.assertRaises(Exception):
             self.post(reverse('register-file'), data)
 
+    def test_register_files_batch(self):
+        self.post(reverse('datarepository-list'), {'name': 'dra1', 'hostname': 'hosta1'})
+        self.post(reverse('lab-list'), {'name': 'laba', 'repositories': ['dra1']})
+        data = {'path': '%s/2018-01-01/2/dir' % self.subject,
+                'filenames': 'a.a.e1',
+                'name': 'dr',
+                'labs': 'laba',
+                'filesizes': '10',
+                }
+        # the session is created by the first registration
+        self.ar(self.post(reverse('register-file'), dict(data, filenames='a.b.e1')), 201)
+        with CaptureQueriesContext(connection) as one_file:
+            self.ar(self.post(reverse('register-file'), data), 201)
+        data['filenames'] = 'a.a.e1,a.b.e1,a.c.e1,a.d.e2,alf/a.a.e1'
+        data['filesizes'] = '10,20,30,40,50'
+        with CaptureQueriesContext(connection) as five_files:
+            r = self.post(reverse('register-file'), data)
+        self.ar(r, 201)
+        # the existing datasets and file records are fetched and updated in bulk
+        self.assertLessEqual(len(five_files), len(one_file) + 3)
+        self.assertEqual(['a.a.e1', 'a.b.e1', 'a.c.e1', 'a.d.e2', 'a.a.e1'],
+                         [d['name'] for d in r.data])
+        self.assertEqual(2, Dataset.objects.filter(name='a.a.e1').count())
+        self.assertEqual(2, len(r.data[4]['file_records']))
+
+        # a file size change resets the file records existence to the registering repository
+        FileRecord.objects.filter(data_repository__name='dra1').update(exists=True)
+        data['filesizes'] = '10,20,30,40,55'
+        self.ar(self.post(reverse('register-file'), data), 201)
+        self.assertEqual(
+            ['alf/a.a.e1'],
+            [op.relpath(fr.relative_path, data['path']) for fr in
+             FileRecord.objects.filter(data_repository__name='dra1', exists=False)])
+
     def test_register_files_hostname(self):
         # this is old use case where we register one dataset according to the hostname, no need
         # for a lab in this case. NB the reverse doesn't work with lists while the true endpoint
@@ -361,3 +397,24 @@ class APIDataTests(BaseTests):
         })
         self.assertEqual(len(r.data['download']), 3)
         self.assertEqual(Download.objects.filter(projects__name='tp3').count(), 3)
+        self.assertEqual(r.data['count'], [5, 1, 1])
+
+        # logging more datasets does not issue more queries
+        for i in range(4, 10):
+            r = self.post(reverse('dataset-list'), {
+                'name': 'mydataset%d' % i, 'dataset_type': 'dst', 'data_format': 'df'})
+            pks.append(r.data['url'][r.data['url'].rindex('/') + 1:])
+        with CaptureQueriesContext(connection) as three_datasets:
+            self.ar(self.post(reverse('new-download'), {
+                'datasets': ','.join(pks[:2] + pks[3:4]), 'projects': 'tp1,tp3'}), 201)
+        with CaptureQueriesContext(connection) as nine_datasets:
+            r = self.post(reverse('new-download'), {
+                'datasets': ','.join(pks), 'projects': 'tp1,tp3'})
+        self.ar(r, 201)
+        self.assertEqual(len(nine_datasets), len(three_datasets))
+        self.assertEqual(r.data['count'], [7, 3, 2, 2] + [1] * 5)
+
+        # an unknown dataset is not logged
+        with self.assertRaises(Dataset.DoesNotExist):
+            self.post(reverse('new-download'), {'datasets': '%s,%s' % (pks[0], uuid.uuid4())})
+        self.assertEqual(Download.objects.get(dataset=pks[0]).count, 7)
@@ -3,18 +3,30 @@ import logging
 import os
 import os.path as op
 import re
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from django.db import transaction
 from django.db.models import Case, When, Count, Q
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 import globus_sdk
-import numpy as np
 
 from alyx import settings
-from data.models import FileRecord, Dataset, DatasetType, DataFormat, DataRepository
+from data.models import FileRecord, Dataset, DatasetType, DataFormat
 from actions.models import Session
 
 logger = logging.getLogger(__name__)
 
+# Globus directories listed at once by bulk_sync, and rows saved per query
+BULK_SYNC_WORKERS = 8
+BULK_SYNC_BATCH_SIZE = 1000
+# Files per Globus transfer task of bulk_transfer, and transfer tasks submitted at once
+TRANSFER_MAX_FILES = 10000
+TRANSFER_SUBMIT_WORKERS = 4
+
 # Login
 # ------------------------------------------------------------------------------------------------
 
@@ -170,33 +182,104 @@ def globus_file_exists(file_record):
     return False
 
 
+# The process-wide filename patterns are rebuilt after this many seconds, for the changes
+# saved by other processes, and right away when this process saves a dataset type or format
+FILENAME_PATTERNS_MAX_AGE = 60
+
+
+def _pattern_regex(pattern):
+    return pattern.replace('.', r'\.').replace('_', r'\_').replace('*', r'.*')
+
+
 def _filename_matches_pattern(filename, pattern):
     filename = op.basename(filename)
-    reg = pattern.replace('.', r'\.').replace('_', r'\_').replace('*', r'.*')
-    return re.match(reg, filename, re.IGNORECASE)
+    return re.match(_pattern_regex(pattern), filename, re.IGNORECASE)
+
+
+class FilenamePatterns:
+    """
+    Compiled filename patterns of the dataset types and file extensions of the data formats.
+    A pattern starting with a literal ALF part ('spikes.times.*') can only match the filenames
+    starting with that part, so the patterns are indexed by it and a filename is matched
+    against the patterns of its first part and the ones starting with a wildcard only.
+    """
+
+    def __init__(self, dataset_types, data_formats=()):
+        self.created = time.monotonic()
+        self.by_first_part = defaultdict(list)
+        self.other_patterns = []
+        for position, dt in enumerate(dataset_types):
+            if not dt.filename_pattern.strip():
+                continue
+            compiled = (position, re.compile(_pattern_regex(dt.filename_pattern), re.IGNORECASE),
+                        dt)
+            first_part, dot, _ = dt.filename_pattern.partition('.')
+            if dot and re.fullmatch(r'[\w-]+', first_part):
+                self.by_first_part[first_part.lower()].append(compiled)
+            else:
+                self.other_patterns.append(compiled)
+        self.data_formats = defaultdict(list)
+        for data_format in data_formats:
+            self.data_formats[data_format.file_extension].append(data_format)
+
+    def dataset_type(self, filename):
+        basename = op.basename(filename)
+        patterns = self.by_first_part.get(basename.partition('.')[0].lower(), [])
+        dataset_types = [
+            dt for _, regex, dt in sorted(
+                patterns + self.other_patterns, key=lambda compiled: compiled[0])
+            if regex.match(basename)
+        ]
+        n = len(dataset_types)
+        if n == 0:
+            raise ValueError("No dataset type found for filename `%s`" % filename)
+        elif n >= 2:
+            raise ValueError("Multiple matching dataset types found for filename `%s`: %s" % (
+                filename, ', '.join(map(str, dataset_types))))
+        return dataset_types[0]
+
+    def data_format(self, filename):
+        file_extension = op.splitext(filename)[-1]
+        data_formats = self.data_formats.get(file_extension, [])
+        if not data_formats:
+            raise DataFormat.DoesNotExist(
+                "No data format found for file extension `%s`" % file_extension)
+        elif len(data_formats) >= 2:
+            raise DataFormat.MultipleObjectsReturned(
+                "Multiple matching data formats found for file extension `%s`" % file_extension)
+        return data_formats[0]
+
+
+_filename_patterns = None
+
+
+def filename_patterns():
+    """The FilenamePatterns of all the dataset types and data formats, shared by the process"""
+    global _filename_patterns
+    patterns = _filename_patterns
+    if patterns is None or time.monotonic() - patterns.created > FILENAME_PATTERNS_MAX_AGE:
+        patterns = FilenamePatterns(
+            DatasetType.objects.filter(filename_pattern__isnull=False), DataFormat.objects.all())
+        _filename_patterns = patterns
+    return patterns
+
+
+@receiver([post_save, post_delete], sender=DatasetType)
+@receiver([post_save, post_delete], sender=DataFormat)
+def clear_filename_patterns(sender, **kwargs):
+    global _filename_patterns
+    _filename_patterns = None
 
 
 def get_dataset_type(filename, qs=None):
-    dataset_types = []
-    qs = qs or DatasetType.objects.filter(filename_pattern__isnull=False)
-    for dt in qs:
-        if not dt.filename_pattern.strip():
-            continue
-        if _filename_matches_pattern(filename, dt.filename_pattern):
-            dataset_types.append(dt)
-    n = len(dataset_types)
-    if n == 0:
-        raise ValueError("No dataset type found for filename `%s`" % filename)
-    elif n >= 2:
-        raise ValueError("Multiple matching dataset types found for filename `%s`: %s" % (
-            filename, ', '.join(map(str, dataset_types))))
-    return dataset_types[0]
+    if qs is not None:
+        return FilenamePatterns(qs).dataset_type(filename)
+    return filename_patterns().dataset_type(filename)
 
 
 def get_data_format(filename):
-    file_extension = op.splitext(filename)[-1]
     # This raises an error if there is 0 or 2+ matching data formats.
-    return DataFormat.objects.get(file_extension=file_extension)
+    return filename_patterns().data_format(filename)
 
 
 def _get_repositories_for_labs(labs, server_only=False):
@@ -215,55 +298,108 @@ def _create_dataset_file_records(
         rel_dir_path=None, filename=None, session=None, user=None,
         repositories=None, exists_in=None, collection=None, hash=None,
         file_size=None, version=None):
+    files = [dict(filename=filename, collection=collection, hash=hash,
+                  file_size=file_size, version=version)]
+    return _create_datasets_file_records(
+        rel_dir_path=rel_dir_path, files=files, session=session, user=user,
+        repositories=repositories, exists_in=exists_in)[0]
 
-    assert session is not None
 
-    relative_path = op.join(rel_dir_path, collection or '', filename)
-    dataset_type = get_dataset_type(filename)
-    data_format = get_data_format(filename)
-    assert dataset_type
-    assert data_format
-
-    # Create the dataset.
-    dataset, _ = Dataset.objects.get_or_create(
-        collection=collection, name=filename, session=session,
-        dataset_type=dataset_type, data_format=data_format)
-    # The user doesn't have to be the same when getting an existing dataset, but we still
-    # have to set the created_by field.
-    dataset.created_by = user
-    if version is not None:
-        dataset.version = version
+def _create_datasets_file_records(
+        rel_dir_path=None, files=(), session=None, user=None,
+        repositories=None, exists_in=None):
     """
-    if a hash/filesize is provided, label the dataset with it
-    if there was a hash and or filesize in the datset and the provided items are different,
-    then set the existing file records exists field to False
+    Creates or updates the datasets of the files of a session and their file records, one per
+    repository. The files are dicts with the filename, collection, hash, file_size and version
+    keys. The dataset types and formats are resolved by the cached filename patterns, the
+    existing datasets and file records are fetched with one query each and the rest is written
+    in bulk. Returns the dataset of each file.
     """
-    is_patched = False
-    if hash is not None:
-        if dataset.hash is not None:
-            is_patched = not(dataset.hash == hash)
-        dataset.hash = hash
-    if file_size is not None:
-        dataset.file_size = file_size
-        is_patched = not(dataset.file_size == file_size)
-    # Validate the fields.
-    dataset.full_clean()
-    dataset.save()
-
-    # Create one file record per repository.
-    exists_in = exists_in or ()
-    for repo in repositories:
-        exists = repo in exists_in
-        # Do not create a new file record if it already exists.
-        fr, is_new = FileRecord.objects.get_or_create(
-            dataset=dataset, data_repository=repo, relative_path=relative_path)
-        if is_new or is_patched:
-            fr.exists = exists
-        # Validate the fields.
-        fr.full_clean()
-        fr.save()
+    assert session is not None
+    files = list(files)
+    filenames = [file['filename'] for file in files]
+    patterns = filename_patterns()
+
+    existing_datasets = {
+        (ds.collection, ds.name, ds.dataset_type_id, ds.data_format_id): ds
+        for ds in Dataset.objects.filter(session=session, name__in=filenames)
+    }
+    datasets = []
+    new_datasets = {}
+    patched = set()
+    for file in files:
+        filename = file['filename']
+        dataset_type = patterns.dataset_type(filename)
+        data_format = patterns.data_format(filename)
+        key = (file['collection'], filename, dataset_type.pk, data_format.pk)
+        dataset = existing_datasets.get(key) or new_datasets.get(key)
+        if dataset is None:
+            dataset = Dataset(
+                collection=file['collection'], name=filename, session=session,
+                dataset_type=dataset_type, data_format=data_format)
+            new_datasets[key] = dataset
+        # The user doesn't have to be the same when getting an existing dataset, but we still
+        # have to set the created_by field.
+        dataset.created_by = user
+        if file['version'] is not None:
+            dataset.version = file['version']
+        # if a hash/filesize is provided, label the dataset with it
+        # if there was a hash and or filesize in the datset and the provided items are different,
+        # then set the existing file records exists field to False
+        if file['hash'] is not None:
+            if dataset.hash is not None and dataset.hash != file['hash']:
+                patched.add(dataset.pk)
+            dataset.hash = file['hash']
+        if file['file_size'] is not None:
+            file_size = Dataset._meta.get_field('file_size').to_python(file['file_size'])
+            if dataset.file_size is not None and dataset.file_size != file_size:
+                patched.add(dataset.pk)
+            dataset.file_size = file_size
+        datasets.append(dataset)
+
+    # The foreign keys are the objects resolved above and the unicity is checked by the lookups
+    dataset_fks = ['session', 'created_by', 'provenance_directory', 'dataset_type', 'data_format']
+    unique_datasets = list({dataset.pk: dataset for dataset in datasets}.values())
+    for dataset in unique_datasets:
+        dataset.full_clean(exclude=dataset_fks, validate_unique=False)
 
-    return dataset
+    exists_in = exists_in or ()
+    relative_paths = {
+        dataset.pk: op.join(rel_dir_path, dataset.collection or '', dataset.name)
+        for dataset in unique_datasets
+    }
+    existing_file_records = {
+        (fr.dataset_id, fr.data_repository_id, fr.relative_path): fr
+        for fr in FileRecord.objects.filter(
+            dataset__in=[ds.pk for ds in existing_datasets.values()],
+            data_repository__in=repositories,
+            relative_path__in=relative_paths.values(),
+        )
+    }
+    new_file_records = []
+    updated_file_records = []
+    for dataset in unique_datasets:
+        for repo in repositories:
+            # Do not create a new file record if it already exists.
+            fr = existing_file_records.get((dataset.pk, repo.pk, relative_paths[dataset.pk]))
+            if fr is None:
+                fr = FileRecord(
+                    dataset=dataset, data_repository=repo,
+                    relative_path=relative_paths[dataset.pk], exists=repo in exists_in)
+                fr.full_clean(exclude=['dataset', 'data_repository'], validate_unique=False)
+                new_file_records.append(fr)
+            elif dataset.pk in patched:
+                fr.exists = repo in exists_in
+                updated_file_records.append(fr)
+
+    updated_datasets = [dataset for dataset in unique_datasets if not dataset._state.adding]
+    with transaction.atomic():
+        Dataset.objects.bulk_create(new_datasets.values())
+        Dataset.objects.bulk_update(
+            updated_datasets, ['created_by', 'version', 'hash', 'file_size'])
+        FileRecord.objects.bulk_create(new_file_records)
+        FileRecord.objects.bulk_update(updated_file_records, ['exists'])
+    return datasets
 
 
 def iter_registered_directories(data_repository=None, tc=None, path=None):
@@ -351,13 +487,23 @@ def transfers_required(dataset):
             }
 
 
-def bulk_sync(dry_run=False, lab=None):
+def _globus_ls_sizes(tc, endpoint_id, path):
+    """Size of the files of a Globus directory by name, none if it can't be listed"""
+    try:
+        return {gfil['name']: gfil['size'] for gfil in tc.operation_ls(endpoint_id, path=path)}
+    except globus_sdk.exc.TransferAPIError:
+        return {}
+
+
+def bulk_sync(dry_run=False, lab=None, tc=None, max_workers=BULK_SYNC_WORKERS):
     """
     updates the Alyx database file records field 'exists' by looking at each Globus repository.
     Only the files belonging to a dataset for which one main repository as a missing file are
     checked on the Globus endpoints (a main repository is a repository with the
     globus_is_personnal field set to False). Also fills dataset size if non-existent.
     This is meant to be launched before the transfer() function
+    The file records are grouped by endpoint and directory, the directories are listed
+    concurrently by max_workers threads and the changes are saved in bulk at the end.
     """
     dfs = FileRecord.objects.filter(exists=False, data_repository__globus_is_personal=False)
     if lab:
@@ -372,127 +518,177 @@ def bulk_sync(dry_run=False, lab=None):
             print(l)
         return fvals
 
-    gc = globus_transfer_client()
-    # loop over all files concerned by a transfer and update the exists and filesize fields
-    files_to_ls = all_files.order_by('data_repository__globus_endpoint_id', 'relative_path')
-    _last_ep = None
-    _last_path = None
-    nfiles = files_to_ls.count()
-    c = 0
-    for qf in files_to_ls:
-        c += 1
-        # if the last endpoint has already been queried, do not repeat the query
-        if _last_ep != qf.data_repository.globus_endpoint_id:
-            _last_ep = qf.data_repository.globus_endpoint_id
-            ep_info = gc.get_endpoint(_last_ep)
-        # if the endpoint is not connected skip
-        # NB: the non-personal endpoints have a None so need to explicitly test for False
+    tc = tc or globus_transfer_client()
+    # group the files concerned by a transfer by endpoint and directory, listed once each
+    directories = defaultdict(list)
+    files_to_ls = all_files.order_by(
+        'data_repository__globus_endpoint_id', 'relative_path').values_list(
+        'pk', 'relative_path', 'exists', 'dataset_id', 'dataset__file_size',
+        'data_repository__name', 'data_repository__globus_endpoint_id',
+        'data_repository__globus_path')
+    for pk, relative_path, exists, dataset_id, file_size, repo, endpoint_id, globus_path in \
+            files_to_ls.iterator():
+        cpath, fil = os.path.split(relative_path)
+        directories[(endpoint_id, globus_path + cpath)].append(
+            (pk, relative_path, fil, exists, dataset_id, file_size, repo))
+
+    # if the endpoint is not connected skip its files
+    # NB: the non-personal endpoints have a None so need to explicitly test for False
+    unreachable = set()
+    for endpoint_id in {endpoint_id for endpoint_id, _ in directories}:
+        ep_info = tc.get_endpoint(endpoint_id)
         if ep_info['gcp_connected'] is False:
             logger.warning('UNREACHABLE Endpoint "' + ep_info['display_name'] +
-                           '" (' + str(_last_ep) + ') ' + qf.relative_path)
-            continue
-        # if we already listed the current path of the endpoint, do not repeat the rest ls command
-        cpath, fil = os.path.split(qf.relative_path)
-        fil_uuid = _add_uuid_to_filename(fil, qf.dataset_id)
-        cpath = qf.data_repository.globus_path + cpath
-        if _last_path != cpath:
-            _last_path = cpath
-            try:
-                logger.info(str(c) + '/' + str(nfiles) + ' ls ' + cpath + ' on ' + str(_last_ep))
-                ls_result = gc.operation_ls(_last_ep, path=_last_path)
-            except globus_sdk.exc.TransferAPIError:
-                ls_result = []
-        # compare the current file against the ls list, update the file_size if necessary
-        exists = False
-        for ind, gfil in enumerate(ls_result):
-            if gfil['name'] in (fil_uuid, fil):
-                exists = True
-                if qf.dataset.file_size != gfil['size']:
-                    qf.dataset.file_size = gfil['size']
-                    qf.dataset.save()
-                break
-        # update the filerecord exists field if needed
-        if qf.exists != exists:
-            qf.exists = exists
-            qf.save()
-            logger.info(str(c) + '/' + str(nfiles) + ' ' + str(qf.data_repository.name) + ':' +
-                        qf.relative_path + ' exist set to ' + str(exists) + ' in Alyx')
+                           '" (' + str(endpoint_id) + ')')
+            unreachable.add(endpoint_id)
+    directories = {key: files for key, files in directories.items() if key[0] not in unreachable}
+
+    # compare the files against the ls of their directory, update the exists and file_size
+    exists_changes = {True: [], False: []}
+    file_sizes = {}
+    ndirs = len(directories)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        listings = executor.map(lambda key: _globus_ls_sizes(tc, *key), directories)
+        for c, ((endpoint_id, cpath), sizes) in enumerate(zip(directories, listings), 1):
+            logger.info(str(c) + '/' + str(ndirs) + ' ls ' + cpath + ' on ' + str(endpoint_id))
+            for pk, relative_path, fil, exists, dataset_id, file_size, repo in \
+                    directories[(endpoint_id, cpath)]:
+                size = sizes.get(_add_uuid_to_filename(fil, dataset_id), sizes.get(fil))
+                if size is not None and file_size != size:
+                    file_sizes[dataset_id] = size
+                if exists != (size is not None):
+                    exists_changes[size is not None].append(pk)
+                    logger.info(str(repo) + ':' + relative_path + ' exist set to ' +
+                                str(size is not None) + ' in Alyx')
+
+    for exists, pks in exists_changes.items():
+        for start in range(0, len(pks), BULK_SYNC_BATCH_SIZE):
+            FileRecord.objects.filter(pk__in=pks[start:start + BULK_SYNC_BATCH_SIZE]).update(
+                exists=exists)
+    dataset_ids = list(file_sizes)
+    for start in range(0, len(dataset_ids), BULK_SYNC_BATCH_SIZE):
+        datasets = list(Dataset.objects.select_related(None).only('file_size').filter(
+            pk__in=dataset_ids[start:start + BULK_SYNC_BATCH_SIZE]))
+        for dataset in datasets:
+            dataset.file_size = file_sizes[dataset.pk]
+        Dataset.objects.bulk_update(datasets, ['file_size'])
 
 
 def _filename_from_file_record(fr, add_uuid=False):
     fn = fr.data_repository.globus_path + fr.relative_path
     if add_uuid:
-        fn = _add_uuid_to_filename(fn, fr.dataset.pk)
+        fn = _add_uuid_to_filename(fn, fr.dataset_id)
     return fn
 
 
-def bulk_transfer(dry_run=False, lab=None):
+class TransferPlan:
     """
-    uploads files from a local Globus repository to a main repository if the file on the main
-    repository does not exist.
-    should be launched after bulk_sync() function
+    The files to upload from the local Globus repositories to the main ones, grouped by
+    (source, destination) repositories. Each group is submitted as one or more Globus
+    transfer tasks, chunked by number of files and bytes.
     """
-    # splits the jobs in one for small files and another for big files so that big raw
-    # ephys files don't hold the transfer of small behaviour/training files
-    _bulk_transfer(dry_run=dry_run, lab=lab, maxsize=1024 ** 3)
-    _bulk_transfer(dry_run=dry_run, lab=lab, minsize=1024 ** 3)
-
 
-def _bulk_transfer(dry_run=False, lab=None, maxsize=None, minsize=None):
-    if not dry_run:
-        gc = globus_transfer_client()
+    def __init__(self):
+        self.transfers = defaultdict(list)
+
+    def add(self, source_repo, destination_repo, source_path, destination_path, file_size=None):
+        self.transfers[(source_repo, destination_repo)].append(
+            (source_path, destination_path, file_size or 0))
+
+    def __len__(self):
+        return sum(len(items) for items in self.transfers.values())
+
+    def chunks(self, max_files=None, max_bytes=None):
+        """Yields the (source repo, destination repo, items) of each transfer task"""
+        for (source_repo, destination_repo), items in self.transfers.items():
+            chunk = []
+            chunk_bytes = 0
+            for item in items:
+                if chunk and ((max_files and len(chunk) >= max_files) or
+                              (max_bytes and chunk_bytes + item[2] > max_bytes)):
+                    yield source_repo, destination_repo, chunk
+                    chunk = []
+                    chunk_bytes = 0
+                chunk.append(item)
+                chunk_bytes += item[2]
+            if chunk:
+                yield source_repo, destination_repo, chunk
+
+    def submit(self, tc, max_files=TRANSFER_MAX_FILES, max_bytes=None,
+               max_workers=TRANSFER_SUBMIT_WORKERS):
+        """Submits the transfer tasks, max_workers at once, returns the Globus responses"""
+        def submit_chunk(chunk):
+            source_repo, destination_repo, items = chunk
+            tdata = globus_sdk.TransferData(
+                tc,
+                source_endpoint=source_repo.globus_endpoint_id,
+                destination_endpoint=destination_repo.globus_endpoint_id,
+                verify_checksum=True,
+                sync_level='checksum',
+                label=source_repo.name + ' to ' + destination_repo.name)
+            for source_path, destination_path, _ in items:
+                tdata.add_item(source_path=source_path, destination_path=destination_path)
+            return tc.submit_transfer(tdata)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(submit_chunk, self.chunks(max_files, max_bytes)))
+
+
+def plan_transfers(lab=None, maxsize=None, minsize=None):
+    """
+    The TransferPlan of the files missing on the main repositories. The source of a file is the
+    first existing file record of its dataset, it has to be on a local repository.
+    """
+    plan = TransferPlan()
     dfs = FileRecord.objects.filter(exists=False, data_repository__globus_is_personal=False)
     if minsize:
         dfs = dfs.filter(dataset__file_size__gt=minsize)
     if maxsize:
         dfs = dfs.exclude(dataset__file_size__gt=maxsize)
-    if not dfs:
-        return
     if lab:
         dfs = dfs.filter(data_repository__lab__name=lab)
-    dfs = dfs.order_by('data_repository__globus_endpoint_id', 'relative_path')
-    pri_repos = DataRepository.objects.filter(globus_is_personal=False)
-    sec_repos = DataRepository.objects.filter(globus_is_personal=True)
-    tm = np.zeros([pri_repos.count(), sec_repos.count()], dtype=object)
-    nfiles = dfs.count()
-    c = 0
-    # create the tasks
-    for ds in dfs:
-        c += 1
-        ipri = [ind for ind, cr in enumerate(pri_repos) if cr == ds.data_repository][0]
-        src_file = ds.dataset.file_records.filter(exists=True).first()
+    dfs = dfs.select_related('dataset').order_by(
+        'data_repository__globus_endpoint_id', 'relative_path')
+    # the existing file records of all the datasets concerned, in one query
+    src_files = {}
+    for src_file in FileRecord.objects.filter(
+            exists=True, dataset__in=dfs.values('dataset')).order_by('pk'):
+        src_files.setdefault(src_file.dataset_id, src_file)
+    nfiles = len(dfs)
+    for c, ds in enumerate(dfs, 1):
+        src_file = src_files.get(ds.dataset_id)
         if not src_file:
             logger.warning(str(ds.data_repository.name) + ':' + ds.relative_path +
                            ' is nowhere to ' + 'be found in local AND remote repositories')
             continue
-        isec = next((ind for ind, cr in enumerate(sec_repos) if cr == src_file.data_repository),
-                    None)
-        if isec is None:
+        if src_file.data_repository.globus_is_personal is not True:
             continue
-        # if the transfer doesn't exist, create it:
-        if tm[ipri][isec] == 0:
-            label = sec_repos[isec].name + ' to ' + pri_repos[ipri].name
-            if not dry_run:
-                tm[ipri][isec] = globus_sdk.TransferData(
-                    gc,
-                    source_endpoint=sec_repos[isec].globus_endpoint_id,
-                    destination_endpoint=pri_repos[ipri].globus_endpoint_id,
-                    verify_checksum=True,
-                    sync_level='checksum',
-                    label=label)
-        # add the transfer to the current task
         destination_file = _filename_from_file_record(ds, add_uuid=True)
         source_file = _filename_from_file_record(src_file)
-        if not dry_run:
-            tm[ipri][isec].add_item(source_path=source_file, destination_path=destination_file)
+        plan.add(src_file.data_repository, ds.data_repository, source_file, destination_file,
+                 ds.dataset.file_size)
         logger.info(str(c) + '/' + str(nfiles) + ' ' + source_file + ' to ' + destination_file)
+    return plan
+
+
+def bulk_transfer(dry_run=False, lab=None):
+    """
+    uploads files from a local Globus repository to a main repository if the file on the main
+    repository does not exist.
+    should be launched after bulk_sync() function
+    """
+    # splits the jobs in one for small files and another for big files so that big raw
+    # ephys files don't hold the transfer of small behaviour/training files
+    _bulk_transfer(dry_run=dry_run, lab=lab, maxsize=1024 ** 3)
+    _bulk_transfer(dry_run=dry_run, lab=lab, minsize=1024 ** 3)
+
+
+def _bulk_transfer(dry_run=False, lab=None, maxsize=None, minsize=None, tc=None):
+    plan = plan_transfers(lab=lab, maxsize=maxsize, minsize=minsize)
     # launch the transfer tasks
-    if dry_run:
-        return
-    for t in tm.flatten():
-        if t == 0:
-            continue
-        gc.submit_transfer(t)
+    if plan and not dry_run:
+        plan.submit(tc or globus_transfer_client())
+    return plan
 
 
 def _get_session(subject=None, date=None, number=None, user=None):
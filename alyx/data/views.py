@@ -17,7 +17,7 @@ from .models import (DataRepositoryType,
                      Dataset,
                      Download,
                      FileRecord,
-                     new_download,
+                     new_downloads,
                      )
 from .serializers import (DataRepositoryTypeSerializer,
                           DataRepositorySerializer,
@@ -28,7 +28,7 @@ from .serializers import (DataRepositoryTypeSerializer,
                           FileRecordSerializer,
                           )
 from .transfers import (_get_session, _get_repositories_for_labs,
-                        _create_dataset_file_records, bulk_sync)
+                        _create_datasets_file_records, bulk_sync)
 
 logger = logging.getLogger(__name__)
 
@@ -167,7 +167,7 @@ def _make_dataset_response(dataset):
             'relative_path': fr.relative_path,
             'exists': fr.exists,
         }
-        for fr in FileRecord.objects.filter(dataset=dataset)]
+        for fr in dataset.file_records.all()]
 
     out = {
         'id': dataset.pk,
@@ -314,7 +314,7 @@ class RegisterFileViewSet(mixins.CreateModelMixin,
             subject=subject, date=date, number=session_number, user=user)
         assert session
 
-        response = []
+        files = []
         for filename, hash, fsize, version in zip(filenames, hashes, filesizes, versions):
             if not filename:
                 continue
@@ -323,12 +323,19 @@ class RegisterFileViewSet(mixins.CreateModelMixin,
             collection = str(Path(filename.replace('\\', '/')).parent)
             collection = None if collection == '.' else collection
             filename = Path(filename).name
-            dataset = _create_dataset_file_records(
-                collection=collection, rel_dir_path=rel_dir_path, filename=filename,
-                session=session, user=user, repositories=repositories, exists_in=exists_in,
-                hash=hash, file_size=fsize, version=version)
-            out = _make_dataset_response(dataset)
-            response.append(out)
+            files.append(dict(filename=filename, collection=collection, hash=hash,
+                              file_size=fsize, version=version))
+        datasets = _create_datasets_file_records(
+            rel_dir_path=rel_dir_path, files=files, session=session, user=user,
+            repositories=repositories, exists_in=exists_in)
+
+        # Fetched again with the related objects of the response, in a few queries
+        fetched = Dataset.objects.filter(
+            pk__in=[dataset.pk for dataset in datasets]
+        ).select_related('session__subject', 'created_by').prefetch_related(
+            'file_records', 'session__users')
+        fetched = {dataset.pk: dataset for dataset in fetched}
+        response = [_make_dataset_response(fetched[dataset.pk]) for dataset in datasets]
 
         return Response(response, status=201)
 
@@ -368,21 +375,27 @@ class DownloadViewSet(mixins.CreateModelMixin, viewsets.GenericViewSet):
         datasets = request.data.get('datasets', None)
         if isinstance(datasets, str):
             datasets = datasets.split(',')
-        datasets = [Dataset.objects.get(pk=ds) for ds in datasets]
+        to_pk = Dataset._meta.pk.to_python
+        datasets = [to_pk(ds) for ds in datasets]
+        found = set(Dataset.objects.filter(pk__in=datasets).values_list('pk', flat=True))
+        missing = [str(ds) for ds in datasets if ds not in found]
+        if missing:
+            raise Dataset.DoesNotExist("Datasets %s do not exist." % ', '.join(missing))
 
         # Multiple projects, or the subject's projects
         projects = request.data.get('projects', ())
         if isinstance(projects, str):
             projects = projects.split(',')
-        projects = [Project.objects.get(name=project) for project in projects if project]
-
-        # loop over datasets
-        dpk = []
-        dcount = []
-        for dataset in datasets:
-            download = new_download(dataset, user, projects=projects)
-            dpk.append(str(download.pk))
-            dcount.append(download.count)
+        projects = set(project for project in projects if project)
+        projects_found = list(Project.objects.filter(name__in=projects))
+        missing = projects - set(p.name for p in projects_found)
+        if missing:
+            raise Project.DoesNotExist("Projects %s do not exist." % ', '.join(sorted(missing)))
+
+        # log all the datasets at once, each requested pk maps to its download row
+        downloads = {d.dataset_id: d for d in new_downloads(datasets, user, projects_found)}
+        dpk = [str(downloads[ds].pk) for ds in datasets]
+        dcount = [downloads[ds].count for ds in datasets]
 
         return Response({'download': dpk, 'count': dcount}, status=201)
 